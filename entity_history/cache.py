@@ -0,0 +1,233 @@
+"""
+A process local cache of the current active entities and of the current sub entities of every super entity. The cache
+is loaded once from the current states of entities and relationships and is then kept up to date by the notifications
+that the notify triggers send whenever a current state changes. Historical queries of times after every change known
+to the cache are answered from memory.
+"""
+import json
+import select
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import Error, connection
+from django.utils.timezone import utc
+
+from entity_history.sql.triggers import get_notify_changes
+
+
+ENTITY_CHANNEL = 'entity_history_entity'
+RELATIONSHIP_CHANNEL = 'entity_history_relationship'
+
+# The format of the times in the notifications, which are rendered in the timezone of the database connection
+NOTIFY_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+CURRENT_ENTITIES_SQL = '''
+    SELECT
+        entity_id,
+        TO_CHAR(time, 'YYYY-MM-DD HH24:MI:SS.US'),
+        was_activated
+    FROM
+        entity_history_entityactivationstate
+'''
+
+CURRENT_SUB_ENTITIES_SQL = '''
+    SELECT
+        super_entity_id,
+        sub_entity_id,
+        TO_CHAR(time, 'YYYY-MM-DD HH24:MI:SS.US'),
+        was_activated
+    FROM
+        entity_history_entityrelationshipactivationstate
+'''
+
+
+def _parse_time(value):
+    time = datetime.strptime(value, NOTIFY_TIME_FORMAT)
+    return time.replace(tzinfo=utc) if settings.USE_TZ else time
+
+
+class CurrentMembershipCache(object):
+    """
+    Holds the current active entities and the current sub entities of every super entity in memory. The cache listens
+    for notifications on its own database connection, and the notifications that arrived are applied before the cache
+    is read. Requires the ENTITY_HISTORY_NOTIFY_CHANGES setting.
+
+    The cache is eventually consistent. A change is only applied once its notification has been received, which
+    happens shortly after the transaction of the change commits.
+    """
+    def __init__(self):
+        self.connection = None
+        self.lock = threading.Lock()
+        self.entity_ids = set()
+        self.sub_entity_ids = defaultdict(set)
+        self.latest_time = None
+
+    @property
+    def is_connected(self):
+        return self.connection is not None
+
+    def _apply(self, channel, change):
+        if channel == ENTITY_CHANNEL:
+            entity_ids = self.entity_ids
+            entity_id = change['entity_id']
+        else:
+            entity_ids = self.sub_entity_ids[change['super_entity_id']]
+            entity_id = change['sub_entity_id']
+
+        if change['was_activated']:
+            entity_ids.add(entity_id)
+        else:
+            entity_ids.discard(entity_id)
+
+        time = _parse_time(change['time'])
+        if self.latest_time is None or time > self.latest_time:
+            self.latest_time = time
+
+    def warm(self):
+        """
+        Opens the connection that listens for notifications and loads the current states. The states are loaded after
+        listening starts so that no change is missed. Changes that are loaded and notified are applied twice, which
+        leaves the same state.
+        """
+        if not get_notify_changes():
+            raise Exception('The current membership cache requires the ENTITY_HISTORY_NOTIFY_CHANGES setting')
+
+        self.close()
+        listener = connection.__class__(connection.settings_dict)
+        with self.lock, listener.cursor() as cursor:
+            cursor.execute('LISTEN {0}'.format(ENTITY_CHANNEL))
+            cursor.execute('LISTEN {0}'.format(RELATIONSHIP_CHANNEL))
+
+            self.entity_ids = set()
+            self.sub_entity_ids = defaultdict(set)
+            self.latest_time = None
+            cursor.execute(CURRENT_ENTITIES_SQL)
+            for entity_id, time, was_activated in cursor.fetchall():
+                self._apply(ENTITY_CHANNEL, {'entity_id': entity_id, 'time': time, 'was_activated': was_activated})
+            cursor.execute(CURRENT_SUB_ENTITIES_SQL)
+            for super_entity_id, sub_entity_id, time, was_activated in cursor.fetchall():
+                self._apply(RELATIONSHIP_CHANNEL, {
+                    'super_entity_id': super_entity_id,
+                    'sub_entity_id': sub_entity_id,
+                    'time': time,
+                    'was_activated': was_activated,
+                })
+
+            self.connection = listener
+
+    def close(self):
+        """
+        Closes the connection that listens for notifications. Queries are no longer answered by a closed cache.
+        """
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Error:
+                pass
+            self.connection = None
+
+    def poll(self, timeout=0):
+        """
+        Applies the changes that were notified since the last poll. The cache is closed if its connection was lost.
+
+        :param timeout: The number of seconds to wait for a notification when none has arrived
+        :returns: True if the cache is still connected
+        """
+        with self.lock:
+            if self.connection is None:
+                return False
+
+            raw_connection = self.connection.connection
+            if raw_connection is None:
+                self.close()
+                return False
+
+            try:
+                if timeout and not raw_connection.notifies:
+                    select.select([raw_connection], [], [], timeout)
+                # Keep reading while the connection is readable so that a closed connection is detected by this poll
+                # instead of the next one
+                with self.connection.wrap_database_errors:
+                    raw_connection.poll()
+                    while select.select([raw_connection], [], [], 0)[0]:
+                        raw_connection.poll()
+            except (Error, select.error, ValueError):
+                self.close()
+                return False
+
+            while raw_connection.notifies:
+                notify = raw_connection.notifies.pop(0)
+                self._apply(notify.channel, json.loads(notify.payload))
+
+            return True
+
+    def can_answer(self, times):
+        """
+        Returns True if the cache is connected and every one of the times is after every change known to the cache.
+        """
+        return bool(times) and self.poll() and (self.latest_time is None or min(times) > self.latest_time)
+
+    def get_entities(self, filter_by_entity_ids=None):
+        """
+        Returns a set of the current active entity ids.
+
+        :param filter_by_entity_ids: An optional set of entity ids over which to filter the entities
+        """
+        with self.lock:
+            if filter_by_entity_ids is None:
+                return set(self.entity_ids)
+            return self.entity_ids.intersection(filter_by_entity_ids)
+
+    def get_sub_entities(self, super_entity_ids, filter_by_entity_ids=None):
+        """
+        Returns a dictionary keyed on the super entity ids with a set of the current sub entity ids of each.
+
+        :param super_entity_ids: An iterable of super entity ids
+        :param filter_by_entity_ids: An optional set of entity ids over which to filter the sub entities
+        """
+        with self.lock:
+            return {
+                se_id: (
+                    set(self.sub_entity_ids.get(se_id, ())) if filter_by_entity_ids is None
+                    else self.sub_entity_ids.get(se_id, set()).intersection(filter_by_entity_ids)
+                )
+                for se_id in super_entity_ids
+            }
+
+
+_current_membership_cache = None
+
+
+def enable_current_membership_cache():
+    """
+    Warms a current membership cache for the process. Historical queries of entities and sub entities that use the
+    default engine are answered by the cache when it is connected and every time is after every change known to it.
+    The cache must be enabled after the process forks since its connection cannot be shared.
+
+    :returns: The CurrentMembershipCache of the process
+    """
+    global _current_membership_cache
+    disable_current_membership_cache()
+    cache = CurrentMembershipCache()
+    cache.warm()
+    _current_membership_cache = cache
+    return cache
+
+
+def disable_current_membership_cache():
+    """
+    Closes the current membership cache of the process. Historical queries are answered by the database again.
+    """
+    global _current_membership_cache
+    if _current_membership_cache is not None:
+        _current_membership_cache.close()
+        _current_membership_cache = None
+
+
+def get_current_membership_cache():
+    """
+    Returns the current membership cache of the process, or None if it is not enabled.
+    """
+    return _current_membership_cache
@@ -0,0 +1,200 @@
+"""
+Cursors that hold the historical state of entities at a time and advance it to later times. Advancing a cursor only
+reads the events that happened shortly before its time or after it, so the cost of polling the current members is
+proportional to the recent changes instead of to the whole history.
+"""
+import json
+from datetime import timedelta
+
+from django.utils.dateparse import parse_datetime
+
+from entity_history.models import (
+    CHECKPOINT_SETTLE_TIME, EntityActivationEvent, EntityRelationshipActivationEvent, _filter_by_ids, _stream_rows,
+    get_entities_at_times, get_sub_entities_at_times
+)
+from entity_history.sql.queue import get_oldest_queued_time
+
+
+class HistoryCursor(object):
+    """
+    Holds the active entities, or the sub entities of a set of super entities, at a time. The state is computed from
+    the whole history the first time the cursor is advanced. Every later advance only replays the events between the
+    previous time and the new time, which are found with the time index of the events.
+
+    Events are timestamped when they are written, so a transaction that commits after the cursor was advanced may
+    commit events that happened before the time of the cursor. The cursor remembers the ids of the events that happened
+    within the settle time before its time and reads that window again on every advance. The window also reaches back
+    to the oldest change that was still waiting in the history queue, since the queued changes are drained into events
+    with their original times. The members that changed in events it has not seen before are resolved again at the
+    new time.
+    """
+    def __init__(self, super_entity_ids=None, settle_time=CHECKPOINT_SETTLE_TIME):
+        """
+        :param super_entity_ids: An iterable of the super entity ids whose sub entities are held by the cursor. The
+           active entities are held when it is None
+        :param settle_time: A timedelta of how long before its time the cursor looks for events of transactions that
+           committed late
+        """
+        self.super_entity_ids = sorted(set(super_entity_ids)) if super_entity_ids is not None else None
+        self.settle_time = settle_time
+        self.time = None
+        # A dictionary keyed on the super entity ids with sets of the sub entity ids of each, or keyed on None with
+        # the set of active entity ids
+        self.state = {}
+        # The start of the window of events that is read again by the next advance
+        self.window_start_time = None
+        # The ids of the events that happened within the window before the time of the cursor
+        self.seen_event_ids = set()
+
+    @property
+    def is_sub_entity_cursor(self):
+        return self.super_entity_ids is not None
+
+    def _resolve(self, time, keys=None):
+        """
+        Returns the state at a time from the whole history. Only the (group_id, member_id) keys are resolved if they
+        are given.
+        """
+        if not self.is_sub_entity_cursor:
+            entity_ids = None if keys is None else [member_id for _, member_id in keys]
+            return {None: get_entities_at_times([time], filter_by_entity_ids=entity_ids)[time]}
+
+        super_entity_ids = self.super_entity_ids if keys is None else set(se_id for se_id, _ in keys)
+        sub_entity_ids = None if keys is None else [member_id for _, member_id in keys]
+        sub_entities = get_sub_entities_at_times(super_entity_ids, [time], filter_by_entity_ids=sub_entity_ids)
+        return {
+            se_id: sub_entities[(se_id, time)]
+            for se_id in super_entity_ids
+        }
+
+    def _get_events(self, start_time, end_time):
+        """
+        Yields the (event_id, group_id, member_id, time, was_activated) events that happened at or after the start time
+        and before the end time in ascending time order.
+        """
+        if not self.is_sub_entity_cursor:
+            events = EntityActivationEvent.objects.filter(time__gte=start_time, time__lt=end_time)
+            for event in _stream_rows(events.order_by('time', 'id').values_list(
+                    'id', 'entity_id', 'time', 'was_activated')):
+                yield (event[0], None) + event[1:]
+        else:
+            events = _filter_by_ids(
+                EntityRelationshipActivationEvent.objects.filter(time__gte=start_time, time__lt=end_time),
+                'super_entity_id', self.super_entity_ids)
+            for event in _stream_rows(events.order_by('time', 'id').values_list(
+                    'id', 'super_entity_id', 'sub_entity_id', 'time', 'was_activated')):
+                yield event
+
+    def _get_window_start_time(self, time):
+        """
+        Returns the start of the window of events that could still be written before a time.
+        """
+        oldest_queued_time = get_oldest_queued_time()
+        if oldest_queued_time is None:
+            return time - self.settle_time
+        return min(time - self.settle_time, oldest_queued_time)
+
+    def _apply(self, group_id, member_id, is_active):
+        member_ids = self.state.setdefault(group_id, set())
+        if is_active:
+            member_ids.add(member_id)
+        else:
+            member_ids.discard(member_id)
+
+    def advance_to(self, time):
+        """
+        Advances the state of the cursor to a time.
+
+        :param time: A datetime that is not before the time of the cursor
+        :raises ValueError: If the time is before the time of the cursor
+        """
+        if self.time is not None and time < self.time:
+            raise ValueError('A history cursor cannot be moved back in time')
+
+        # The queue is read before the events so that changes which are drained in the meantime are in the window
+        window_start_time = self._get_window_start_time(time)
+
+        if self.time is None:
+            # The recent events are read before the state so that events written in the meantime are seen as new
+            # events by the next advance
+            self.seen_event_ids = set(event[0] for event in self._get_events(window_start_time, time))
+            self.state = self._resolve(time)
+            self.time = time
+            self.window_start_time = window_start_time
+            return
+
+        seen_event_ids = set()
+        late_keys = set()
+        for event_id, group_id, member_id, event_time, was_activated in self._get_events(
+                self.window_start_time, time):
+            if event_time >= window_start_time:
+                seen_event_ids.add(event_id)
+
+            if event_id in self.seen_event_ids:
+                continue
+            elif event_time < self.time:
+                late_keys.add((group_id, member_id))
+            else:
+                self._apply(group_id, member_id, was_activated)
+
+        if late_keys:
+            resolved = self._resolve(time, late_keys)
+            for group_id, member_id in late_keys:
+                self._apply(group_id, member_id, member_id in resolved[group_id])
+
+        self.time = time
+        self.window_start_time = window_start_time
+        self.seen_event_ids = seen_event_ids
+
+    def get_entities(self):
+        """
+        Returns a set of the entity ids that were active at the time of the cursor.
+        """
+        if self.is_sub_entity_cursor:
+            raise ValueError('The history cursor holds sub entities')
+        return set(self.state.get(None, ()))
+
+    def get_sub_entities(self):
+        """
+        Returns a dictionary keyed on the super entity ids with a set of the sub entity ids of each at the time of the
+        cursor.
+        """
+        if not self.is_sub_entity_cursor:
+            raise ValueError('The history cursor holds entities')
+        return {
+            se_id: set(self.state.get(se_id, ()))
+            for se_id in self.super_entity_ids
+        }
+
+    def serialize(self):
+        """
+        Returns a json string of the cursor that can be stored and loaded with deserialize to resume the cursor.
+        """
+        return json.dumps({
+            'super_entity_ids': self.super_entity_ids,
+            'settle_time': self.settle_time.total_seconds(),
+            'time': self.time.isoformat() if self.time is not None else None,
+            'window_start_time': self.window_start_time.isoformat() if self.window_start_time is not None else None,
+            'state': [
+                [group_id, sorted(member_ids)]
+                for group_id, member_ids in self.state.items()
+            ],
+            'seen_event_ids': sorted(self.seen_event_ids),
+        })
+
+    @classmethod
+    def deserialize(cls, value):
+        """
+        Loads a cursor from a json string that was returned by serialize.
+        """
+        value = json.loads(value)
+        cursor = cls(value['super_entity_ids'], settle_time=timedelta(seconds=value['settle_time']))
+        cursor.time = parse_datetime(value['time']) if value['time'] is not None else None
+        cursor.window_start_time = (
+            parse_datetime(value['window_start_time']) if value['window_start_time'] is not None else None)
+        cursor.state = {
+            group_id: set(member_ids)
+            for group_id, member_ids in value['state']
+        }
+        cursor.seen_event_ids = set(value['seen_event_ids'])
+        return cursor
@@ -0,0 +1,24 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from entity_history.models import create_history_checkpoints
+
+
+class Command(BaseCommand):
+    """
+    Creates history checkpoints at a regular interval after the latest checkpoint. This command is intended to be
+    run periodically so that historical queries only replay the events after the latest checkpoint.
+    """
+    help = 'Creates history checkpoints at a regular interval'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days', dest='days', type='int', default=7,
+            help='The number of days between checkpoints'),
+    )
+
+    def handle(self, *args, **options):
+        checkpoints = create_history_checkpoints(timedelta(days=options['days']))
+        self.stdout.write('Created {0} history checkpoints'.format(len(checkpoints)))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from entity_history.models import create_history_rollup
+
+
+class Command(BaseCommand):
+    """
+    Rolls up the days on which entities and relationships were active since the latest rollup. This command is intended
+    to be run daily so that the history of days can be looked up with get_entities_on_dates and
+    get_sub_entities_on_dates.
+    """
+    help = 'Rolls up the days on which entities and relationships were active'
+
+    def handle(self, *args, **options):
+        rollup = create_history_rollup()
+        self.stdout.write('Rolled up history through {0}'.format(rollup.day))
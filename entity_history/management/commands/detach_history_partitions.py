@@ -0,0 +1,27 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from entity_history.sql.partitions import detach_event_partitions
+
+
+class Command(BaseCommand):
+    """
+    Detaches the partitions of the event tables that only contain events older than a number of days.
+    """
+    help = 'Detaches old partitions of the event tables'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days', dest='days', type='int', default=365,
+            help='The age in days of the events to detach'),
+        make_option(
+            '--drop', dest='drop', action='store_true', default=False,
+            help='Drops the partitions after detaching them'),
+    )
+
+    def handle(self, *args, **options):
+        partitions = detach_event_partitions(timezone.now() - timedelta(days=options['days']), drop=options['drop'])
+        self.stdout.write('Detached {0} event partitions'.format(len(partitions)))
@@ -0,0 +1,35 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from entity_history.sql.queue import QUEUE_BATCH_SIZE, drain_history_queue
+
+
+class Command(BaseCommand):
+    """
+    Records the history of the changes that were queued by the queue triggers. This command is intended to be run
+    continuously with the --loop option, or periodically, when the ENTITY_HISTORY_TRIGGER_MODE setting is queue.
+    """
+    help = 'Records the history of the queued changes of entities and relationships'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--batch-size', dest='batch_size', type='int', default=QUEUE_BATCH_SIZE,
+            help='The number of queued changes that are drained in a single transaction'),
+        make_option(
+            '--loop', dest='loop', action='store_true', default=False,
+            help='Keep draining the queue until the command is stopped'),
+        make_option(
+            '--interval', dest='interval', type='float', default=1.0,
+            help='The number of seconds to wait between drains when looping'),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            num_drained = drain_history_queue(batch_size=options['batch_size'])
+            if num_drained or not options['loop']:
+                self.stdout.write('Drained {0} queued history changes'.format(num_drained))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
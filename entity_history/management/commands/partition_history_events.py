@@ -0,0 +1,30 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from entity_history.sql.partitions import partition_event_tables, unpartition_event_tables
+
+
+class Command(BaseCommand):
+    """
+    Converts the event tables into tables that are partitioned on the time of the events and creates their future
+    partitions. This command is intended to be run periodically so that partitions always exist for new events.
+    """
+    help = 'Partitions the event tables and creates their future partitions'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--ahead', dest='ahead', type='int', default=3,
+            help='The number of partitions to create past the current time'),
+        make_option(
+            '--unpartition', dest='unpartition', action='store_true', default=False,
+            help='Converts the event tables back into regular tables'),
+    )
+
+    def handle(self, *args, **options):
+        if options['unpartition']:
+            unpartition_event_tables()
+            self.stdout.write('Unpartitioned the event tables')
+        else:
+            partitions = partition_event_tables(ahead=options['ahead'])
+            self.stdout.write('Created {0} event partitions'.format(len(partitions)))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from entity_history.sql.triggers import get_trigger_mode, refresh_triggers
+
+
+class Command(BaseCommand):
+    """
+    Enables the history triggers of the trigger mode in the ENTITY_HISTORY_TRIGGER_MODE setting. This command must be
+    run after the setting is changed.
+    """
+    help = 'Enables the history triggers of the configured trigger mode'
+
+    def handle(self, *args, **options):
+        refresh_triggers()
+        self.stdout.write('Enabled {0} history triggers'.format(get_trigger_mode()))
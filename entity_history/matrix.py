@@ -0,0 +1,150 @@
+"""
+Vectorized evaluation of entity history with numpy. The events are loaded into columnar arrays that are grouped by
+entity, and the state of every entity at every requested time is found at once with a binary search over the events.
+The results are dense boolean matrices of entities by times instead of sets of entity ids. Numpy is an optional
+dependency that is installed with the numpy extra of django-entity-history.
+"""
+from django.utils.timezone import is_aware, utc
+
+from entity_history.models import (
+    EntityActivationEvent, EntityRelationshipActivationEvent, _check_events_attached, _filter_by_ids, _get_filter_ids,
+    _stream_rows
+)
+from entity_history.results import EntityMatrix
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def _check_numpy():
+    if np is None:  # pragma: no cover
+        raise ImportError('numpy is required for entity matrices. Install it with django-entity-history[numpy]')
+
+
+def _to_microseconds(times):
+    """
+    Converts datetimes into an int64 array of microseconds. Aware datetimes are compared in utc.
+    """
+    return np.array([
+        t.astimezone(utc).replace(tzinfo=None) if is_aware(t) else t
+        for t in times
+    ], dtype='datetime64[us]').astype(np.int64)
+
+
+def _get_active_matrix(row_indices, event_times, event_states, times):
+    """
+    Computes the state of every row at every time from the events of the rows.
+
+    :param row_indices: An array of the row of every event. The events are sorted on their rows and then on their times
+    :param event_times: An int64 array of the times of the events
+    :param event_states: A boolean array of the activation states set by the events
+    :param times: An int64 array of the sorted requested times
+    :returns: A boolean array with a row for every row of the events and a column for every time
+    """
+    num_rows = row_indices[-1] + 1 if len(row_indices) else 0
+    stride = len(times) + 1
+
+    # Every event is keyed on its row and the first requested time that it happened strictly before. The last event
+    # of a row whose key is at most the key of a (row, time) cell sets the state of the cell
+    event_keys = row_indices * stride + np.searchsorted(times, event_times, side='right')
+    cell_keys = np.arange(num_rows)[:, None] * stride + np.arange(len(times))[None, :]
+    positions = np.searchsorted(event_keys, cell_keys, side='right') - 1
+
+    found = positions >= 0
+    positions[~found] = 0
+    found &= row_indices[positions] == np.arange(num_rows)[:, None]
+    return found & event_states[positions]
+
+
+def _get_row_indices(*columns):
+    """
+    Returns the row index of every event along with the index of the first event of every row. A new row starts
+    whenever the value of any of the columns changes.
+    """
+    starts = np.zeros(len(columns[0]), dtype=bool)
+    starts[:1] = True
+    for column in columns:
+        starts[1:] |= column[1:] != column[:-1]
+    return np.cumsum(starts) - 1, np.flatnonzero(starts)
+
+
+def _load_events(events, num_group_columns):
+    """
+    Loads a stream of (group_columns..., time, was_activated) events into numpy arrays.
+    """
+    rows = list(_stream_rows(events))
+    columns = list(zip(*rows)) or [()] * (num_group_columns + 2)
+
+    groups = [np.array(column, dtype=np.int64) for column in columns[:num_group_columns]]
+    return groups, _to_microseconds(columns[-2]), np.array(columns[-1], dtype=bool)
+
+
+def get_sub_entity_matrix_at_times(super_entity_ids, times, filter_by_entity_ids=None):
+    """
+    Constructs a matrix of the sub entities of super entities at points in time.
+
+    :param super_entity_ids: An iterable of super entity ids
+    :param times: An iterable of datetime objects
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :returns: An EntityMatrix with a row for every relationship of the super entities that has any events and a column
+       for every one of the sorted unique times
+    :raises ValueError: If event partitions have been detached
+    """
+    _check_numpy()
+    _check_events_attached()
+    times = sorted(set(times))
+    super_entity_ids = list(super_entity_ids)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+
+    if not times or not super_entity_ids:
+        empty = np.zeros(0, dtype=np.int64)
+        return EntityMatrix(times, empty, np.zeros((0, len(times)), dtype=bool), super_entity_ids=empty)
+
+    events = _filter_by_ids(
+        EntityRelationshipActivationEvent.objects.filter(time__lt=times[-1]), 'super_entity_id', super_entity_ids
+    ).order_by('super_entity_id', 'sub_entity_id', 'time', 'id').values_list(
+        'super_entity_id', 'sub_entity_id', 'time', 'was_activated')
+    if filter_by_entity_ids is not None:
+        events = _filter_by_ids(events, 'sub_entity_id', filter_by_entity_ids)
+
+    (se_ids, sub_entity_ids), event_times, event_states = _load_events(events, 2)
+    row_indices, row_starts = _get_row_indices(se_ids, sub_entity_ids)
+
+    return EntityMatrix(
+        times, sub_entity_ids[row_starts],
+        _get_active_matrix(row_indices, event_times, event_states, _to_microseconds(times)),
+        super_entity_ids=se_ids[row_starts])
+
+
+def get_entity_matrix_at_times(times, filter_by_entity_ids=None):
+    """
+    Constructs a matrix of the entities that were active at points in time.
+
+    :param times: An iterable of datetime objects
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :returns: An EntityMatrix with a row for every entity that has any events and a column for every one of the sorted
+       unique times
+    :raises ValueError: If event partitions have been detached
+    """
+    _check_numpy()
+    _check_events_attached()
+    times = sorted(set(times))
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+
+    if not times:
+        return EntityMatrix(times, np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=bool))
+
+    events = EntityActivationEvent.objects.filter(
+        time__lt=times[-1]
+    ).order_by('entity_id', 'time', 'id').values_list('entity_id', 'time', 'was_activated')
+    if filter_by_entity_ids is not None:
+        events = _filter_by_ids(events, 'entity_id', filter_by_entity_ids)
+
+    (entity_ids,), event_times, event_states = _load_events(events, 1)
+    row_indices, row_starts = _get_row_indices(entity_ids)
+
+    return EntityMatrix(
+        times, entity_ids[row_starts],
+        _get_active_matrix(row_indices, event_times, event_states, _to_microseconds(times)))
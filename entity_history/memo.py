@@ -0,0 +1,151 @@
+"""
+Memoization of the results of historical queries. Results are stored in the django cache of the ENTITY_HISTORY_CACHE
+setting and in a least recently used cache of the process in front of it. Every result is stored with a watermark,
+which is the largest id of the events when the result was computed. A result remains valid as long as no event after
+the watermark happened before the latest time of the query, which is checked by reading only the events after the
+watermark.
+"""
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max, Min
+
+
+MEMO_KEY_PREFIX = 'entity_history'
+
+# The key of the generation of the memoized results, which is incremented to invalidate every memoized result
+GENERATION_KEY = '{0}:generation'.format(MEMO_KEY_PREFIX)
+
+# The default number of entity ids that are held by the memoized results in the cache of a process
+LOCAL_CACHE_SIZE = 1000000
+
+
+def _get_size(value):
+    """
+    Returns the number of entity ids and keys held by a result, which is the size of the result in the local cache.
+    """
+    if isinstance(value, (set, frozenset)):
+        return len(value)
+    elif isinstance(value, (list, tuple)):
+        return sum(_get_size(v) for v in value)
+    elif isinstance(value, dict):
+        return len(value) + sum(_get_size(v) for v in value.values())
+    elif hasattr(value, '__dict__'):
+        return sum(_get_size(v) for v in vars(value).values())
+    return 1
+
+
+class LocalMemoCache(object):
+    """
+    A least recently used cache of memoized results in the memory of the process. The least recently used results are
+    evicted once the results hold more than the maximum number of entity ids.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            # Move the entry to the end of the order of use
+            entry, size = self.entries.pop(key)
+            self.entries[key] = (entry, size)
+            return entry
+
+    def set(self, key, entry):
+        size = _get_size(entry)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_size:
+                return
+
+            self.entries[key] = (entry, size)
+            self.size += size
+            while self.size > self.max_size:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_local_cache = None
+
+
+def _get_local_cache():
+    global _local_cache
+    max_size = getattr(settings, 'ENTITY_HISTORY_CACHE_LOCAL_SIZE', LOCAL_CACHE_SIZE)
+    if _local_cache is None or _local_cache.max_size != max_size:
+        _local_cache = LocalMemoCache(max_size)
+    return _local_cache
+
+
+def is_memoization_enabled():
+    """
+    Returns True if the results of historical queries are memoized, which is configured by the ENTITY_HISTORY_CACHE
+    setting with the alias of a django cache. Results are not memoized by default.
+    """
+    return getattr(settings, 'ENTITY_HISTORY_CACHE', None) is not None
+
+
+def _store(cache, cache_key, entry):
+    _get_local_cache().set(cache_key, entry)
+    cache.set(cache_key, entry)
+
+
+def memoize(key, model, max_time, compute):
+    """
+    Returns the memoized result of a historical query, or computes and memoizes the result if there is no valid
+    memoized result. The returned result is a copy, so it can be modified by the caller.
+
+    :param key: A tuple of the normalized arguments of the query
+    :param model: The event model whose events the result depends on
+    :param max_time: The latest time of the query. The result only depends on the events that happened before it
+    :param compute: A function that computes the result
+    """
+    cache = caches[settings.ENTITY_HISTORY_CACHE]
+    cache_key = '{0}:{1}'.format(MEMO_KEY_PREFIX, md5(repr(key).encode('utf-8')).hexdigest())
+
+    values = cache.get_many([GENERATION_KEY, cache_key])
+    generation = values.get(GENERATION_KEY, 0)
+    local_entry = _get_local_cache().get(cache_key)
+    entry = local_entry or values.get(cache_key)
+
+    if entry is not None and entry[0] == generation:
+        _, watermark, result = entry
+        new_events = model.objects.filter(id__gt=watermark).aggregate(Max('id'), Min('time'))
+        if new_events['time__min'] is None or new_events['time__min'] >= max_time:
+            if new_events['id__max'] is not None:
+                # Move the watermark past the new events so that they are not read again
+                _store(cache, cache_key, (generation, new_events['id__max'], result))
+            elif local_entry is None:
+                _get_local_cache().set(cache_key, entry)
+            return deepcopy(result)
+
+    # The watermark is read before the result is computed so that events written in the meantime are checked later
+    watermark = model.objects.aggregate(Max('id'))['id__max'] or 0
+    result = compute()
+    _store(cache, cache_key, (generation, watermark, result))
+    return deepcopy(result)
+
+
+def clear_history_cache():
+    """
+    Invalidates every memoized result. New events are detected by the watermarks, but this must be called after events
+    are deleted, for example when entities are deleted or event partitions are detached.
+    """
+    _get_local_cache().clear()
+    if is_memoization_enabled():
+        cache = caches[settings.ENTITY_HISTORY_CACHE]
+        if not cache.add(GENERATION_KEY, 1, None):
+            cache.incr(GENERATION_KEY)
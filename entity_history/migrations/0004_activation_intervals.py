@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from entity_history.sql.intervals import (
+    rebuild_entity_activation_intervals, rebuild_entity_relationship_intervals
+)
+from entity_history.sql.triggers import EntityActivationTrigger, EntityRelationshipActivationTrigger
+
+
+def refresh_triggers(*args, **kwargs):
+    EntityActivationTrigger().disable()
+    EntityActivationTrigger().enable()
+    EntityRelationshipActivationTrigger().disable()
+    EntityRelationshipActivationTrigger().enable()
+
+
+def backfill_intervals(*args, **kwargs):
+    rebuild_entity_activation_intervals()
+    rebuild_entity_relationship_intervals()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity', '0001_initial'),
+        ('entity_history', '0003_update_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityActivationInterval',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('start_time', models.DateTimeField(help_text='The time of the activation')),
+                ('end_time', models.DateTimeField(help_text='The time of the deactivation, null if still active', null=True)),
+                ('entity', models.ForeignKey(help_text='The entity that was active', to='entity.Entity', related_name='+')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityRelationshipInterval',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('start_time', models.DateTimeField(help_text='The time of the activation')),
+                ('end_time', models.DateTimeField(help_text='The time of the deactivation, null if still active', null=True)),
+                ('sub_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The sub entity in the relationship that was active')),
+                ('super_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The super entity in the relationship that was active')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX entity_history_entityactivationinterval_period '
+                'ON entity_history_entityactivationinterval '
+                'USING GIST (TSTZRANGE(start_time, end_time, \'(]\'))'
+            ),
+            reverse_sql='DROP INDEX entity_history_entityactivationinterval_period'
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX entity_history_entityrelationshipinterval_period '
+                'ON entity_history_entityrelationshipinterval '
+                'USING GIST (TSTZRANGE(start_time, end_time, \'(]\'))'
+            ),
+            reverse_sql='DROP INDEX entity_history_entityrelationshipinterval_period'
+        ),
+        migrations.RunPython(
+            code=refresh_triggers,
+            reverse_code=refresh_triggers
+        ),
+        migrations.RunPython(
+            code=backfill_intervals,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
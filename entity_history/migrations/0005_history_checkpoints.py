@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity', '0001_initial'),
+        ('entity_history', '0004_activation_intervals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryCheckpoint',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('time', models.DateTimeField(help_text='The time of the checkpoint', unique=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityActivationCheckpoint',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('checkpoint', models.ForeignKey(help_text='The checkpoint at which the entity was active', to='entity_history.HistoryCheckpoint')),
+                ('entity', models.ForeignKey(help_text='The entity that was active', to='entity.Entity', related_name='+')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityRelationshipActivationCheckpoint',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('checkpoint', models.ForeignKey(help_text='The checkpoint at which the relationship was active', to='entity_history.HistoryCheckpoint')),
+                ('sub_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The sub entity in the relationship that was active')),
+                ('super_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The super entity in the relationship that was active')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from entity_history.sql.states import (
+    rebuild_entity_activation_states, rebuild_entity_relationship_activation_states
+)
+from entity_history.sql.triggers import EntityActivationTrigger, EntityRelationshipActivationTrigger
+
+
+def refresh_triggers(*args, **kwargs):
+    EntityActivationTrigger().disable()
+    EntityActivationTrigger().enable()
+    EntityRelationshipActivationTrigger().disable()
+    EntityRelationshipActivationTrigger().enable()
+
+
+def backfill_states(*args, **kwargs):
+    rebuild_entity_activation_states()
+    rebuild_entity_relationship_activation_states()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity', '0001_initial'),
+        ('entity_history', '0005_history_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityActivationState',
+            fields=[
+                ('entity', models.OneToOneField(related_name='+', primary_key=True, serialize=False, to='entity.Entity', help_text='The entity that was activated / deactivated')),
+                ('time', models.DateTimeField(help_text='The time of the latest activation / deactivation')),
+                ('was_activated', models.BooleanField(help_text='True if the entity was activated, false otherwise', default=None)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityRelationshipActivationState',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('time', models.DateTimeField(help_text='The time of the latest activation / deactivation')),
+                ('was_activated', models.BooleanField(help_text='True if the entity was activated, false otherwise', default=None)),
+                ('sub_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The sub entity in the relationship that was activated / deactivated')),
+                ('super_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The super entity in the relationship that was activated / deactivated')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='entityrelationshipactivationstate',
+            unique_together=set([('super_entity', 'sub_entity')]),
+        ),
+        migrations.RunPython(
+            code=backfill_states,
+            reverse_code=migrations.RunPython.noop
+        ),
+        migrations.RunPython(
+            code=refresh_triggers,
+            reverse_code=refresh_triggers
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from entity_history.sql.triggers import TRIGGER_MODES, refresh_triggers
+
+
+def enable_configured_triggers(*args, **kwargs):
+    refresh_triggers()
+
+
+def enable_row_triggers(*args, **kwargs):
+    for trigger in TRIGGER_MODES['statement']:
+        trigger().disable()
+    for trigger in TRIGGER_MODES['row']:
+        trigger().disable()
+        trigger().enable()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity_history', '0006_activation_states'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            code=enable_configured_triggers,
+            reverse_code=enable_row_triggers
+        ),
+    ]
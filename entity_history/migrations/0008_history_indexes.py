@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity', '0001_initial'),
+        ('entity_history', '0007_statement_triggers'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='entityactivationevent',
+            index_together=set([('entity', 'time', 'id', 'was_activated')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='entityrelationshipactivationevent',
+            index_together=set([
+                ('super_entity', 'sub_entity', 'time', 'id', 'was_activated'),
+                ('sub_entity', 'super_entity', 'time', 'id', 'was_activated'),
+            ]),
+        ),
+        migrations.AlterField(
+            model_name='entityactivationevent',
+            name='entity',
+            field=models.ForeignKey(db_index=False, help_text='The entity that was activated / deactivated', to='entity.Entity'),
+        ),
+        migrations.AlterField(
+            model_name='entityrelationshipactivationevent',
+            name='sub_entity',
+            field=models.ForeignKey(db_index=False, to='entity.Entity', related_name='+', help_text='The sub entity in the relationship that was activated / deactivated'),
+        ),
+        migrations.AlterField(
+            model_name='entityrelationshipactivationevent',
+            name='super_entity',
+            field=models.ForeignKey(db_index=False, to='entity.Entity', related_name='+', help_text='The super entity in the relationship that was activated / deactivated'),
+        ),
+    ]
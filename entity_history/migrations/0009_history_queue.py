@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity_history', '0008_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityActivationQueueItem',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('entity_id', models.IntegerField(help_text='The id of the entity that was created or updated')),
+                ('time', models.DateTimeField(help_text='The time of the change')),
+                ('is_active', models.BooleanField(default=None, help_text='True if the entity was active after the change')),
+                ('was_created', models.BooleanField(default=None, help_text='True if the entity was created, false otherwise')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityRelationshipActivationQueueItem',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('sub_entity_id', models.IntegerField(help_text='The id of the sub entity in the relationship')),
+                ('super_entity_id', models.IntegerField(help_text='The id of the super entity in the relationship')),
+                ('time', models.DateTimeField(help_text='The time of the change')),
+                ('was_activated', models.BooleanField(default=None, help_text='True if the relationship was created, false if it was deleted')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity', '0001_initial'),
+        ('entity_history', '0009_history_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryRollup',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('day', models.DateField(help_text='The last day that was rolled up')),
+                ('entity_event_id', models.IntegerField(help_text='The largest id of the entity activation events that was rolled up')),
+                ('relationship_event_id', models.IntegerField(help_text='The largest id of the entity relationship activation events that was rolled up')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityActivationDay',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('day', models.DateField(help_text='The day on which the entity was active')),
+                ('entity', models.ForeignKey(help_text='The entity that was active', to='entity.Entity', related_name='+')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EntityRelationshipActivationDay',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('day', models.DateField(help_text='The day on which the relationship was active')),
+                ('sub_entity', models.ForeignKey(to='entity.Entity', related_name='+', help_text='The sub entity in the relationship that was active')),
+                ('super_entity', models.ForeignKey(db_index=False, to='entity.Entity', related_name='+', help_text='The super entity in the relationship that was active')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='entityactivationday',
+            unique_together=set([('day', 'entity')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='entityrelationshipactivationday',
+            unique_together=set([('super_entity', 'day', 'sub_entity')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entity_history', '0010_history_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetachedEventPartition',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('name', models.CharField(help_text='The name of the partition that was detached', max_length=128)),
+                ('end_time', models.DateTimeField(help_text='The time before which the partition held events')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
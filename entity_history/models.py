@@ -1,17 +1,48 @@
-from django.db import models
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from contextlib import closing
+from datetime import timedelta
+from functools import partial
+from itertools import groupby
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Max, Min
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import timezone
+from django.utils.timezone import utc
 from entity.models import Entity, EntityQuerySet, AllEntityManager
 
+from entity_history.cache import get_current_membership_cache
+from entity_history.memo import is_memoization_enabled, memoize
+from entity_history.results import EntityDeltas, SparseEntityResults
+from entity_history.sql import get_sql
+from entity_history.sql.queries import (
+    ACTIVE_AS_OF_SQL, ACTIVE_DURATION_SQL, ENTITIES_AT_TIMES_SQL, ENTITIES_IN_INTERVALS_AT_TIMES_SQL,
+    ENTITY_COUNTS_AT_TIMES_SQL, ENTITY_COUNTS_IN_INTERVALS_AT_TIMES_SQL, FIRST_ACTIVATION_TIME_SQL,
+    LAST_DEACTIVATION_TIME_SQL, RELATED_ENTITIES_AT_TIMES_SQL, RELATED_ENTITIES_IN_INTERVALS_AT_TIMES_SQL,
+    SUB_ENTITIES_AT_PAIRS_SQL, SUB_ENTITIES_AT_TIMES_SQL,
+    SUB_ENTITIES_IN_INTERVALS_AT_PAIRS_SQL, SUB_ENTITIES_IN_INTERVALS_AT_TIMES_SQL, SUB_ENTITY_AS_OF_SQL,
+    SUB_ENTITY_COUNTS_AT_TIMES_SQL, SUB_ENTITY_COUNTS_IN_INTERVALS_AT_TIMES_SQL, SUPER_ENTITIES_AT_TIMES_SQL,
+    SUPER_ENTITIES_IN_INTERVALS_AT_TIMES_SQL, WAS_ACTIVE_AT_SQL, get_entity_filter_sql
+)
+from entity_history.sql.queue import get_oldest_queued_time
+from entity_history.sweep import sweep_states
+
 
 class EntityActivationEvent(models.Model):
     """
     Models an event of an entity being activated or deactivated.
     """
-    entity = models.ForeignKey(Entity, help_text='The entity that was activated / deactivated')
+    entity = models.ForeignKey(Entity, db_index=False, help_text='The entity that was activated / deactivated')
     time = models.DateTimeField(db_index=True, help_text='The time of the activation / deactivation')
     was_activated = models.BooleanField(default=None, help_text='True if the entity was activated, false otherwise')
 
     class Meta:
         app_label = 'entity_history'
+        # Covers looking up the latest events of entities before a time with index only scans
+        index_together = (('entity', 'time', 'id', 'was_activated'),)
 
 
 class EntityRelationshipActivationEvent(models.Model):
@@ -19,98 +50,1442 @@ class EntityRelationshipActivationEvent(models.Model):
     Models an event of an entity relationship being activated or deactivated. Technically, entity relationships
     are either created or deleted, however, we use the terms activated and deactivated for consistency.
     """
+    sub_entity = models.ForeignKey(
+        Entity, related_name='+', db_index=False,
+        help_text='The sub entity in the relationship that was activated / deactivated')
+    super_entity = models.ForeignKey(
+        Entity, related_name='+', db_index=False,
+        help_text='The super entity in the relationship that was activated / deactivated')
+    time = models.DateTimeField(db_index=True, help_text='The time of the activation / deactivation')
+    was_activated = models.BooleanField(default=None, help_text='True if the entity was activated, false otherwise')
+
+    class Meta:
+        app_label = 'entity_history'
+        # Covers looking up the latest events of the relationships of super entities and of sub entities before a
+        # time with index only scans
+        index_together = (
+            ('super_entity', 'sub_entity', 'time', 'id', 'was_activated'),
+            ('sub_entity', 'super_entity', 'time', 'id', 'was_activated'),
+        )
+
+
+class EntityActivationInterval(models.Model):
+    """
+    Models a period of time during which an entity was active. The period starts when the entity was activated and
+    ends when the entity was deactivated. Intervals are maintained by the same postgres triggers that create the
+    entity activation events.
+    """
+    entity = models.ForeignKey(Entity, related_name='+', help_text='The entity that was active')
+    start_time = models.DateTimeField(help_text='The time of the activation')
+    end_time = models.DateTimeField(null=True, help_text='The time of the deactivation, null if still active')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityRelationshipInterval(models.Model):
+    """
+    Models a period of time during which an entity relationship was active. The period starts when the relationship
+    was created and ends when the relationship was deleted.
+    """
+    sub_entity = models.ForeignKey(
+        Entity, related_name='+', help_text='The sub entity in the relationship that was active')
+    super_entity = models.ForeignKey(
+        Entity, related_name='+', help_text='The super entity in the relationship that was active')
+    start_time = models.DateTimeField(help_text='The time of the activation')
+    end_time = models.DateTimeField(null=True, help_text='The time of the deactivation, null if still active')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityActivationState(models.Model):
+    """
+    Models the current activation state of an entity, which is the state of its latest entity activation event. The
+    triggers look up and update the current state instead of searching for the latest event of the entity.
+    """
+    entity = models.OneToOneField(
+        Entity, primary_key=True, related_name='+', help_text='The entity that was activated / deactivated')
+    time = models.DateTimeField(help_text='The time of the latest activation / deactivation')
+    was_activated = models.BooleanField(default=None, help_text='True if the entity was activated, false otherwise')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityRelationshipActivationState(models.Model):
+    """
+    Models the current activation state of an entity relationship, which is the state of its latest entity
+    relationship activation event.
+    """
     sub_entity = models.ForeignKey(
         Entity, related_name='+', help_text='The sub entity in the relationship that was activated / deactivated')
     super_entity = models.ForeignKey(
         Entity, related_name='+', help_text='The super entity in the relationship that was activated / deactivated')
-    time = models.DateTimeField(db_index=True, help_text='The time of the activation / deactivation')
+    time = models.DateTimeField(help_text='The time of the latest activation / deactivation')
     was_activated = models.BooleanField(default=None, help_text='True if the entity was activated, false otherwise')
 
+    class Meta:
+        app_label = 'entity_history'
+        unique_together = ('super_entity', 'sub_entity')
+
+
+class HistoryCheckpoint(models.Model):
+    """
+    Models a point in time at which the active entities and the sub entities of every super entity were recorded.
+    Events are only replayed from the latest checkpoint before a requested time.
+    """
+    time = models.DateTimeField(unique=True, help_text='The time of the checkpoint')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityActivationCheckpoint(models.Model):
+    """
+    Models an entity that was active at the time of a checkpoint.
+    """
+    checkpoint = models.ForeignKey(HistoryCheckpoint, help_text='The checkpoint at which the entity was active')
+    entity = models.ForeignKey(Entity, related_name='+', help_text='The entity that was active')
+
     class Meta:
         app_label = 'entity_history'
 
 
-def get_sub_entities_at_times(super_entity_ids, times, filter_by_entity_ids=None):
+class EntityRelationshipActivationCheckpoint(models.Model):
+    """
+    Models an entity relationship that was active at the time of a checkpoint.
+    """
+    checkpoint = models.ForeignKey(HistoryCheckpoint, help_text='The checkpoint at which the relationship was active')
+    sub_entity = models.ForeignKey(
+        Entity, related_name='+', help_text='The sub entity in the relationship that was active')
+    super_entity = models.ForeignKey(
+        Entity, related_name='+', help_text='The super entity in the relationship that was active')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityActivationQueueItem(models.Model):
+    """
+    Models a change of an entity that was queued by the queue triggers. The history of the change is recorded when the
+    queue is drained. The entity is not a foreign key so that queuing a change does not check the entity and so that
+    entities with queued changes can still be deleted.
+    """
+    entity_id = models.IntegerField(help_text='The id of the entity that was created or updated')
+    time = models.DateTimeField(help_text='The time of the change')
+    is_active = models.BooleanField(default=None, help_text='True if the entity was active after the change')
+    was_created = models.BooleanField(default=None, help_text='True if the entity was created, false otherwise')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityRelationshipActivationQueueItem(models.Model):
+    """
+    Models a change of an entity relationship that was queued by the queue triggers.
+    """
+    sub_entity_id = models.IntegerField(help_text='The id of the sub entity in the relationship')
+    super_entity_id = models.IntegerField(help_text='The id of the super entity in the relationship')
+    time = models.DateTimeField(help_text='The time of the change')
+    was_activated = models.BooleanField(
+        default=None, help_text='True if the relationship was created, false if it was deleted')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class HistoryRollup(models.Model):
+    """
+    Models a run of the daily rollup. Every day up to the day of the latest rollup is rolled up, and the events that
+    are written after its event ids are checked by the next rollup for changes of days that were already rolled up.
+    """
+    day = models.DateField(help_text='The last day that was rolled up')
+    entity_event_id = models.IntegerField(help_text='The largest id of the entity activation events that was rolled up')
+    relationship_event_id = models.IntegerField(
+        help_text='The largest id of the entity relationship activation events that was rolled up')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+class EntityActivationDay(models.Model):
+    """
+    Models a day on which an entity was active at any time. The days are rolled up from the entity activation
+    intervals.
+    """
+    entity = models.ForeignKey(Entity, related_name='+', help_text='The entity that was active')
+    day = models.DateField(help_text='The day on which the entity was active')
+
+    class Meta:
+        app_label = 'entity_history'
+        unique_together = ('day', 'entity')
+
+
+class EntityRelationshipActivationDay(models.Model):
+    """
+    Models a day on which an entity relationship was active at any time.
+    """
+    sub_entity = models.ForeignKey(
+        Entity, related_name='+', help_text='The sub entity in the relationship that was active')
+    super_entity = models.ForeignKey(
+        Entity, related_name='+', db_index=False, help_text='The super entity in the relationship that was active')
+    day = models.DateField(help_text='The day on which the relationship was active')
+
+    class Meta:
+        app_label = 'entity_history'
+        # Covers looking up the sub entities of super entities on days
+        unique_together = ('super_entity', 'day', 'sub_entity')
+
+
+class DetachedEventPartition(models.Model):
+    """
+    Models a partition of an event table that was detached. The events of the partition are no longer read by history
+    queries, so queries that read every event of an entity instead of starting from a checkpoint can no longer be
+    answered.
+    """
+    name = models.CharField(max_length=128, help_text='The name of the partition that was detached')
+    end_time = models.DateTimeField(help_text='The time before which the partition held events')
+
+    class Meta:
+        app_label = 'entity_history'
+
+
+PYTHON_ENGINE = 'python'
+SQL_ENGINE = 'sql'
+INTERVAL_ENGINE = 'interval'
+
+# The number of events that are fetched at a time when events are replayed in python
+EVENT_CHUNK_SIZE = 10000
+
+# Lists of ids that are larger than this are passed to postgres as a single array instead of an IN list
+ARRAY_FILTER_SIZE = 1000
+
+# Checkpoints are only created and results are only memoized for times that are at least this old. Events are
+# timestamped when they are written, so a transaction that is still open may commit events that happened before a
+# more recent checkpoint
+CHECKPOINT_SETTLE_TIME = timedelta(hours=1)
+
+# The key of the advisory lock that keeps concurrent rollups from rolling up the same days
+ROLLUP_LOCK_KEY = 4613272
+
+# The largest number of times for which the sql engine is the default. The sql engine reads the events before every
+# time separately, while the python engine replays the events once for all of the times
+SQL_ENGINE_MAX_TIMES = 32
+
+
+def _get_engine(engine, num_times=None):
+    """
+    Returns the engine used to compute historical states. The states are computed inside of postgres by default for
+    up to SQL_ENGINE_MAX_TIMES times and are computed by replaying events in python for more times or for other
+    backends. Queries whose cost in postgres does not grow with the number of times do not pass the number of times.
+    """
+    if engine is None:
+        if connection.vendor != 'postgresql' or (num_times is not None and num_times > SQL_ENGINE_MAX_TIMES):
+            return PYTHON_ENGINE
+        return SQL_ENGINE
+    elif engine not in ENTITY_ENGINES:
+        raise ValueError('Unsupported history engine {0}'.format(engine))
+    return engine
+
+
+def _execute(sql, params):
+    """
+    Executes raw sql and yields the resulting rows.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor:
+            yield row
+
+
+def _get_filter_ids(ids):
+    """
+    Returns ids to filter on that can be read more than once. Iterables like generators are read into a list, while
+    querysets are kept so that they are evaluated inside of the database.
+    """
+    if ids is None or hasattr(ids, 'query'):
+        return ids
+    return list(ids)
+
+
+def _filter_by_ids(queryset, column, ids):
+    """
+    Filters a queryset on the ids of a column. The ids are a list or a values list queryset. Large lists of ids are
+    passed to postgres as a single array parameter instead of a parameter for every id so that the time spent parsing
+    and planning the query does not grow with the number of ids.
+    """
+    if connection.vendor == 'postgresql' and not hasattr(ids, 'query') and len(ids) > ARRAY_FILTER_SIZE:
+        return queryset.extra(
+            where=['{0}.{1} = ANY(%s::integer[])'.format(queryset.model._meta.db_table, column)], params=[list(ids)])
+
+    return queryset.filter(**{'{0}__in'.format(column): ids})
+
+
+def _utc_tzinfo_factory(offset):
+    return utc
+
+
+def _stream_rows(queryset, chunk_size=EVENT_CHUNK_SIZE):
+    """
+    Yields the rows of a values list queryset while only holding a bounded chunk of rows in memory. Postgres backends
+    read the rows through a named server side cursor.
+    """
+    if connection.vendor != 'postgresql':
+        for row in queryset.iterator():
+            yield row
+        return
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # The queryset can not match any rows
+        return
+
+    with transaction.atomic():
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name='entity_history_{0}'.format(uuid4().hex))
+        # Mirror the timezone handling of the cursors that django creates
+        cursor.tzinfo_factory = _utc_tzinfo_factory if settings.USE_TZ else None
+        try:
+            cursor.execute(sql, params)
+            for rows in iter(lambda: cursor.fetchmany(chunk_size), []):
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+
+def _get_checkpoint_segments(times):
+    """
+    Groups the times on the latest checkpoint at or before each time.
+
+    :returns: A list of (checkpoint, times) tuples in ascending time order. The checkpoint is None for the times that
+       happened before the first checkpoint.
+    """
+    times = sorted(set(times))
+    checkpoints = list(HistoryCheckpoint.objects.filter(time__lte=times[-1]).order_by('time'))
+    checkpoint_times = [checkpoint.time for checkpoint in checkpoints]
+
+    segments = []
+    for t in times:
+        index = bisect_right(checkpoint_times, t) - 1
+        checkpoint = checkpoints[index] if index >= 0 else None
+        if segments and segments[-1][0] == checkpoint:
+            segments[-1][1].append(t)
+        else:
+            segments.append((checkpoint, [t]))
+
+    return segments
+
+
+def _sweep_from_checkpoints(events, checkpoint_members, times, grouped=True):
+    """
+    Sweeps events from the latest checkpoint before the times, only replaying the events that happened after the
+    checkpoint.
+
+    :param events: A values list queryset of (group_id, member_id, time, was_activated) events
+    :param checkpoint_members: A values list queryset of (group_id, member_id) members of checkpoints
+    :param times: An iterable of datetime objects
+    :param grouped: False if the events and checkpoint members do not have group ids. All members are then placed
+       in the None group
+    :returns: A generator of (time, state) tuples like the sweep_states function
+    """
+    for checkpoint, checkpoint_times in _get_checkpoint_segments(times):
+        checkpoint_events = events.filter(time__lt=checkpoint_times[-1])
+        state = defaultdict(set)
+        if checkpoint is not None:
+            checkpoint_events = checkpoint_events.filter(time__gte=checkpoint.time)
+            for member in checkpoint_members.filter(checkpoint=checkpoint):
+                group_id, member_id = member if grouped else (None,) + member
+                state[group_id].add(member_id)
+
+        with closing(_stream_rows(checkpoint_events)) as checkpoint_events:
+            if not grouped:
+                checkpoint_events = ((None,) + event for event in checkpoint_events)
+
+            for t, checkpoint_state in sweep_states(checkpoint_events, checkpoint_times, state):
+                yield t, checkpoint_state
+
+
+def _sweep_sub_entities(super_entity_ids, times, filter_by_entity_ids):
+    super_entity_ids = list(super_entity_ids)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+    er_events = _filter_by_ids(
+        EntityRelationshipActivationEvent.objects.all(), 'super_entity_id', super_entity_ids
+    ).order_by('time', 'id').values_list('super_entity_id', 'sub_entity_id', 'time', 'was_activated')
+    er_checkpoints = _filter_by_ids(
+        EntityRelationshipActivationCheckpoint.objects.all(), 'super_entity_id', super_entity_ids
+    ).values_list('super_entity_id', 'sub_entity_id')
+    if filter_by_entity_ids is not None:
+        er_events = _filter_by_ids(er_events, 'sub_entity_id', filter_by_entity_ids)
+        er_checkpoints = _filter_by_ids(er_checkpoints, 'sub_entity_id', filter_by_entity_ids)
+
+    # Traverse the entity relationship events once in ascending time from the latest checkpoint, taking a snapshot
+    # of the sub entities of every super entity at each time
+    for t, sub_entities in _sweep_from_checkpoints(er_events, er_checkpoints, times):
+        for se_id, sub_entity_ids in sub_entities.items():
+            yield (se_id, t), sub_entity_ids
+
+
+def _query_sub_entities(super_entity_ids, times, filter_by_entity_ids, sql=SUB_ENTITIES_AT_TIMES_SQL):
+    times = sorted(set(times))
+    entity_filter, params = get_entity_filter_sql('sub_entity_id', filter_by_entity_ids)
+    params.update(times=times, max_time=times[-1], super_entity_ids=list(set(super_entity_ids)))
+
+    for position, se_id, sub_entity_id in _execute(sql.format(entity_filter=entity_filter), params):
+        yield (se_id, times[position - 1]), [sub_entity_id]
+
+
+def _probe_sub_entity_intervals(super_entity_ids, times, filter_by_entity_ids):
+    return _query_sub_entities(
+        super_entity_ids, times, filter_by_entity_ids, sql=SUB_ENTITIES_IN_INTERVALS_AT_TIMES_SQL)
+
+
+def _sweep_entities(times, filter_by_entity_ids):
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+    e_events = EntityActivationEvent.objects.order_by('time', 'id').values_list('entity_id', 'time', 'was_activated')
+    e_checkpoints = EntityActivationCheckpoint.objects.values_list('entity_id')
+    if filter_by_entity_ids is not None:
+        e_events = _filter_by_ids(e_events, 'entity_id', filter_by_entity_ids)
+        e_checkpoints = _filter_by_ids(e_checkpoints, 'entity_id', filter_by_entity_ids)
+
+    # Traverse the entity events once in ascending time from the latest checkpoint, taking a snapshot of the active
+    # entities at each time
+    for t, entities in _sweep_from_checkpoints(e_events, e_checkpoints, times, grouped=False):
+        yield t, entities[None]
+
+
+def _query_entities(times, filter_by_entity_ids, sql=ENTITIES_AT_TIMES_SQL):
+    times = sorted(set(times))
+    entity_filter, params = get_entity_filter_sql('entity_id', filter_by_entity_ids)
+    params.update(times=times, max_time=times[-1])
+
+    for position, entity_id in _execute(sql.format(entity_filter=entity_filter), params):
+        yield times[position - 1], [entity_id]
+
+
+def _probe_entity_intervals(times, filter_by_entity_ids):
+    return _query_entities(times, filter_by_entity_ids, sql=ENTITIES_IN_INTERVALS_AT_TIMES_SQL)
+
+
+def _sweep_sub_entity_pairs(pairs, filter_by_entity_ids):
+    # Sweep the events of all of the super entities once over every requested time, only keeping the requested pairs
+    pairs = set(pairs)
+    super_entity_ids = list(set(se_id for se_id, _ in pairs))
+    for key, sub_entity_ids in _sweep_sub_entities(super_entity_ids, [t for _, t in pairs], filter_by_entity_ids):
+        if key in pairs:
+            yield key, sub_entity_ids
+
+
+def _query_sub_entity_pairs(pairs, filter_by_entity_ids, sql=SUB_ENTITIES_AT_PAIRS_SQL):
+    pairs = sorted(set(pairs))
+    entity_filter, params = get_entity_filter_sql('sub_entity_id', filter_by_entity_ids)
+    params.update(
+        super_entity_ids=[se_id for se_id, _ in pairs], times=[t for _, t in pairs],
+        max_time=max(t for _, t in pairs))
+
+    for position, sub_entity_id in _execute(sql.format(entity_filter=entity_filter), params):
+        yield pairs[position - 1], [sub_entity_id]
+
+
+def _probe_sub_entity_pair_intervals(pairs, filter_by_entity_ids):
+    return _query_sub_entity_pairs(pairs, filter_by_entity_ids, sql=SUB_ENTITIES_IN_INTERVALS_AT_PAIRS_SQL)
+
+
+def _sweep_super_entities(sub_entity_ids, times, filter_by_super_entity_ids):
+    sub_entity_ids = list(sub_entity_ids)
+    filter_by_super_entity_ids = _get_filter_ids(filter_by_super_entity_ids)
+    er_events = _filter_by_ids(
+        EntityRelationshipActivationEvent.objects.all(), 'sub_entity_id', sub_entity_ids
+    ).order_by('time', 'id').values_list('sub_entity_id', 'super_entity_id', 'time', 'was_activated')
+    er_checkpoints = _filter_by_ids(
+        EntityRelationshipActivationCheckpoint.objects.all(), 'sub_entity_id', sub_entity_ids
+    ).values_list('sub_entity_id', 'super_entity_id')
+    if filter_by_super_entity_ids is not None:
+        er_events = _filter_by_ids(er_events, 'super_entity_id', filter_by_super_entity_ids)
+        er_checkpoints = _filter_by_ids(er_checkpoints, 'super_entity_id', filter_by_super_entity_ids)
+
+    # Traverse the relationship events of the sub entities once in ascending time, grouping them on the sub entities
+    for t, super_entities in _sweep_from_checkpoints(er_events, er_checkpoints, times):
+        for sub_entity_id, super_entity_ids in super_entities.items():
+            yield (sub_entity_id, t), super_entity_ids
+
+
+def _query_super_entities(sub_entity_ids, times, filter_by_super_entity_ids, sql=SUPER_ENTITIES_AT_TIMES_SQL):
+    times = sorted(set(times))
+    entity_filter, params = get_entity_filter_sql('super_entity_id', filter_by_super_entity_ids)
+    params.update(times=times, max_time=times[-1], sub_entity_ids=list(set(sub_entity_ids)))
+
+    for position, sub_entity_id, se_id in _execute(sql.format(entity_filter=entity_filter), params):
+        yield (sub_entity_id, times[position - 1]), [se_id]
+
+
+def _probe_super_entity_intervals(sub_entity_ids, times, filter_by_super_entity_ids):
+    return _query_super_entities(
+        sub_entity_ids, times, filter_by_super_entity_ids, sql=SUPER_ENTITIES_IN_INTERVALS_AT_TIMES_SQL)
+
+
+def _get_relationship_columns(ancestors):
+    """
+    Returns the (from, to) columns of relationships that are walked to reach the descendants or ancestors of entities.
+    """
+    return ('sub_entity_id', 'super_entity_id') if ancestors else ('super_entity_id', 'sub_entity_id')
+
+
+def _walk_relationships(relationships, root_id, max_depth):
+    """
+    Walks the relationships of an entity breadth first, returning every entity that can be reached within the
+    maximum depth. The entity itself is never returned, which also ends the walk when relationships are cyclic.
+    """
+    related = set()
+    reached = set([root_id])
+    depth = 0
+    while reached and (max_depth is None or depth < max_depth):
+        reached = set(
+            entity_id for reached_id in reached for entity_id in relationships.get(reached_id, ())
+        ) - related - set([root_id])
+        related |= reached
+        depth += 1
+    return related
+
+
+def _sweep_related_entities(entity_ids, times, filter_by_entity_ids, max_depth, ancestors):
+    from_column, to_column = _get_relationship_columns(ancestors)
+    er_events = EntityRelationshipActivationEvent.objects.order_by('time', 'id').values_list(
+        from_column, to_column, 'time', 'was_activated')
+    er_checkpoints = EntityRelationshipActivationCheckpoint.objects.values_list(from_column, to_column)
+    if filter_by_entity_ids is not None:
+        filter_by_entity_ids = set(filter_by_entity_ids)
+
+    # Sweep every relationship since the walks can pass through any entity, then walk the relationships from each
+    # entity at every time
+    for t, relationships in _sweep_from_checkpoints(er_events, er_checkpoints, times):
+        for entity_id in set(entity_ids):
+            related = _walk_relationships(relationships, entity_id, max_depth)
+            if filter_by_entity_ids is not None:
+                related &= filter_by_entity_ids
+            yield (entity_id, t), related
+
+
+def _query_related_entities(
+        entity_ids, times, filter_by_entity_ids, max_depth, ancestors, sql=RELATED_ENTITIES_AT_TIMES_SQL):
+    from_column, to_column = _get_relationship_columns(ancestors)
+    times = sorted(set(times))
+    entity_filter, params = get_entity_filter_sql('related.entity_id', filter_by_entity_ids)
+    params.update(times=times, max_time=times[-1], entity_ids=list(set(entity_ids)), max_depth=max_depth)
+
+    sql = sql.format(entity_filter=entity_filter, from_column=from_column, to_column=to_column)
+    for position, root_id, entity_id in _execute(sql, params):
+        yield (root_id, times[position - 1]), [entity_id]
+
+
+def _probe_related_entity_intervals(entity_ids, times, filter_by_entity_ids, max_depth, ancestors):
+    return _query_related_entities(
+        entity_ids, times, filter_by_entity_ids, max_depth, ancestors, sql=RELATED_ENTITIES_IN_INTERVALS_AT_TIMES_SQL)
+
+
+def _sweep_sub_entity_counts(super_entity_ids, times, filter_by_entity_ids):
+    for key, sub_entity_ids in _sweep_sub_entities(super_entity_ids, times, filter_by_entity_ids):
+        yield key, len(sub_entity_ids)
+
+
+def _query_sub_entity_counts(super_entity_ids, times, filter_by_entity_ids, sql=SUB_ENTITY_COUNTS_AT_TIMES_SQL):
+    times = sorted(set(times))
+    entity_filter, params = get_entity_filter_sql('sub_entity_id', filter_by_entity_ids)
+    params.update(times=times, min_time=times[0], max_time=times[-1], super_entity_ids=list(super_entity_ids))
+
+    for position, se_id, count in _execute(sql.format(entity_filter=entity_filter), params):
+        yield (se_id, times[position - 1]), count
+
+
+def _probe_sub_entity_interval_counts(super_entity_ids, times, filter_by_entity_ids):
+    return _query_sub_entity_counts(
+        super_entity_ids, times, filter_by_entity_ids, sql=SUB_ENTITY_COUNTS_IN_INTERVALS_AT_TIMES_SQL)
+
+
+def _sweep_entity_counts(times, filter_by_entity_ids):
+    for t, entity_ids in _sweep_entities(times, filter_by_entity_ids):
+        yield t, len(entity_ids)
+
+
+def _query_entity_counts(times, filter_by_entity_ids, sql=ENTITY_COUNTS_AT_TIMES_SQL):
+    times = sorted(set(times))
+    entity_filter, params = get_entity_filter_sql('entity_id', filter_by_entity_ids)
+    params.update(times=times, min_time=times[0], max_time=times[-1])
+
+    for position, count in _execute(sql.format(entity_filter=entity_filter), params):
+        yield times[position - 1], count
+
+
+def _probe_entity_interval_counts(times, filter_by_entity_ids):
+    return _query_entity_counts(times, filter_by_entity_ids, sql=ENTITY_COUNTS_IN_INTERVALS_AT_TIMES_SQL)
+
+
+SUB_ENTITY_ENGINES = {
+    PYTHON_ENGINE: _sweep_sub_entities,
+    SQL_ENGINE: _query_sub_entities,
+    INTERVAL_ENGINE: _probe_sub_entity_intervals,
+}
+
+ENTITY_ENGINES = {
+    PYTHON_ENGINE: _sweep_entities,
+    SQL_ENGINE: _query_entities,
+    INTERVAL_ENGINE: _probe_entity_intervals,
+}
+
+SUB_ENTITY_PAIR_ENGINES = {
+    PYTHON_ENGINE: _sweep_sub_entity_pairs,
+    SQL_ENGINE: _query_sub_entity_pairs,
+    INTERVAL_ENGINE: _probe_sub_entity_pair_intervals,
+}
+
+SUPER_ENTITY_ENGINES = {
+    PYTHON_ENGINE: _sweep_super_entities,
+    SQL_ENGINE: _query_super_entities,
+    INTERVAL_ENGINE: _probe_super_entity_intervals,
+}
+
+RELATED_ENTITY_ENGINES = {
+    PYTHON_ENGINE: _sweep_related_entities,
+    SQL_ENGINE: _query_related_entities,
+    INTERVAL_ENGINE: _probe_related_entity_intervals,
+}
+
+SUB_ENTITY_COUNT_ENGINES = {
+    PYTHON_ENGINE: _sweep_sub_entity_counts,
+    SQL_ENGINE: _query_sub_entity_counts,
+    INTERVAL_ENGINE: _probe_sub_entity_interval_counts,
+}
+
+ENTITY_COUNT_ENGINES = {
+    PYTHON_ENGINE: _sweep_entity_counts,
+    SQL_ENGINE: _query_entity_counts,
+    INTERVAL_ENGINE: _probe_entity_interval_counts,
+}
+
+
+def _iter_time_groups(rows, times, get_time):
+    """
+    Groups the rows of an engine, which are yielded in ascending order of time, on their times.
+
+    :returns: A generator of (time, rows) tuples for every one of the sorted times
+    """
+    groups = groupby(rows, key=get_time)
+    group_time, group = next(groups, (None, ()))
+    for t in times:
+        if group_time == t:
+            yield t, group
+            group_time, group = next(groups, (None, ()))
+        else:
+            yield t, ()
+
+
+def _get_cache(times, engine, filter_by_entity_ids):
+    """
+    Returns the current membership cache if it can answer all of the times with the default engine, otherwise None.
+    Queries that are filtered by querysets are not answered by the cache so that the querysets are evaluated inside of
+    the database.
+    """
+    if hasattr(filter_by_entity_ids, 'query'):
+        return None
+
+    cache = get_current_membership_cache()
+    if engine is None and cache is not None and cache.can_answer(times):
+        return cache
+
+
+def _get_sub_entity_rows(super_entity_ids, times, filter_by_entity_ids, engine):
+    """
+    Returns the rows of the sub entities of super entities at times in ascending order of time. The rows are read from
+    the current membership cache when it can answer the times.
+    """
+    cache = _get_cache(times, engine, filter_by_entity_ids)
+    if cache is None:
+        return SUB_ENTITY_ENGINES[_get_engine(engine, len(set(times)))](super_entity_ids, times, filter_by_entity_ids)
+
+    sub_entities = cache.get_sub_entities(
+        super_entity_ids, None if filter_by_entity_ids is None else set(filter_by_entity_ids))
+    return [
+        ((se_id, t), sub_entities[se_id])
+        for t in sorted(set(times))
+        for se_id in super_entity_ids
+    ]
+
+
+def _get_entity_rows(times, filter_by_entity_ids, engine):
+    """
+    Returns the rows of the active entities at times in ascending order of time. The rows are read from the current
+    membership cache when it can answer the times.
+    """
+    cache = _get_cache(times, engine, filter_by_entity_ids)
+    if cache is None:
+        return ENTITY_ENGINES[_get_engine(engine, len(set(times)))](times, filter_by_entity_ids)
+
+    entity_ids = cache.get_entities(None if filter_by_entity_ids is None else set(filter_by_entity_ids))
+    return [(t, entity_ids) for t in sorted(set(times))]
+
+
+def _get_sub_entity_deltas(super_entity_ids, times, filter_by_entity_ids, engine):
+    times = sorted(set(times))
+    ers = {
+        se_id: EntityDeltas()
+        for se_id in super_entity_ids
+    }
+    if not ers or not times:
+        return ers
+
+    rows = _get_sub_entity_rows(super_entity_ids, times, filter_by_entity_ids, engine)
+    for t, group in _iter_time_groups(rows, times, lambda row: row[0][1]):
+        sub_entities = defaultdict(set)
+        for (se_id, _), sub_entity_ids in group:
+            sub_entities[se_id].update(sub_entity_ids)
+        for se_id, deltas in ers.items():
+            deltas.append(t, sub_entities[se_id])
+
+    return ers
+
+
+def _get_entity_deltas(times, filter_by_entity_ids, engine):
+    times = sorted(set(times))
+    es = EntityDeltas()
+    if not times:
+        return es
+
+    rows = _get_entity_rows(times, filter_by_entity_ids, engine)
+    for t, group in _iter_time_groups(rows, times, lambda row: row[0]):
+        es.append(t, set(entity_id for _, entity_ids in group for entity_id in entity_ids))
+
+    return es
+
+
+def _add_entities(results, key, entity_ids):
+    if isinstance(results, SparseEntityResults):
+        results.add(key, entity_ids)
+    else:
+        results[key].update(entity_ids)
+
+
+def _check_result_mode(deltas, sparse):
+    if deltas and sparse:
+        raise ValueError('Delta encoded results cannot also be sparse')
+
+
+def _memoize(model, key, times, filter_by_entity_ids, compute):
+    """
+    Memoizes the result of a historical query when memoization is enabled and every time is at least
+    CHECKPOINT_SETTLE_TIME old. Queries that are filtered by querysets are not memoized.
+    """
+    if not is_memoization_enabled() or not times or max(times) > timezone.now() - CHECKPOINT_SETTLE_TIME:
+        return compute()
+    elif not isinstance(filter_by_entity_ids, (type(None), list, tuple, set, frozenset)):
+        return compute()
+
+    if filter_by_entity_ids is not None:
+        filter_by_entity_ids = sorted(set(filter_by_entity_ids))
+    return memoize(key + (sorted(set(times)), filter_by_entity_ids), model, max(times), compute)
+
+
+def _get_sub_entities(super_entity_ids, times, filter_by_entity_ids, engine, sparse):
+    if sparse:
+        ers = SparseEntityResults()
+    else:
+        ers = {
+            (se_id, t): set()
+            for se_id in super_entity_ids
+            for t in times
+        }
+
+    if super_entity_ids and times:
+        for key, sub_entity_ids in _get_sub_entity_rows(super_entity_ids, times, filter_by_entity_ids, engine):
+            _add_entities(ers, key, sub_entity_ids)
+
+    return ers
+
+
+def _get_entities(times, filter_by_entity_ids, engine, sparse):
+    if sparse:
+        es = SparseEntityResults()
+    else:
+        es = {
+            t: set()
+            for t in times
+        }
+
+    if times:
+        for t, entity_ids in _get_entity_rows(times, filter_by_entity_ids, engine):
+            _add_entities(es, t, entity_ids)
+
+    return es
+
+
+def get_sub_entities_at_times(
+        super_entity_ids, times, filter_by_entity_ids=None, engine=None, deltas=False, sparse=False):
     """
     Constructs the sub entities of super entities at points in time.
 
     :param super_entity_ids: An iterable of super entity ids
     :param times: An iterable of datetime objects
-    :param filter_by_entity_ids: An iterable of entity ids over which to filter the results
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the sub entities. The 'sql' engine resolves the sub entities inside of
+       postgres and is the default for up to SQL_ENGINE_MAX_TIMES times on postgres backends. It reads the events
+       before every time separately, so it is meant for a small number of times. The 'python' engine replays the
+       events in a single pass in python and is the default otherwise. The 'interval' engine probes the activation
+       intervals of relationships.
+    :param deltas: True if the sub entities of every super entity should be delta encoded over the times
+    :param sparse: True if only the keys that have sub entities should be stored
     :returns: A dictionary keyed on (super_entity_id, time) tuples. Each key has a set of all entity ids that were sub
-       entities of the super entity during that time.
+       entities of the super entity during that time. If deltas is True, the dictionary is instead keyed on super
+       entity ids and each key has an EntityDeltas of the sub entities of the super entity. If sparse is True, a
+       SparseEntityResults without the empty keys is returned instead.
+    """
+    _check_result_mode(deltas, sparse)
+    super_entity_ids = list(super_entity_ids)
+    times = list(times)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+
+    if deltas:
+        compute = partial(_get_sub_entity_deltas, super_entity_ids, times, filter_by_entity_ids, engine)
+    else:
+        compute = partial(_get_sub_entities, super_entity_ids, times, filter_by_entity_ids, engine, sparse)
+
+    return _memoize(
+        EntityRelationshipActivationEvent, ('sub_entities', sorted(set(super_entity_ids)), deltas, sparse), times,
+        filter_by_entity_ids, compute)
+
+
+def get_entities_at_times(times, filter_by_entity_ids=None, engine=None, deltas=False, sparse=False):
     """
-    er_events = EntityRelationshipActivationEvent.objects.filter(super_entity_id__in=super_entity_ids).order_by('time')
-    if filter_by_entity_ids:
-        er_events = er_events.filter(sub_entity_id__in=filter_by_entity_ids)
+    Constructs the entities that were active at points in time.
+
+    :param times: An iterable of datetime objects
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the entities. The 'sql' engine resolves the entities inside of postgres
+       and is the default for up to SQL_ENGINE_MAX_TIMES times on postgres backends. It reads the events before every
+       time separately, so it is meant for a small number of times. The 'python' engine replays the events in a single
+       pass in python and is the default otherwise. The 'interval' engine probes the activation intervals of entities.
+    :param deltas: True if the entities should be delta encoded over the times
+    :param sparse: True if only the times that have entities should be stored
+    :returns: A dictionary keyed on time values. Each key has a set of all entity ids that were active at the time. If
+       deltas is True, an EntityDeltas of the entities is returned instead. If sparse is True, a SparseEntityResults
+       without the empty times is returned instead.
+    """
+    _check_result_mode(deltas, sparse)
+    times = list(times)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+
+    if deltas:
+        compute = partial(_get_entity_deltas, times, filter_by_entity_ids, engine)
+    else:
+        compute = partial(_get_entities, times, filter_by_entity_ids, engine, sparse)
+
+    return _memoize(EntityActivationEvent, ('entities', deltas, sparse), times, filter_by_entity_ids, compute)
+
+
+def get_sub_entities_at_pairs(pairs, filter_by_entity_ids=None, engine=None, sparse=False):
+    """
+    Constructs the sub entities of super entities at points in time that can differ for every super entity. Only the
+    requested pairs of super entities and times are evaluated.
+
+    :param pairs: An iterable of (super_entity_id, time) tuples
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the sub entities, like in get_sub_entities_at_times
+    :param sparse: True if only the pairs that have sub entities should be stored
+    :returns: A dictionary keyed on the (super_entity_id, time) tuples. Each key has a set of all entity ids that were
+       sub entities of the super entity during that time. If sparse is True, a SparseEntityResults without the empty
+       pairs is returned instead.
+    """
+    pairs = list(set(pairs))
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+    ers = SparseEntityResults() if sparse else {pair: set() for pair in pairs}
+
+    if pairs:
+        for key, sub_entity_ids in SUB_ENTITY_PAIR_ENGINES[_get_engine(engine, len(pairs))](
+                pairs, filter_by_entity_ids):
+            _add_entities(ers, key, sub_entity_ids)
+
+    return ers
 
+
+def get_super_entities_at_times(
+        sub_entity_ids, times, filter_by_super_entity_ids=None, engine=None, sparse=False):
+    """
+    Constructs the super entities of sub entities at points in time. Only the relationship events of the sub entities
+    are read.
+
+    :param sub_entity_ids: An iterable of sub entity ids
+    :param times: An iterable of datetime objects
+    :param filter_by_super_entity_ids: An iterable or a values list queryset of entity ids over which to filter the
+       super entities of the results
+    :param engine: The engine used to compute the super entities, like in get_sub_entities_at_times
+    :param sparse: True if only the keys that have super entities should be stored
+    :returns: A dictionary keyed on (sub_entity_id, time) tuples. Each key has a set of all entity ids that were super
+       entities of the sub entity during that time. If sparse is True, a SparseEntityResults without the empty keys
+       is returned instead.
+    """
+    sub_entity_ids = list(sub_entity_ids)
+    times = list(times)
+    filter_by_super_entity_ids = _get_filter_ids(filter_by_super_entity_ids)
+
+    if sparse:
+        ers = SparseEntityResults()
+    else:
+        ers = {
+            (sub_entity_id, t): set()
+            for sub_entity_id in sub_entity_ids
+            for t in times
+        }
+
+    if sub_entity_ids and times:
+        for key, super_entity_ids in SUPER_ENTITY_ENGINES[_get_engine(engine, len(set(times)))](
+                sub_entity_ids, times, filter_by_super_entity_ids):
+            _add_entities(ers, key, super_entity_ids)
+
+    return ers
+
+
+def _get_related_entities(entity_ids, times, filter_by_entity_ids, max_depth, engine, ancestors):
+    entity_ids = list(entity_ids)
+    times = list(times)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
     ers = {
-        (se_id, t): set()
-        for se_id in super_entity_ids
+        (entity_id, t): set()
+        for entity_id in entity_ids
         for t in times
     }
 
-    for t in times:
-        # Traverse the entity relationship events in ascending time, keeping track of if a sub entity was in a
-        # relationship before time t
-        for er_event in [er for er in er_events if er.time < t]:
-            if er_event.was_activated:
-                ers[(er_event.super_entity_id, t)].add(er_event.sub_entity_id)
-            else:
-                ers[(er_event.super_entity_id, t)].discard(er_event.sub_entity_id)
+    if entity_ids and times:
+        for key, related_entity_ids in RELATED_ENTITY_ENGINES[_get_engine(engine, len(set(times)))](
+                entity_ids, times, filter_by_entity_ids, max_depth, ancestors):
+            ers[key].update(related_entity_ids)
 
     return ers
 
 
-def get_entities_at_times(times, filter_by_entity_ids=None):
+def get_descendants_at_times(super_entity_ids, times, filter_by_entity_ids=None, max_depth=None, engine=None):
     """
-    Constructs the entities that were active at points in time.
+    Constructs the descendants of super entities at points in time. The descendants are the sub entities of the super
+    entities along with their sub entities, recursively.
 
+    :param super_entity_ids: An iterable of super entity ids
     :param times: An iterable of datetime objects
-    :param filter_by_entity_ids: An iterable of entity ids over which to filter the results
-    :returns: A dictionary keyed on time values. Each key has a set of all entity ids that were active at the time.
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param max_depth: The maximum number of relationships between a super entity and its descendants. The sub
+       entities of the super entities have a depth of one. There is no maximum depth by default
+    :param engine: The engine used to compute the descendants, like in get_sub_entities_at_times
+    :returns: A dictionary keyed on (super_entity_id, time) tuples. Each key has a set of all entity ids that were
+       descendants of the super entity during that time. A super entity is never its own descendant, even when
+       relationships are cyclic.
     """
-    e_events = EntityActivationEvent.objects.order_by('time')
-    if filter_by_entity_ids:
-        e_events = e_events.filter(entity_id__in=filter_by_entity_ids)
+    return _get_related_entities(super_entity_ids, times, filter_by_entity_ids, max_depth, engine, ancestors=False)
 
-    es = {
-        t: set()
+
+def get_ancestors_at_times(sub_entity_ids, times, filter_by_super_entity_ids=None, max_depth=None, engine=None):
+    """
+    Constructs the ancestors of sub entities at points in time. The ancestors are the super entities of the sub
+    entities along with their super entities, recursively.
+
+    :param sub_entity_ids: An iterable of sub entity ids
+    :param times: An iterable of datetime objects
+    :param filter_by_super_entity_ids: An iterable or a values list queryset of entity ids over which to filter the
+       results
+    :param max_depth: The maximum number of relationships between a sub entity and its ancestors. The super entities
+       of the sub entities have a depth of one. There is no maximum depth by default
+    :param engine: The engine used to compute the ancestors, like in get_sub_entities_at_times
+    :returns: A dictionary keyed on (sub_entity_id, time) tuples. Each key has a set of all entity ids that were
+       ancestors of the sub entity during that time. A sub entity is never its own ancestor, even when relationships
+       are cyclic.
+    """
+    return _get_related_entities(sub_entity_ids, times, filter_by_super_entity_ids, max_depth, engine, ancestors=True)
+
+
+def _get_times_in_range(start_time, end_time, step):
+    """
+    Returns the times from a start time through an end time at a regular step, including the end time if it falls on
+    a step.
+    """
+    if step <= timedelta(0):
+        raise ValueError('The step between times must be positive')
+
+    times = []
+    t = start_time
+    while t <= end_time:
+        times.append(t)
+        t += step
+    return times
+
+
+def _get_sub_entity_counts(super_entity_ids, times, filter_by_entity_ids, engine):
+    super_entity_ids = list(super_entity_ids)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+
+    counts = {
+        (se_id, t): 0
+        for se_id in super_entity_ids
         for t in times
     }
 
-    for t in times:
-        # Traverse the entity events in ascending time, keeping track of if an entity was active before time t
-        for e_event in [e for e in e_events if e.time < t]:
-            if e_event.was_activated:
-                es[t].add(e_event.entity_id)
-            else:
-                es[t].discard(e_event.entity_id)
+    if counts:
+        for key, count in SUB_ENTITY_COUNT_ENGINES[_get_engine(engine)](
+                super_entity_ids, times, filter_by_entity_ids):
+            counts[key] = count
+
+    return counts
+
+
+def _get_entity_counts(times, filter_by_entity_ids, engine):
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+    counts = {
+        t: 0
+        for t in times
+    }
+
+    if counts:
+        for t, count in ENTITY_COUNT_ENGINES[_get_engine(engine)](times, filter_by_entity_ids):
+            counts[t] = count
+
+    return counts
+
+
+def get_sub_entity_counts_at_times(super_entity_ids, times, filter_by_entity_ids=None, engine=None):
+    """
+    Counts the sub entities of super entities at points in time. The 'sql' engine computes the counts inside of
+    postgres without transferring any entity ids.
+
+    :param super_entity_ids: An iterable of super entity ids
+    :param times: An iterable of datetime objects
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the counts, like in get_sub_entities_at_times
+    :returns: A dictionary keyed on (super_entity_id, time) tuples. Each key has the number of sub entities of the
+       super entity during that time.
+    """
+    return _get_sub_entity_counts(super_entity_ids, list(times), filter_by_entity_ids, engine)
+
+
+def get_sub_entity_counts_in_range(
+        super_entity_ids, start_time, end_time, step, filter_by_entity_ids=None, engine=None):
+    """
+    Counts the sub entities of super entities at regular steps from a start time through an end time. The times
+    are stepped in python and passed to every engine like the times of get_sub_entity_counts_at_times.
+
+    :param super_entity_ids: An iterable of super entity ids
+    :param start_time: The datetime of the first count
+    :param end_time: The datetime after which no counts are made
+    :param step: A timedelta of the time between counts
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the counts, like in get_sub_entities_at_times
+    :returns: A dictionary keyed on (super_entity_id, time) tuples like get_sub_entity_counts_at_times
+    """
+    return _get_sub_entity_counts(
+        super_entity_ids, _get_times_in_range(start_time, end_time, step), filter_by_entity_ids, engine)
+
+
+def get_entity_counts_at_times(times, filter_by_entity_ids=None, engine=None):
+    """
+    Counts the entities that were active at points in time. The 'sql' engine computes the counts inside of postgres
+    without transferring any entity ids.
+
+    :param times: An iterable of datetime objects
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the counts, like in get_entities_at_times
+    :returns: A dictionary keyed on time values. Each key has the number of entities that were active at the time.
+    """
+    return _get_entity_counts(list(times), filter_by_entity_ids, engine)
+
+
+def get_entity_counts_in_range(start_time, end_time, step, filter_by_entity_ids=None, engine=None):
+    """
+    Counts the entities that were active at regular steps from a start time through an end time. The times are
+    stepped in python and passed to every engine like the times of get_entity_counts_at_times.
+
+    :param start_time: The datetime of the first count
+    :param end_time: The datetime after which no counts are made
+    :param step: A timedelta of the time between counts
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :param engine: The engine used to compute the counts, like in get_entities_at_times
+    :returns: A dictionary keyed on time values like get_entity_counts_at_times
+    """
+    return _get_entity_counts(_get_times_in_range(start_time, end_time, step), filter_by_entity_ids, engine)
+
+
+@transaction.atomic
+def create_history_checkpoint(time):
+    """
+    Records the active entities and the sub entities of every super entity at a point in time. The states are
+    replayed from the previous checkpoint.
+
+    :param time: The datetime of the checkpoint
+    :returns: The created HistoryCheckpoint
+    """
+    e_events = EntityActivationEvent.objects.order_by('time', 'id').values_list('entity_id', 'time', 'was_activated')
+    er_events = EntityRelationshipActivationEvent.objects.order_by('time', 'id').values_list(
+        'super_entity_id', 'sub_entity_id', 'time', 'was_activated')
+
+    # Copy the states since they are updated in place by the sweeps
+    entities = {
+        t: set(state[None])
+        for t, state in _sweep_from_checkpoints(
+            e_events, EntityActivationCheckpoint.objects.values_list('entity_id'), [time], grouped=False)
+    }[time]
+    sub_entities = {
+        t: dict(state)
+        for t, state in _sweep_from_checkpoints(
+            er_events, EntityRelationshipActivationCheckpoint.objects.values_list('super_entity_id', 'sub_entity_id'),
+            [time])
+    }[time]
+
+    checkpoint = HistoryCheckpoint.objects.create(time=time)
+    EntityActivationCheckpoint.objects.bulk_create([
+        EntityActivationCheckpoint(checkpoint=checkpoint, entity_id=entity_id)
+        for entity_id in entities
+    ])
+    EntityRelationshipActivationCheckpoint.objects.bulk_create([
+        EntityRelationshipActivationCheckpoint(
+            checkpoint=checkpoint, super_entity_id=se_id, sub_entity_id=sub_entity_id)
+        for se_id, sub_entity_ids in sub_entities.items()
+        for sub_entity_id in sub_entity_ids
+    ])
+
+    return checkpoint
+
+
+def create_history_checkpoints(interval, end_time=None):
+    """
+    Creates checkpoints at a regular interval after the latest checkpoint. The first checkpoint is created one
+    interval after the midnight before the first event if no checkpoints exist yet.
+
+    :param interval: A timedelta of the time between checkpoints
+    :param end_time: The datetime before which checkpoints are created. Defaults to the current time minus
+       CHECKPOINT_SETTLE_TIME so that events of transactions that have not yet committed are not missed. The end time
+       is capped at the time of the oldest change in the history queue so that checkpoints are never created past
+       changes that have not been drained yet
+    :returns: A list of the created HistoryCheckpoint objects
+    """
+    end_time = end_time or timezone.now() - CHECKPOINT_SETTLE_TIME
+    oldest_queued_time = get_oldest_queued_time()
+    if oldest_queued_time is not None:
+        end_time = min(end_time, oldest_queued_time)
+
+    last_checkpoint = HistoryCheckpoint.objects.order_by('-time').first()
+    if last_checkpoint is not None:
+        start_time = last_checkpoint.time
+    else:
+        first_event_times = [
+            time for time in (
+                EntityActivationEvent.objects.aggregate(time=Min('time'))['time'],
+                EntityRelationshipActivationEvent.objects.aggregate(time=Min('time'))['time'],
+            )
+            if time is not None
+        ]
+        if not first_event_times:
+            return []
+        start_time = min(first_event_times).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    checkpoints = []
+    time = start_time + interval
+    while time <= end_time:
+        checkpoints.append(create_history_checkpoint(time))
+        time += interval
+
+    return checkpoints
+
+
+def create_history_rollup(end_day=None):
+    """
+    Rolls up the days on which entities and relationships were active from the activation intervals. Only the days
+    after the latest rollup are rolled up, along with the days of the entities and relationships that have events
+    which were written after the latest rollup but happened on days that were already rolled up.
+
+    :param end_day: The last day that is rolled up. Defaults to the last day that ended at least
+       CHECKPOINT_SETTLE_TIME ago so that events of transactions that have not yet committed are not missed
+    :returns: The created HistoryRollup
+    """
+    end_day = end_day or (timezone.now() - CHECKPOINT_SETTLE_TIME).date() - timedelta(days=1)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [ROLLUP_LOCK_KEY])
+
+        # The event ids are read before the days are rolled up so that events written in the meantime are checked by
+        # the next rollup
+        entity_event_id = EntityActivationEvent.objects.aggregate(id=Max('id'))['id'] or 0
+        relationship_event_id = EntityRelationshipActivationEvent.objects.aggregate(id=Max('id'))['id'] or 0
+
+        last_rollup = HistoryRollup.objects.order_by('-id').first()
+        if last_rollup is not None:
+            start_day = last_rollup.day + timedelta(days=1)
+            start_entity_event_id = last_rollup.entity_event_id
+            start_relationship_event_id = last_rollup.relationship_event_id
+        else:
+            first_event_times = [
+                time for time in (
+                    EntityActivationEvent.objects.aggregate(time=Min('time'))['time'],
+                    EntityRelationshipActivationEvent.objects.aggregate(time=Min('time'))['time'],
+                )
+                if time is not None
+            ]
+            start_day = min(first_event_times).date() if first_event_times else end_day + timedelta(days=1)
+            start_entity_event_id = start_relationship_event_id = 0
+
+        end_day = max(end_day, start_day - timedelta(days=1))
+        params = {'start_day': start_day, 'end_day': end_day}
+        params.update(start_event_id=start_entity_event_id, end_event_id=entity_event_id)
+        cursor.execute(get_sql('entity_activation_day_rollup.sql'), params)
+        params.update(start_event_id=start_relationship_event_id, end_event_id=relationship_event_id)
+        cursor.execute(get_sql('entity_relationship_activation_day_rollup.sql'), params)
+
+        return HistoryRollup.objects.create(
+            day=end_day, entity_event_id=entity_event_id, relationship_event_id=relationship_event_id)
+
+
+def _check_rolled_up(dates):
+    """
+    Raises a ValueError if any of the dates is after the last day of the latest rollup.
+    """
+    last_rollup = HistoryRollup.objects.order_by('-id').first()
+    if dates and (last_rollup is None or max(dates) > last_rollup.day):
+        raise ValueError('The history of {0} has not been rolled up'.format(max(dates)))
+
+
+def _check_events_attached():
+    """
+    Raises a ValueError if event partitions have been detached. Used by the queries that read every event of an
+    entity, which would silently leave out the history of the detached events.
+    """
+    end_time = DetachedEventPartition.objects.aggregate(end_time=Max('end_time'))['end_time']
+    if end_time is not None:
+        raise ValueError(
+            'The events before {0} were detached and can only be queried from history checkpoints'.format(end_time))
+
+
+def get_sub_entities_on_dates(super_entity_ids, dates, filter_by_entity_ids=None):
+    """
+    Looks up the sub entities of super entities on dates in the daily rollup. A sub entity is on a date if it was a sub
+    entity of the super entity at any time during the date.
+
+    :param super_entity_ids: An iterable of super entity ids
+    :param dates: An iterable of date objects that have been rolled up
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :returns: A dictionary keyed on (super_entity_id, date) tuples. Each key has a set of all entity ids that were sub
+       entities of the super entity during that date.
+    :raises ValueError: If a date is after the last day of the latest rollup
+    """
+    super_entity_ids = list(super_entity_ids)
+    dates = list(dates)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+    _check_rolled_up(dates)
+
+    ers = {
+        (se_id, d): set()
+        for se_id in super_entity_ids
+        for d in dates
+    }
+    if not super_entity_ids or not dates:
+        return ers
+
+    relationship_days = _filter_by_ids(
+        EntityRelationshipActivationDay.objects.filter(day__in=set(dates)), 'super_entity_id', super_entity_ids)
+    if filter_by_entity_ids is not None:
+        relationship_days = _filter_by_ids(relationship_days, 'sub_entity_id', filter_by_entity_ids)
+
+    for se_id, d, sub_entity_id in _stream_rows(
+            relationship_days.values_list('super_entity_id', 'day', 'sub_entity_id')):
+        ers[(se_id, d)].add(sub_entity_id)
+
+    return ers
+
+
+def get_entities_on_dates(dates, filter_by_entity_ids=None):
+    """
+    Looks up the entities that were active on dates in the daily rollup. An entity is active on a date if it was active
+    at any time during the date.
+
+    :param dates: An iterable of date objects that have been rolled up
+    :param filter_by_entity_ids: An iterable or a values list queryset of entity ids over which to filter the results
+    :returns: A dictionary keyed on date values. Each key has a set of all entity ids that were active during the date.
+    :raises ValueError: If a date is after the last day of the latest rollup
+    """
+    dates = list(dates)
+    filter_by_entity_ids = _get_filter_ids(filter_by_entity_ids)
+    _check_rolled_up(dates)
+
+    es = {
+        d: set()
+        for d in dates
+    }
+    if not dates:
+        return es
+
+    entity_days = EntityActivationDay.objects.filter(day__in=set(dates))
+    if filter_by_entity_ids is not None:
+        entity_days = _filter_by_ids(entity_days, 'entity_id', filter_by_entity_ids)
+
+    for d, entity_id in _stream_rows(entity_days.values_list('day', 'entity_id')):
+        es[d].add(entity_id)
 
     return es
 
 
 class EntityHistoryQuerySet(EntityQuerySet):
     """
-    A queryset that wraps around the get_sub_entities_at_times and get_entities_at_times functions.
+    A queryset that wraps around the get_sub_entities_at_times, get_super_entities_at_times and get_entities_at_times
+    functions along with their count variants. The queryset can also be filtered on the history of entities inside of
+    postgres.
     """
-    def get_sub_entities_at_times(self, super_entity_ids, times):
+    def as_of(self, time):
+        """
+        Filters the entities that were active at a point in time.
+
+        :raises ValueError: If event partitions have been detached
+        """
+        _check_events_attached()
+        return self.extra(where=[ACTIVE_AS_OF_SQL.format(entity_table=self.model._meta.db_table)], params=[time])
+
+    def sub_entities_of_as_of(self, super_entity_ids, time):
+        """
+        Filters the entities that were sub entities of any of the super entities at a point in time.
+
+        :raises ValueError: If event partitions have been detached
+        """
+        _check_events_attached()
+        return self.extra(
+            where=[SUB_ENTITY_AS_OF_SQL.format(entity_table=self.model._meta.db_table)],
+            params=[list(super_entity_ids), time])
+
+    def annotate_history(self, was_active_at=None, active_between=None, activation_times=False):
+        """
+        Annotates the entities with their history in the same query that selects the entities.
+
+        :param was_active_at: A datetime. Annotates was_active_at with True if the entity was active at the time
+        :param active_between: A (start_time, end_time) tuple. Annotates active_duration with a timedelta of the time
+           during which the entity was active between the start time and the end time
+        :param activation_times: True if first_activation_time and last_deactivation_time should be annotated with
+           the time at which the entity was first activated and the time at which it was last deactivated
+        :raises ValueError: If event partitions have been detached
+        """
+        _check_events_attached()
+        entity_table = self.model._meta.db_table
+        select = OrderedDict()
+        select_params = []
+
+        if was_active_at is not None:
+            select['was_active_at'] = WAS_ACTIVE_AT_SQL.format(entity_table=entity_table)
+            select_params.append(was_active_at)
+
+        if active_between is not None:
+            start_time, end_time = active_between
+            select['active_duration'] = ACTIVE_DURATION_SQL.format(entity_table=entity_table)
+            select_params.extend([end_time, start_time, end_time, start_time])
+
+        if activation_times:
+            select['first_activation_time'] = FIRST_ACTIVATION_TIME_SQL.format(entity_table=entity_table)
+            select['last_deactivation_time'] = LAST_DEACTIVATION_TIME_SQL.format(entity_table=entity_table)
+
+        return self.extra(select=select, select_params=select_params)
+
+    def _get_entity_filter(self):
+        """
+        Returns the entity ids over which to filter history queries. The ids are a lazy queryset that is compiled into
+        the history queries, and nothing is filtered when the queryset has no conditions.
+        """
+        if not self.query.where and self.query.can_filter():
+            return None
+        return self.values_list('id', flat=True)
+
+    def get_sub_entities_at_times(self, super_entity_ids, times, deltas=False, sparse=False):
         return get_sub_entities_at_times(
-            super_entity_ids, times, filter_by_entity_ids=self.values_list('id', flat=True))
+            super_entity_ids, times, filter_by_entity_ids=self._get_entity_filter(), deltas=deltas,
+            sparse=sparse)
+
+    def get_entities_at_times(self, times, deltas=False, sparse=False):
+        return get_entities_at_times(
+            times, filter_by_entity_ids=self._get_entity_filter(), deltas=deltas, sparse=sparse)
+
+    def get_sub_entities_at_pairs(self, pairs, sparse=False):
+        return get_sub_entities_at_pairs(pairs, filter_by_entity_ids=self._get_entity_filter(), sparse=sparse)
+
+    def get_super_entities_at_times(self, sub_entity_ids, times, sparse=False):
+        return get_super_entities_at_times(
+            sub_entity_ids, times, filter_by_super_entity_ids=self._get_entity_filter(), sparse=sparse)
+
+    def get_descendants_at_times(self, super_entity_ids, times, max_depth=None):
+        return get_descendants_at_times(
+            super_entity_ids, times, filter_by_entity_ids=self._get_entity_filter(), max_depth=max_depth)
+
+    def get_ancestors_at_times(self, sub_entity_ids, times, max_depth=None):
+        return get_ancestors_at_times(
+            sub_entity_ids, times, filter_by_super_entity_ids=self._get_entity_filter(), max_depth=max_depth)
+
+    def get_sub_entity_counts_at_times(self, super_entity_ids, times):
+        return get_sub_entity_counts_at_times(
+            super_entity_ids, times, filter_by_entity_ids=self._get_entity_filter())
+
+    def get_sub_entity_counts_in_range(self, super_entity_ids, start_time, end_time, step):
+        return get_sub_entity_counts_in_range(
+            super_entity_ids, start_time, end_time, step, filter_by_entity_ids=self._get_entity_filter())
+
+    def get_entity_counts_at_times(self, times):
+        return get_entity_counts_at_times(times, filter_by_entity_ids=self._get_entity_filter())
+
+    def get_entity_counts_in_range(self, start_time, end_time, step):
+        return get_entity_counts_in_range(
+            start_time, end_time, step, filter_by_entity_ids=self._get_entity_filter())
 
-    def get_entities_at_times(self, times):
-        return get_entities_at_times(times, filter_by_entity_ids=self.values_list('id', flat=True))
+    def get_sub_entities_on_dates(self, super_entity_ids, dates):
+        return get_sub_entities_on_dates(super_entity_ids, dates, filter_by_entity_ids=self._get_entity_filter())
+
+    def get_entities_on_dates(self, dates):
+        return get_entities_on_dates(dates, filter_by_entity_ids=self._get_entity_filter())
 
 
 class AllEntityHistoryManager(AllEntityManager):
     def get_queryset(self):
         return EntityHistoryQuerySet(self.model)
 
-    def get_sub_entities_at_times(self, super_entity_ids, times):
-        return self.get_queryset().get_sub_entities_at_times(super_entity_ids, times)
+    def as_of(self, time):
+        return self.get_queryset().as_of(time)
+
+    def sub_entities_of_as_of(self, super_entity_ids, time):
+        return self.get_queryset().sub_entities_of_as_of(super_entity_ids, time)
+
+    def annotate_history(self, was_active_at=None, active_between=None, activation_times=False):
+        return self.get_queryset().annotate_history(
+            was_active_at=was_active_at, active_between=active_between, activation_times=activation_times)
+
+    def get_sub_entities_at_times(self, super_entity_ids, times, deltas=False, sparse=False):
+        return self.get_queryset().get_sub_entities_at_times(super_entity_ids, times, deltas=deltas, sparse=sparse)
+
+    def get_entities_at_times(self, times, deltas=False, sparse=False):
+        return self.get_queryset().get_entities_at_times(times, deltas=deltas, sparse=sparse)
+
+    def get_sub_entities_at_pairs(self, pairs, sparse=False):
+        return self.get_queryset().get_sub_entities_at_pairs(pairs, sparse=sparse)
+
+    def get_super_entities_at_times(self, sub_entity_ids, times, sparse=False):
+        return self.get_queryset().get_super_entities_at_times(sub_entity_ids, times, sparse=sparse)
+
+    def get_descendants_at_times(self, super_entity_ids, times, max_depth=None):
+        return self.get_queryset().get_descendants_at_times(super_entity_ids, times, max_depth=max_depth)
+
+    def get_ancestors_at_times(self, sub_entity_ids, times, max_depth=None):
+        return self.get_queryset().get_ancestors_at_times(sub_entity_ids, times, max_depth=max_depth)
+
+    def get_sub_entity_counts_at_times(self, super_entity_ids, times):
+        return self.get_queryset().get_sub_entity_counts_at_times(super_entity_ids, times)
+
+    def get_sub_entity_counts_in_range(self, super_entity_ids, start_time, end_time, step):
+        return self.get_queryset().get_sub_entity_counts_in_range(super_entity_ids, start_time, end_time, step)
+
+    def get_entity_counts_at_times(self, times):
+        return self.get_queryset().get_entity_counts_at_times(times)
+
+    def get_entity_counts_in_range(self, start_time, end_time, step):
+        return self.get_queryset().get_entity_counts_in_range(start_time, end_time, step)
+
+    def get_sub_entities_on_dates(self, super_entity_ids, dates):
+        return self.get_queryset().get_sub_entities_on_dates(super_entity_ids, dates)
 
-    def get_entities_at_times(self, times):
-        return self.get_queryset().get_entities_at_times(times)
+    def get_entities_on_dates(self, dates):
+        return self.get_queryset().get_entities_on_dates(dates)
 
 
 class ActiveEntityHistoryManager(AllEntityHistoryManager):
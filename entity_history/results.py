@@ -0,0 +1,129 @@
+from bisect import bisect_left
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+
+class EntityDeltas(object):
+    """
+    The entity ids at sorted points in time, encoded as the entity ids at the first time followed by the entity ids
+    that were added and removed at every later time. Only the times at which the entity ids changed store any ids,
+    which uses much less memory than a full set of entity ids at every time.
+    """
+    def __init__(self):
+        # The times in ascending order
+        self.times = []
+        # The entity ids at the first time
+        self.initial = set()
+        # Dictionaries keyed on the later times at which entity ids were added or removed
+        self.added = {}
+        self.removed = {}
+        # The entity ids at the last time, which are diffed against the entity ids at the next time
+        self._last = set()
+
+    def append(self, time, entity_ids):
+        """
+        Appends the entity ids at a time that is after all of the previous times.
+        """
+        entity_ids = set(entity_ids)
+        if not self.times:
+            self.initial = set(entity_ids)
+        else:
+            added = entity_ids - self._last
+            removed = self._last - entity_ids
+            if added:
+                self.added[time] = added
+            if removed:
+                self.removed[time] = removed
+
+        self.times.append(time)
+        self._last = entity_ids
+
+    def iter_entities(self):
+        """
+        Yields (time, entity_ids) tuples in ascending order of time. Every time has its own set of entity ids.
+        """
+        entity_ids = set(self.initial)
+        for index, t in enumerate(self.times):
+            if index:
+                entity_ids |= self.added.get(t, set())
+                entity_ids -= self.removed.get(t, set())
+            yield t, set(entity_ids)
+
+    def get_entities_at_time(self, time):
+        """
+        Materializes the set of entity ids at one of the times.
+
+        :raises KeyError: If the time is not one of the times
+        """
+        index = bisect_left(self.times, time)
+        if index == len(self.times) or self.times[index] != time:
+            raise KeyError(time)
+
+        entity_ids = set(self.initial)
+        for t in self.times[1:index + 1]:
+            entity_ids |= self.added.get(t, set())
+            entity_ids -= self.removed.get(t, set())
+        return entity_ids
+
+
+class EntityMatrix(object):
+    """
+    The entity ids at sorted points in time, stored as a dense boolean numpy matrix with a row for every entity and a
+    column for every time. The matrix of sub entities has a row for every relationship of a super entity and a sub
+    entity instead.
+    """
+    def __init__(self, times, entity_ids, active, super_entity_ids=None):
+        # The times of the columns in ascending order
+        self.times = times
+        # Numpy arrays of the entity ids and the super entity ids of the rows
+        self.entity_ids = entity_ids
+        self.super_entity_ids = super_entity_ids
+        # A boolean numpy array that is true where the entity of a row was active at the time of a column
+        self.active = active
+
+    def get_entities_at_time(self, time, super_entity_id=None):
+        """
+        Returns the set of entity ids that were active at one of the times. The entity ids of the matrix of sub
+        entities are restricted to the sub entities of a super entity if one is provided.
+
+        :raises KeyError: If the time is not one of the times
+        """
+        index = bisect_left(self.times, time)
+        if index == len(self.times) or self.times[index] != time:
+            raise KeyError(time)
+
+        active = self.active[:, index]
+        if super_entity_id is not None:
+            active = active & (self.super_entity_ids == super_entity_id)
+        return set(self.entity_ids[active].tolist())
+
+
+class SparseEntityResults(Mapping):
+    """
+    The results of a historical query that only stores the keys that have entity ids. Keys without any entity ids are
+    not part of the mapping, and getting them with get returns an empty frozenset instead of None.
+    """
+    def __init__(self):
+        self._results = {}
+
+    def add(self, key, entity_ids):
+        """
+        Adds entity ids to a key. The key is only stored if there are any entity ids.
+        """
+        if entity_ids:
+            self._results.setdefault(key, set()).update(entity_ids)
+
+    def get(self, key, default=frozenset()):
+        return self._results.get(key, default)
+
+    def __getitem__(self, key):
+        return self._results[key]
+
+    def __iter__(self):
+        return iter(self._results)
+
+    def __len__(self):
+        return len(self._results)
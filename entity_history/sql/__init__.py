@@ -0,0 +1,7 @@
+from os.path import dirname
+
+
+def get_sql(name):
+    return open(
+        dirname(__file__) + '/' + name
+    ).read()
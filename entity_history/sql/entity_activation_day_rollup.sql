@@ -0,0 +1,95 @@
+-----------------------------------------------------------------
+-- Remove the rolled up days of entities that have events which
+-- were written after the previous rollup but happened on days
+-- that were already rolled up
+-----------------------------------------------------------------
+WITH late_entities AS (
+    SELECT
+        entity_id,
+        MIN(time)::date AS start_day
+    FROM
+        entity_history_entityactivationevent
+    WHERE
+        id > %(start_event_id)s
+    AND
+        id <= %(end_event_id)s
+    AND
+        time < %(start_day)s::date
+    GROUP BY
+        entity_id
+)
+DELETE FROM
+    entity_history_entityactivationday activation_day
+USING
+    late_entities
+WHERE
+    activation_day.entity_id = late_entities.entity_id
+AND
+    activation_day.day >= late_entities.start_day;
+
+-----------------------------------------------------------------
+-- Roll up the removed days again from the activation intervals
+-- of the entities
+-----------------------------------------------------------------
+WITH late_entities AS (
+    SELECT
+        entity_id,
+        MIN(time)::date AS start_day
+    FROM
+        entity_history_entityactivationevent
+    WHERE
+        id > %(start_event_id)s
+    AND
+        id <= %(end_event_id)s
+    AND
+        time < %(start_day)s::date
+    GROUP BY
+        entity_id
+)
+INSERT INTO entity_history_entityactivationday(
+    entity_id,
+    day
+)
+SELECT
+    activation_interval.entity_id,
+    days.day::date
+FROM
+    late_entities
+JOIN
+    entity_history_entityactivationinterval activation_interval
+ON
+    activation_interval.entity_id = late_entities.entity_id
+CROSS JOIN LATERAL
+    GENERATE_SERIES(
+        GREATEST(activation_interval.start_time::date, late_entities.start_day)::timestamp,
+        LEAST(activation_interval.end_time::date, %(start_day)s::date - 1)::timestamp,
+        '1 day'
+    ) days(day)
+WHERE
+    activation_interval.end_time IS NULL OR activation_interval.end_time > activation_interval.start_time
+ON CONFLICT DO NOTHING;
+
+-----------------------------------------------------------------
+-- Roll up the new days from the activation intervals that
+-- overlap them. An entity is active on every day from the day of
+-- its activation through the day of its deactivation
+-----------------------------------------------------------------
+INSERT INTO entity_history_entityactivationday(
+    entity_id,
+    day
+)
+SELECT
+    activation_interval.entity_id,
+    days.day::date
+FROM
+    entity_history_entityactivationinterval activation_interval
+CROSS JOIN LATERAL
+    GENERATE_SERIES(
+        GREATEST(activation_interval.start_time::date, %(start_day)s::date)::timestamp,
+        LEAST(activation_interval.end_time::date, %(end_day)s::date)::timestamp,
+        '1 day'
+    ) days(day)
+WHERE
+    TSTZRANGE(activation_interval.start_time, activation_interval.end_time, '(]') &&
+    TSTZRANGE(%(start_day)s::date, %(end_day)s::date + 1, '[)')
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,36 @@
+DELETE FROM entity_history_entityactivationinterval;
+
+-----------------------------------------------------------------
+-- An interval starts at every event that activates an entity
+-- and ends at the next event that deactivates the entity
+-----------------------------------------------------------------
+INSERT INTO entity_history_entityactivationinterval(
+    entity_id,
+    start_time,
+    end_time
+)
+SELECT
+    entity_id,
+    time,
+    next_time
+FROM (
+    SELECT
+        entity_id,
+        time,
+        was_activated,
+        LEAD(time) OVER (PARTITION BY entity_id ORDER BY time, id) AS next_time
+    FROM (
+        SELECT
+            id,
+            entity_id,
+            time,
+            was_activated,
+            LAG(was_activated, 1, FALSE) OVER (PARTITION BY entity_id ORDER BY time, id) AS was_previously_activated
+        FROM
+            entity_history_entityactivationevent
+    ) events
+    WHERE
+        was_activated IS DISTINCT FROM was_previously_activated
+) transitions
+WHERE
+    was_activated;
@@ -1,15 +1,15 @@
 CREATE OR REPLACE FUNCTION update_entity_activation_history() RETURNS trigger AS $body$
 DECLARE
     row RECORD;
-    last_history_row RECORD;
     last_history_row_was_activated BOOL;
+    event_time TIMESTAMP;
 BEGIN
     -----------------------------------------------------------------
     -- Default values
     -----------------------------------------------------------------
     last_history_row_was_activated = FALSE;
-    last_history_row = NULL;
     row = NULL;
+    event_time = CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp);
 
     -----------------------------------------------------------------
     -- Get the row
@@ -21,26 +21,20 @@ BEGIN
     END IF;
 
     -----------------------------------------------------------------
-    -- Get the last history row that exists
+    -- Get what the last history row was_activated flag was from the
+    -- current state of the entity
     -----------------------------------------------------------------
     SELECT
-        *
+        was_activated
     INTO
-        last_history_row
+        last_history_row_was_activated
     FROM
-        entity_history_entityactivationevent
+        entity_history_entityactivationstate
     WHERE
-        entity_id = row.id
-    ORDER BY
-        time DESC
-    LIMIT
-        1;
+        entity_id = row.id;
 
-    -----------------------------------------------------------------
-    -- Compute what the last history row was_activated flag was
-    -----------------------------------------------------------------
-    IF last_history_row IS NOT NULL THEN
-        last_history_row_was_activated = last_history_row.was_activated;
+    IF last_history_row_was_activated IS NULL THEN
+        last_history_row_was_activated = FALSE;
     END IF;
 
     -----------------------------------------------------------------
@@ -54,10 +48,37 @@ BEGIN
         )
         VALUES (
             NEW.id,
-            CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+            event_time,
             NEW.is_active
         );
 
+        INSERT INTO entity_history_entityactivationstate(
+            entity_id,
+            time,
+            was_activated
+        )
+        VALUES (
+            NEW.id,
+            event_time,
+            NEW.is_active
+        )
+        ON CONFLICT (entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated;
+
+        IF NEW.is_active IS TRUE THEN
+            INSERT INTO entity_history_entityactivationinterval(
+                entity_id,
+                start_time,
+                end_time
+            )
+            VALUES (
+                NEW.id,
+                event_time,
+                NULL
+            );
+        END IF;
+
     -----------------------------------------------------------------
     -- Handle when an entity was activated
     -----------------------------------------------------------------
@@ -69,10 +90,35 @@ BEGIN
         )
         VALUES (
             NEW.id,
-            CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+            event_time,
             TRUE
         );
 
+        INSERT INTO entity_history_entityactivationstate(
+            entity_id,
+            time,
+            was_activated
+        )
+        VALUES (
+            NEW.id,
+            event_time,
+            TRUE
+        )
+        ON CONFLICT (entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated;
+
+        INSERT INTO entity_history_entityactivationinterval(
+            entity_id,
+            start_time,
+            end_time
+        )
+        VALUES (
+            NEW.id,
+            event_time,
+            NULL
+        );
+
     -----------------------------------------------------------------
     -- Handle when an entity was deactivated
     -----------------------------------------------------------------
@@ -84,10 +130,33 @@ BEGIN
         )
         VALUES (
             NEW.id,
-            CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+            event_time,
             FALSE
         );
 
+        INSERT INTO entity_history_entityactivationstate(
+            entity_id,
+            time,
+            was_activated
+        )
+        VALUES (
+            NEW.id,
+            event_time,
+            FALSE
+        )
+        ON CONFLICT (entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated;
+
+        UPDATE
+            entity_history_entityactivationinterval
+        SET
+            end_time = event_time
+        WHERE
+            entity_id = NEW.id
+        AND
+            end_time IS NULL;
+
     -- End the if
     END IF;
 
@@ -0,0 +1,134 @@
+-----------------------------------------------------------------
+-- Remove a batch of the oldest queued changes of entities
+-----------------------------------------------------------------
+WITH batch AS (
+    DELETE FROM
+        entity_history_entityactivationqueueitem
+    WHERE
+        id IN (
+            SELECT
+                id
+            FROM
+                entity_history_entityactivationqueueitem
+            ORDER BY
+                id
+            LIMIT
+                %(batch_size)s
+        )
+    RETURNING
+        id,
+        entity_id,
+        time,
+        is_active,
+        was_created
+-----------------------------------------------------------------
+-- Compare every change to the previous change of the entity in
+-- the batch or to the current state of the entity. Changes of
+-- entities that have since been deleted are dropped
+-----------------------------------------------------------------
+), changes AS (
+    SELECT
+        batch.id,
+        batch.entity_id,
+        batch.time,
+        batch.is_active,
+        batch.was_created,
+        LAG(batch.is_active) OVER (PARTITION BY batch.entity_id ORDER BY batch.id) AS previous_is_active,
+        current_state.was_activated AS current_was_activated
+    FROM
+        batch
+    JOIN
+        entity_entity
+    ON
+        entity_entity.id = batch.entity_id
+    LEFT OUTER JOIN
+        entity_history_entityactivationstate current_state
+    ON
+        current_state.entity_id = batch.entity_id
+), events AS (
+    SELECT
+        id,
+        entity_id,
+        time,
+        is_active AS was_activated,
+        LEAD(time) OVER (PARTITION BY entity_id ORDER BY id) AS next_time,
+        ROW_NUMBER() OVER (PARTITION BY entity_id ORDER BY id) AS position
+    FROM
+        changes
+    WHERE
+        was_created
+    OR
+        is_active IS DISTINCT FROM COALESCE(previous_is_active, current_was_activated, FALSE)
+), inserted_events AS (
+    INSERT INTO entity_history_entityactivationevent(
+        entity_id,
+        time,
+        was_activated
+    )
+    SELECT
+        entity_id,
+        time,
+        was_activated
+    FROM
+        events
+    ORDER BY
+        id
+-----------------------------------------------------------------
+-- The latest event of every entity is its new current state
+-----------------------------------------------------------------
+), updated_states AS (
+    INSERT INTO entity_history_entityactivationstate(
+        entity_id,
+        time,
+        was_activated
+    )
+    SELECT
+        entity_id,
+        time,
+        was_activated
+    FROM
+        events
+    WHERE
+        next_time IS NULL
+    ON CONFLICT (entity_id) DO UPDATE SET
+        time = EXCLUDED.time,
+        was_activated = EXCLUDED.was_activated
+-----------------------------------------------------------------
+-- Only the first event of an entity in the batch can close an
+-- interval that was opened before the batch. Intervals opened
+-- in the batch end at the next event of the entity
+-----------------------------------------------------------------
+), closed_intervals AS (
+    UPDATE
+        entity_history_entityactivationinterval
+    SET
+        end_time = events.time
+    FROM
+        events
+    WHERE
+        entity_history_entityactivationinterval.entity_id = events.entity_id
+    AND
+        entity_history_entityactivationinterval.end_time IS NULL
+    AND
+        events.position = 1
+    AND
+        events.was_activated IS FALSE
+), inserted_intervals AS (
+    INSERT INTO entity_history_entityactivationinterval(
+        entity_id,
+        start_time,
+        end_time
+    )
+    SELECT
+        entity_id,
+        time,
+        next_time
+    FROM
+        events
+    WHERE
+        was_activated IS TRUE
+)
+SELECT
+    COUNT(*)
+FROM
+    batch;
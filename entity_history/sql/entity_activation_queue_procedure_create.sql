@@ -0,0 +1,23 @@
+CREATE OR REPLACE FUNCTION queue_entity_activation_history() RETURNS trigger AS $body$
+BEGIN
+    -----------------------------------------------------------------
+    -- Only queue the change. The history of the entity is computed
+    -- from the queue when it is drained
+    -----------------------------------------------------------------
+    INSERT INTO entity_history_entityactivationqueueitem(
+        entity_id,
+        time,
+        is_active,
+        was_created
+    )
+    VALUES (
+        NEW.id,
+        CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+        NEW.is_active,
+        TG_OP = 'INSERT'
+    );
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
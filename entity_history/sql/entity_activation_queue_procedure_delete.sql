@@ -0,0 +1 @@
+DROP FUNCTION IF EXISTS queue_entity_activation_history();
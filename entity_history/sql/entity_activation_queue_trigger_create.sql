@@ -0,0 +1,14 @@
+DROP TRIGGER IF EXISTS queue_entity_activation_history_insert ON entity_entity;
+CREATE TRIGGER queue_entity_activation_history_insert
+AFTER INSERT
+ON entity_entity
+FOR EACH ROW EXECUTE PROCEDURE queue_entity_activation_history();
+
+-- Updates that do not change the activation of an entity are never queued
+DROP TRIGGER IF EXISTS queue_entity_activation_history_update ON entity_entity;
+CREATE TRIGGER queue_entity_activation_history_update
+AFTER UPDATE OF is_active
+ON entity_entity
+FOR EACH ROW
+WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active)
+EXECUTE PROCEDURE queue_entity_activation_history();
@@ -0,0 +1,2 @@
+DROP TRIGGER IF EXISTS queue_entity_activation_history_insert ON entity_entity;
+DROP TRIGGER IF EXISTS queue_entity_activation_history_update ON entity_entity;
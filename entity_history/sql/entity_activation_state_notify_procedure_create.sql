@@ -0,0 +1,24 @@
+CREATE OR REPLACE FUNCTION notify_entity_activation_state() RETURNS trigger AS $body$
+BEGIN
+    -----------------------------------------------------------------
+    -- Notify the new current state of the entity. An entity whose
+    -- state was deleted is no longer active
+    -----------------------------------------------------------------
+    IF (TG_OP = 'DELETE') THEN
+        PERFORM pg_notify('entity_history_entity', json_build_object(
+            'entity_id', OLD.entity_id,
+            'time', TO_CHAR(OLD.time, 'YYYY-MM-DD HH24:MI:SS.US'),
+            'was_activated', FALSE
+        )::text);
+    ELSE
+        PERFORM pg_notify('entity_history_entity', json_build_object(
+            'entity_id', NEW.entity_id,
+            'time', TO_CHAR(NEW.time, 'YYYY-MM-DD HH24:MI:SS.US'),
+            'was_activated', NEW.was_activated
+        )::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
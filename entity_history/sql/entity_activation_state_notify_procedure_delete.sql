@@ -0,0 +1 @@
+DROP FUNCTION IF EXISTS notify_entity_activation_state();
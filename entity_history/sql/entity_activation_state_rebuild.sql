@@ -0,0 +1,20 @@
+DELETE FROM entity_history_entityactivationstate;
+
+-----------------------------------------------------------------
+-- The current state of an entity is its latest event
+-----------------------------------------------------------------
+INSERT INTO entity_history_entityactivationstate(
+    entity_id,
+    time,
+    was_activated
+)
+SELECT DISTINCT ON (entity_id)
+    entity_id,
+    time,
+    was_activated
+FROM
+    entity_history_entityactivationevent
+ORDER BY
+    entity_id,
+    time DESC,
+    id DESC;
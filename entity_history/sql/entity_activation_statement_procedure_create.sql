@@ -0,0 +1,87 @@
+CREATE OR REPLACE FUNCTION update_entity_activation_history_statement() RETURNS trigger AS $body$
+DECLARE
+    event_time TIMESTAMP;
+BEGIN
+    -----------------------------------------------------------------
+    -- Default values
+    -----------------------------------------------------------------
+    event_time = CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp);
+
+    -----------------------------------------------------------------
+    -- Compute the history of every changed entity at once. Every
+    -- created entity has an event. Updated entities only have an
+    -- event when they differ from their current state
+    -----------------------------------------------------------------
+    WITH changed_entities AS (
+        SELECT
+            new_entities.id AS entity_id,
+            new_entities.is_active AS was_activated
+        FROM
+            new_entities
+        LEFT OUTER JOIN
+            entity_history_entityactivationstate current_state
+        ON
+            current_state.entity_id = new_entities.id
+        WHERE
+            TG_OP = 'INSERT'
+        OR
+            new_entities.is_active IS DISTINCT FROM COALESCE(current_state.was_activated, FALSE)
+    ), inserted_events AS (
+        INSERT INTO entity_history_entityactivationevent(
+            entity_id,
+            time,
+            was_activated
+        )
+        SELECT
+            entity_id,
+            event_time,
+            was_activated
+        FROM
+            changed_entities
+    ), updated_states AS (
+        INSERT INTO entity_history_entityactivationstate(
+            entity_id,
+            time,
+            was_activated
+        )
+        SELECT
+            entity_id,
+            event_time,
+            was_activated
+        FROM
+            changed_entities
+        ON CONFLICT (entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated
+    ), closed_intervals AS (
+        UPDATE
+            entity_history_entityactivationinterval
+        SET
+            end_time = event_time
+        FROM
+            changed_entities
+        WHERE
+            entity_history_entityactivationinterval.entity_id = changed_entities.entity_id
+        AND
+            entity_history_entityactivationinterval.end_time IS NULL
+        AND
+            changed_entities.was_activated IS FALSE
+    )
+    INSERT INTO entity_history_entityactivationinterval(
+        entity_id,
+        start_time,
+        end_time
+    )
+    SELECT
+        entity_id,
+        event_time,
+        NULL
+    FROM
+        changed_entities
+    WHERE
+        was_activated IS TRUE;
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
@@ -0,0 +1 @@
+DROP FUNCTION IF EXISTS update_entity_activation_history_statement();
@@ -0,0 +1,15 @@
+DROP TRIGGER IF EXISTS update_entity_activation_history_insert ON entity_entity;
+CREATE TRIGGER update_entity_activation_history_insert
+AFTER INSERT
+ON entity_entity
+REFERENCING NEW TABLE AS new_entities
+FOR EACH STATEMENT EXECUTE PROCEDURE update_entity_activation_history_statement();
+
+-- Transition tables cannot be used with a column list, so every update is handled and
+-- entities whose activation did not change are filtered out by the procedure
+DROP TRIGGER IF EXISTS update_entity_activation_history_update ON entity_entity;
+CREATE TRIGGER update_entity_activation_history_update
+AFTER UPDATE
+ON entity_entity
+REFERENCING NEW TABLE AS new_entities
+FOR EACH STATEMENT EXECUTE PROCEDURE update_entity_activation_history_statement();
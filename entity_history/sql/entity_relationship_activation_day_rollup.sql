@@ -0,0 +1,106 @@
+-----------------------------------------------------------------
+-- Remove the rolled up days of relationships that have events
+-- which were written after the previous rollup but happened on
+-- days that were already rolled up
+-----------------------------------------------------------------
+WITH late_relationships AS (
+    SELECT
+        super_entity_id,
+        sub_entity_id,
+        MIN(time)::date AS start_day
+    FROM
+        entity_history_entityrelationshipactivationevent
+    WHERE
+        id > %(start_event_id)s
+    AND
+        id <= %(end_event_id)s
+    AND
+        time < %(start_day)s::date
+    GROUP BY
+        super_entity_id,
+        sub_entity_id
+)
+DELETE FROM
+    entity_history_entityrelationshipactivationday relationship_day
+USING
+    late_relationships
+WHERE
+    relationship_day.super_entity_id = late_relationships.super_entity_id
+AND
+    relationship_day.sub_entity_id = late_relationships.sub_entity_id
+AND
+    relationship_day.day >= late_relationships.start_day;
+
+-----------------------------------------------------------------
+-- Roll up the removed days again from the intervals of the
+-- relationships
+-----------------------------------------------------------------
+WITH late_relationships AS (
+    SELECT
+        super_entity_id,
+        sub_entity_id,
+        MIN(time)::date AS start_day
+    FROM
+        entity_history_entityrelationshipactivationevent
+    WHERE
+        id > %(start_event_id)s
+    AND
+        id <= %(end_event_id)s
+    AND
+        time < %(start_day)s::date
+    GROUP BY
+        super_entity_id,
+        sub_entity_id
+)
+INSERT INTO entity_history_entityrelationshipactivationday(
+    super_entity_id,
+    sub_entity_id,
+    day
+)
+SELECT
+    relationship_interval.super_entity_id,
+    relationship_interval.sub_entity_id,
+    days.day::date
+FROM
+    late_relationships
+JOIN
+    entity_history_entityrelationshipinterval relationship_interval
+ON
+    relationship_interval.super_entity_id = late_relationships.super_entity_id
+AND
+    relationship_interval.sub_entity_id = late_relationships.sub_entity_id
+CROSS JOIN LATERAL
+    GENERATE_SERIES(
+        GREATEST(relationship_interval.start_time::date, late_relationships.start_day)::timestamp,
+        LEAST(relationship_interval.end_time::date, %(start_day)s::date - 1)::timestamp,
+        '1 day'
+    ) days(day)
+WHERE
+    relationship_interval.end_time IS NULL OR relationship_interval.end_time > relationship_interval.start_time
+ON CONFLICT DO NOTHING;
+
+-----------------------------------------------------------------
+-- Roll up the new days from the relationship intervals that
+-- overlap them
+-----------------------------------------------------------------
+INSERT INTO entity_history_entityrelationshipactivationday(
+    super_entity_id,
+    sub_entity_id,
+    day
+)
+SELECT
+    relationship_interval.super_entity_id,
+    relationship_interval.sub_entity_id,
+    days.day::date
+FROM
+    entity_history_entityrelationshipinterval relationship_interval
+CROSS JOIN LATERAL
+    GENERATE_SERIES(
+        GREATEST(relationship_interval.start_time::date, %(start_day)s::date)::timestamp,
+        LEAST(relationship_interval.end_time::date, %(end_day)s::date)::timestamp,
+        '1 day'
+    ) days(day)
+WHERE
+    TSTZRANGE(relationship_interval.start_time, relationship_interval.end_time, '(]') &&
+    TSTZRANGE(%(start_day)s::date, %(end_day)s::date + 1, '[)')
+ON CONFLICT DO NOTHING;
@@ -1,15 +1,15 @@
 CREATE OR REPLACE FUNCTION update_entity_relationship_activation_history() RETURNS trigger AS $body$
 DECLARE
     row RECORD;
-    last_history_row RECORD;
     last_history_row_was_activated BOOL;
+    event_time TIMESTAMP;
 BEGIN
     -----------------------------------------------------------------
     -- Default values
     -----------------------------------------------------------------
     last_history_row_was_activated = FALSE;
-    last_history_row = NULL;
     row = NULL;
+    event_time = CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp);
 
     -----------------------------------------------------------------
     -- Get the row
@@ -21,28 +21,22 @@ BEGIN
     END IF;
 
     -----------------------------------------------------------------
-    -- Get the last history row that exists
+    -- Get what the last history row was_activated flag was from the
+    -- current state of the relationship
     -----------------------------------------------------------------
     SELECT
-        *
+        was_activated
     INTO
-        last_history_row
+        last_history_row_was_activated
     FROM
-        entity_history_entityrelationshipactivationevent
+        entity_history_entityrelationshipactivationstate
     WHERE
         sub_entity_id = row.sub_entity_id
     AND
-        super_entity_id = row.super_entity_id
-    ORDER BY
-        time DESC
-    LIMIT
-        1;
+        super_entity_id = row.super_entity_id;
 
-    -----------------------------------------------------------------
-    -- Compute what the last history row was_activated flag was
-    -----------------------------------------------------------------
-    IF last_history_row IS NOT NULL THEN
-        last_history_row_was_activated = last_history_row.was_activated;
+    IF last_history_row_was_activated IS NULL THEN
+        last_history_row_was_activated = FALSE;
     END IF;
 
     ----------------------------------------------------------------------------------------------------
@@ -58,9 +52,38 @@ BEGIN
         VALUES (
             NEW.sub_entity_id,
             NEW.super_entity_id,
-            CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+            event_time,
             TRUE
         );
+
+        INSERT INTO entity_history_entityrelationshipactivationstate(
+            sub_entity_id,
+            super_entity_id,
+            time,
+            was_activated
+        )
+        VALUES (
+            NEW.sub_entity_id,
+            NEW.super_entity_id,
+            event_time,
+            TRUE
+        )
+        ON CONFLICT (super_entity_id, sub_entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated;
+
+        INSERT INTO entity_history_entityrelationshipinterval(
+            sub_entity_id,
+            super_entity_id,
+            start_time,
+            end_time
+        )
+        VALUES (
+            NEW.sub_entity_id,
+            NEW.super_entity_id,
+            event_time,
+            NULL
+        );
     END IF;
 
     ----------------------------------------------------------------------------------------------------
@@ -76,9 +99,36 @@ BEGIN
         VALUES (
             OLD.sub_entity_id,
             OLD.super_entity_id,
-            CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+            event_time,
             FALSE
         );
+
+        INSERT INTO entity_history_entityrelationshipactivationstate(
+            sub_entity_id,
+            super_entity_id,
+            time,
+            was_activated
+        )
+        VALUES (
+            OLD.sub_entity_id,
+            OLD.super_entity_id,
+            event_time,
+            FALSE
+        )
+        ON CONFLICT (super_entity_id, sub_entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated;
+
+        UPDATE
+            entity_history_entityrelationshipinterval
+        SET
+            end_time = event_time
+        WHERE
+            sub_entity_id = OLD.sub_entity_id
+        AND
+            super_entity_id = OLD.super_entity_id
+        AND
+            end_time IS NULL;
     END IF;
     RETURN NEW;
 END;
@@ -0,0 +1,150 @@
+-----------------------------------------------------------------
+-- Remove a batch of the oldest queued changes of relationships
+-----------------------------------------------------------------
+WITH batch AS (
+    DELETE FROM
+        entity_history_entityrelationshipactivationqueueitem
+    WHERE
+        id IN (
+            SELECT
+                id
+            FROM
+                entity_history_entityrelationshipactivationqueueitem
+            ORDER BY
+                id
+            LIMIT
+                %(batch_size)s
+        )
+    RETURNING
+        id,
+        super_entity_id,
+        sub_entity_id,
+        time,
+        was_activated
+-----------------------------------------------------------------
+-- Compare every change to the previous change of the relationship
+-- in the batch or to the current state of the relationship.
+-- Changes of relationships between entities that have since been
+-- deleted are dropped
+-----------------------------------------------------------------
+), changes AS (
+    SELECT
+        batch.id,
+        batch.super_entity_id,
+        batch.sub_entity_id,
+        batch.time,
+        batch.was_activated,
+        LAG(batch.was_activated) OVER (
+            PARTITION BY batch.super_entity_id, batch.sub_entity_id ORDER BY batch.id
+        ) AS previous_was_activated,
+        current_state.was_activated AS current_was_activated
+    FROM
+        batch
+    JOIN
+        entity_entity super_entity
+    ON
+        super_entity.id = batch.super_entity_id
+    JOIN
+        entity_entity sub_entity
+    ON
+        sub_entity.id = batch.sub_entity_id
+    LEFT OUTER JOIN
+        entity_history_entityrelationshipactivationstate current_state
+    ON
+        current_state.super_entity_id = batch.super_entity_id
+    AND
+        current_state.sub_entity_id = batch.sub_entity_id
+), events AS (
+    SELECT
+        id,
+        super_entity_id,
+        sub_entity_id,
+        time,
+        was_activated,
+        LEAD(time) OVER (PARTITION BY super_entity_id, sub_entity_id ORDER BY id) AS next_time,
+        ROW_NUMBER() OVER (PARTITION BY super_entity_id, sub_entity_id ORDER BY id) AS position
+    FROM
+        changes
+    WHERE
+        was_activated IS DISTINCT FROM COALESCE(previous_was_activated, current_was_activated, FALSE)
+), inserted_events AS (
+    INSERT INTO entity_history_entityrelationshipactivationevent(
+        sub_entity_id,
+        super_entity_id,
+        time,
+        was_activated
+    )
+    SELECT
+        sub_entity_id,
+        super_entity_id,
+        time,
+        was_activated
+    FROM
+        events
+    ORDER BY
+        id
+-----------------------------------------------------------------
+-- The latest event of every relationship is its new current state
+-----------------------------------------------------------------
+), updated_states AS (
+    INSERT INTO entity_history_entityrelationshipactivationstate(
+        sub_entity_id,
+        super_entity_id,
+        time,
+        was_activated
+    )
+    SELECT
+        sub_entity_id,
+        super_entity_id,
+        time,
+        was_activated
+    FROM
+        events
+    WHERE
+        next_time IS NULL
+    ON CONFLICT (super_entity_id, sub_entity_id) DO UPDATE SET
+        time = EXCLUDED.time,
+        was_activated = EXCLUDED.was_activated
+-----------------------------------------------------------------
+-- Only the first event of a relationship in the batch can close
+-- an interval that was opened before the batch. Intervals opened
+-- in the batch end at the next event of the relationship
+-----------------------------------------------------------------
+), closed_intervals AS (
+    UPDATE
+        entity_history_entityrelationshipinterval
+    SET
+        end_time = events.time
+    FROM
+        events
+    WHERE
+        entity_history_entityrelationshipinterval.super_entity_id = events.super_entity_id
+    AND
+        entity_history_entityrelationshipinterval.sub_entity_id = events.sub_entity_id
+    AND
+        entity_history_entityrelationshipinterval.end_time IS NULL
+    AND
+        events.position = 1
+    AND
+        events.was_activated IS FALSE
+), inserted_intervals AS (
+    INSERT INTO entity_history_entityrelationshipinterval(
+        sub_entity_id,
+        super_entity_id,
+        start_time,
+        end_time
+    )
+    SELECT
+        sub_entity_id,
+        super_entity_id,
+        time,
+        next_time
+    FROM
+        events
+    WHERE
+        was_activated IS TRUE
+)
+SELECT
+    COUNT(*)
+FROM
+    batch;
@@ -0,0 +1,34 @@
+CREATE OR REPLACE FUNCTION queue_entity_relationship_activation_history() RETURNS trigger AS $body$
+DECLARE
+    row RECORD;
+BEGIN
+    -----------------------------------------------------------------
+    -- Get the row
+    -----------------------------------------------------------------
+    IF (TG_OP = 'INSERT') THEN
+        row = NEW;
+    ELSE
+        row = OLD;
+    END IF;
+
+    -----------------------------------------------------------------
+    -- Only queue the change. The history of the relationship is
+    -- computed from the queue when it is drained
+    -----------------------------------------------------------------
+    INSERT INTO entity_history_entityrelationshipactivationqueueitem(
+        sub_entity_id,
+        super_entity_id,
+        time,
+        was_activated
+    )
+    VALUES (
+        row.sub_entity_id,
+        row.super_entity_id,
+        CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp),
+        TG_OP = 'INSERT'
+    );
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
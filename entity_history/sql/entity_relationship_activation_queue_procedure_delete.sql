@@ -0,0 +1 @@
+DROP FUNCTION IF EXISTS queue_entity_relationship_activation_history();
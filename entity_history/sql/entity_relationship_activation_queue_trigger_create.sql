@@ -0,0 +1,5 @@
+DROP TRIGGER IF EXISTS queue_entity_relationship_activation_history ON entity_entityrelationship;
+CREATE TRIGGER queue_entity_relationship_activation_history
+AFTER INSERT OR DELETE
+ON entity_entityrelationship
+FOR EACH ROW EXECUTE PROCEDURE queue_entity_relationship_activation_history();
@@ -0,0 +1 @@
+DROP TRIGGER IF EXISTS queue_entity_relationship_activation_history ON entity_entityrelationship;
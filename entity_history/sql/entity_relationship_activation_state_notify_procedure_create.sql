@@ -0,0 +1,26 @@
+CREATE OR REPLACE FUNCTION notify_entity_relationship_activation_state() RETURNS trigger AS $body$
+BEGIN
+    -----------------------------------------------------------------
+    -- Notify the new current state of the relationship. A
+    -- relationship whose state was deleted is no longer active
+    -----------------------------------------------------------------
+    IF (TG_OP = 'DELETE') THEN
+        PERFORM pg_notify('entity_history_relationship', json_build_object(
+            'super_entity_id', OLD.super_entity_id,
+            'sub_entity_id', OLD.sub_entity_id,
+            'time', TO_CHAR(OLD.time, 'YYYY-MM-DD HH24:MI:SS.US'),
+            'was_activated', FALSE
+        )::text);
+    ELSE
+        PERFORM pg_notify('entity_history_relationship', json_build_object(
+            'super_entity_id', NEW.super_entity_id,
+            'sub_entity_id', NEW.sub_entity_id,
+            'time', TO_CHAR(NEW.time, 'YYYY-MM-DD HH24:MI:SS.US'),
+            'was_activated', NEW.was_activated
+        )::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
@@ -0,0 +1 @@
+DROP FUNCTION IF EXISTS notify_entity_relationship_activation_state();
@@ -0,0 +1,5 @@
+DROP TRIGGER IF EXISTS notify_entity_relationship_activation_state ON entity_history_entityrelationshipactivationstate;
+CREATE TRIGGER notify_entity_relationship_activation_state
+AFTER INSERT OR UPDATE OR DELETE
+ON entity_history_entityrelationshipactivationstate
+FOR EACH ROW EXECUTE PROCEDURE notify_entity_relationship_activation_state();
@@ -0,0 +1 @@
+DROP TRIGGER IF EXISTS notify_entity_relationship_activation_state ON entity_history_entityrelationshipactivationstate;
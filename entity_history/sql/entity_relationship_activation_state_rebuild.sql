@@ -0,0 +1,23 @@
+DELETE FROM entity_history_entityrelationshipactivationstate;
+
+-----------------------------------------------------------------
+-- The current state of a relationship is its latest event
+-----------------------------------------------------------------
+INSERT INTO entity_history_entityrelationshipactivationstate(
+    sub_entity_id,
+    super_entity_id,
+    time,
+    was_activated
+)
+SELECT DISTINCT ON (super_entity_id, sub_entity_id)
+    sub_entity_id,
+    super_entity_id,
+    time,
+    was_activated
+FROM
+    entity_history_entityrelationshipactivationevent
+ORDER BY
+    super_entity_id,
+    sub_entity_id,
+    time DESC,
+    id DESC;
@@ -0,0 +1,132 @@
+CREATE OR REPLACE FUNCTION update_entity_relationship_activation_history_statement() RETURNS trigger AS $body$
+DECLARE
+    event_time TIMESTAMP;
+BEGIN
+    -----------------------------------------------------------------
+    -- Default values
+    -----------------------------------------------------------------
+    event_time = CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp);
+
+    -----------------------------------------------------------------
+    -- Compute the history of every changed relationship at once. The
+    -- transition table holds the created relationships on inserts and
+    -- the removed relationships on deletes. Relationships only have an
+    -- event when they differ from their current state
+    -----------------------------------------------------------------
+    WITH changed_relationships AS (
+        SELECT DISTINCT
+            transition_relationships.sub_entity_id,
+            transition_relationships.super_entity_id,
+            TG_OP = 'INSERT' AS was_activated
+        FROM
+            transition_relationships
+        LEFT OUTER JOIN
+            entity_history_entityrelationshipactivationstate current_state
+        ON
+            current_state.sub_entity_id = transition_relationships.sub_entity_id
+        AND
+            current_state.super_entity_id = transition_relationships.super_entity_id
+        WHERE
+            COALESCE(current_state.was_activated, FALSE) IS DISTINCT FROM (TG_OP = 'INSERT')
+    ), inserted_events AS (
+        INSERT INTO entity_history_entityrelationshipactivationevent(
+            sub_entity_id,
+            super_entity_id,
+            time,
+            was_activated
+        )
+        SELECT
+            sub_entity_id,
+            super_entity_id,
+            event_time,
+            was_activated
+        FROM
+            changed_relationships
+    ), updated_states AS (
+        INSERT INTO entity_history_entityrelationshipactivationstate(
+            sub_entity_id,
+            super_entity_id,
+            time,
+            was_activated
+        )
+        SELECT
+            sub_entity_id,
+            super_entity_id,
+            event_time,
+            was_activated
+        FROM
+            changed_relationships
+        ON CONFLICT (super_entity_id, sub_entity_id) DO UPDATE SET
+            time = EXCLUDED.time,
+            was_activated = EXCLUDED.was_activated
+    ), closed_intervals AS (
+        UPDATE
+            entity_history_entityrelationshipinterval
+        SET
+            end_time = event_time
+        FROM
+            changed_relationships
+        WHERE
+            entity_history_entityrelationshipinterval.sub_entity_id = changed_relationships.sub_entity_id
+        AND
+            entity_history_entityrelationshipinterval.super_entity_id = changed_relationships.super_entity_id
+        AND
+            entity_history_entityrelationshipinterval.end_time IS NULL
+        AND
+            changed_relationships.was_activated IS FALSE
+    )
+    INSERT INTO entity_history_entityrelationshipinterval(
+        sub_entity_id,
+        super_entity_id,
+        start_time,
+        end_time
+    )
+    SELECT
+        sub_entity_id,
+        super_entity_id,
+        event_time,
+        NULL
+    FROM
+        changed_relationships
+    WHERE
+        was_activated IS TRUE;
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
+
+CREATE OR REPLACE FUNCTION delete_entity_relationship_activation_history_statement() RETURNS trigger AS $body$
+BEGIN
+    -----------------------------------------------------------------
+    -- Statement level triggers cannot be deferred, so the removal of
+    -- relationships that are deleted by a cascaded delete of an
+    -- entity is recorded before the entity is deleted. The entity is
+    -- no longer present, so the history of its relationships is
+    -- removed with it
+    -----------------------------------------------------------------
+    DELETE FROM
+        entity_history_entityrelationshipactivationevent
+    WHERE
+        sub_entity_id IN (SELECT id FROM deleted_entities)
+    OR
+        super_entity_id IN (SELECT id FROM deleted_entities);
+
+    DELETE FROM
+        entity_history_entityrelationshipactivationstate
+    WHERE
+        sub_entity_id IN (SELECT id FROM deleted_entities)
+    OR
+        super_entity_id IN (SELECT id FROM deleted_entities);
+
+    DELETE FROM
+        entity_history_entityrelationshipinterval
+    WHERE
+        sub_entity_id IN (SELECT id FROM deleted_entities)
+    OR
+        super_entity_id IN (SELECT id FROM deleted_entities);
+
+    RETURN NULL;
+END;
+$body$
+LANGUAGE plpgsql VOLATILE;
@@ -0,0 +1,2 @@
+DROP FUNCTION IF EXISTS update_entity_relationship_activation_history_statement();
+DROP FUNCTION IF EXISTS delete_entity_relationship_activation_history_statement();
@@ -0,0 +1,20 @@
+DROP TRIGGER IF EXISTS update_entity_relationship_activation_history_insert ON entity_entityrelationship;
+CREATE TRIGGER update_entity_relationship_activation_history_insert
+AFTER INSERT
+ON entity_entityrelationship
+REFERENCING NEW TABLE AS transition_relationships
+FOR EACH STATEMENT EXECUTE PROCEDURE update_entity_relationship_activation_history_statement();
+
+DROP TRIGGER IF EXISTS update_entity_relationship_activation_history_delete ON entity_entityrelationship;
+CREATE TRIGGER update_entity_relationship_activation_history_delete
+AFTER DELETE
+ON entity_entityrelationship
+REFERENCING OLD TABLE AS transition_relationships
+FOR EACH STATEMENT EXECUTE PROCEDURE update_entity_relationship_activation_history_statement();
+
+DROP TRIGGER IF EXISTS delete_entity_relationship_activation_history ON entity_entity;
+CREATE TRIGGER delete_entity_relationship_activation_history
+AFTER DELETE
+ON entity_entity
+REFERENCING OLD TABLE AS deleted_entities
+FOR EACH STATEMENT EXECUTE PROCEDURE delete_entity_relationship_activation_history_statement();
@@ -0,0 +1,3 @@
+DROP TRIGGER IF EXISTS update_entity_relationship_activation_history_insert ON entity_entityrelationship;
+DROP TRIGGER IF EXISTS update_entity_relationship_activation_history_delete ON entity_entityrelationship;
+DROP TRIGGER IF EXISTS delete_entity_relationship_activation_history ON entity_entity;
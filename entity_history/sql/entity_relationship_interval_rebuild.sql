@@ -0,0 +1,42 @@
+DELETE FROM entity_history_entityrelationshipinterval;
+
+-----------------------------------------------------------------
+-- An interval starts at every event that activates a
+-- relationship and ends at the next event that deactivates it
+-----------------------------------------------------------------
+INSERT INTO entity_history_entityrelationshipinterval(
+    sub_entity_id,
+    super_entity_id,
+    start_time,
+    end_time
+)
+SELECT
+    sub_entity_id,
+    super_entity_id,
+    time,
+    next_time
+FROM (
+    SELECT
+        sub_entity_id,
+        super_entity_id,
+        time,
+        was_activated,
+        LEAD(time) OVER (PARTITION BY super_entity_id, sub_entity_id ORDER BY time, id) AS next_time
+    FROM (
+        SELECT
+            id,
+            sub_entity_id,
+            super_entity_id,
+            time,
+            was_activated,
+            LAG(was_activated, 1, FALSE) OVER (
+                PARTITION BY super_entity_id, sub_entity_id ORDER BY time, id
+            ) AS was_previously_activated
+        FROM
+            entity_history_entityrelationshipactivationevent
+    ) events
+    WHERE
+        was_activated IS DISTINCT FROM was_previously_activated
+) transitions
+WHERE
+    was_activated;
@@ -0,0 +1,16 @@
+SELECT
+    child.relname,
+    SUBSTRING(pg_get_expr(child.relpartbound, child.oid) FROM 'FROM \(''([^'']*)''\)')::timestamptz AS start_time,
+    SUBSTRING(pg_get_expr(child.relpartbound, child.oid) FROM 'TO \(''([^'']*)''\)')::timestamptz AS end_time
+FROM
+    pg_inherits
+JOIN
+    pg_class child
+ON
+    child.oid = pg_inherits.inhrelid
+WHERE
+    pg_inherits.inhparent = %(table)s::regclass
+AND
+    pg_get_expr(child.relpartbound, child.oid) <> 'DEFAULT'
+ORDER BY
+    start_time
@@ -0,0 +1,19 @@
+from django.db import connection
+
+from entity_history.sql import get_sql
+
+
+def rebuild_entity_activation_intervals():
+    """
+    Rebuilds all of the entity activation intervals from the entity activation events.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(get_sql('entity_activation_interval_rebuild.sql'))
+
+
+def rebuild_entity_relationship_intervals():
+    """
+    Rebuilds all of the entity relationship intervals from the entity relationship activation events.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(get_sql('entity_relationship_interval_rebuild.sql'))
@@ -0,0 +1,204 @@
+"""
+Conversion of the event tables into tables that are range partitioned on the time of the events. Partitioning is
+opt-in. Each partition covers one interval of the ENTITY_HISTORY_PARTITION_INTERVAL setting, and events that do not
+fall into any partition are stored in a default partition of the table.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from entity_history.models import DetachedEventPartition, HistoryCheckpoint
+from entity_history.sql import get_sql
+
+
+EVENT_TABLES = (
+    'entity_history_entityactivationevent',
+    'entity_history_entityrelationshipactivationevent',
+)
+
+# The intervals that can be covered by a single partition
+PARTITION_INTERVALS = ('day', 'week', 'month', 'year')
+
+# Declarative partitioning with indexes and foreign keys on the partitioned table requires postgres 11
+MINIMUM_SERVER_VERSION = 110000
+
+
+def get_partition_interval():
+    """
+    Returns the interval covered by a partition, which is configured by the ENTITY_HISTORY_PARTITION_INTERVAL
+    setting. Partitions cover a month by default.
+    """
+    interval = getattr(settings, 'ENTITY_HISTORY_PARTITION_INTERVAL', 'month')
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError('Unsupported partition interval {0}'.format(interval))
+    return interval
+
+
+def _check_server_version(cursor):
+    cursor.execute('SHOW server_version_num')
+    if int(cursor.fetchone()[0]) < MINIMUM_SERVER_VERSION:
+        raise Exception('Partitioning the event tables requires postgres server version {0} or later'.format(
+            MINIMUM_SERVER_VERSION))
+
+
+def _is_partitioned(cursor, table):
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [table])
+    return cursor.fetchone()[0] == 'p'
+
+
+def _get_partitions(cursor, table):
+    cursor.execute(get_sql('event_partitions.sql'), {'table': table})
+    return cursor.fetchall()
+
+
+def _create_partition(cursor, table, start_time, end_time):
+    """
+    Creates the partition of a table that covers a range of time. Events in the range that were stored in the default
+    partition are moved into the new partition before it is attached.
+    """
+    partition = '{0}_p{1}'.format(table, start_time.strftime('%Y%m%d'))
+    params = [start_time, end_time]
+
+    cursor.execute('CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS)'.format(partition, table))
+    cursor.execute(
+        'INSERT INTO {0} SELECT * FROM {1}_default WHERE time >= %s AND time < %s'.format(partition, table), params)
+    cursor.execute('DELETE FROM {0}_default WHERE time >= %s AND time < %s'.format(table), params)
+    cursor.execute('ALTER TABLE {0} ATTACH PARTITION {1} FOR VALUES FROM (%s) TO (%s)'.format(table, partition), params)
+    return partition
+
+
+def _create_partitions(cursor, table, ahead, source_table=None):
+    """
+    Creates the partitions of a table after its latest partition, up to the given number of intervals past the
+    current time. The first partition of a table starts at the interval of the earliest event in the source table.
+    """
+    interval = get_partition_interval()
+    partitions = _get_partitions(cursor, table)
+    if partitions:
+        start_time = partitions[-1][2]
+    else:
+        cursor.execute('SELECT COALESCE(MIN(time), NOW()) FROM {0}'.format(source_table or table))
+        start_time = cursor.fetchone()[0]
+
+    cursor.execute(
+        '''
+        SELECT start_time, start_time + %(interval)s::interval
+        FROM GENERATE_SERIES(
+            DATE_TRUNC(%(unit)s, %(start_time)s::timestamptz),
+            DATE_TRUNC(%(unit)s, NOW()) + %(ahead)s * %(interval)s::interval,
+            %(interval)s::interval
+        ) AS start_time
+        WHERE start_time >= %(start_time)s::timestamptz OR %(first)s
+        ''',
+        {'unit': interval, 'interval': '1 {0}'.format(interval), 'start_time': start_time, 'ahead': ahead,
+         'first': not partitions})
+
+    return [_create_partition(cursor, table, start, end) for start, end in cursor.fetchall()]
+
+
+def _rebuild_table(cursor, table, partitioned, ahead=0):
+    """
+    Rebuilds a table as either a partitioned or a regular table. The rows, the id sequence, the indexes and the
+    foreign keys of the table are carried over to the rebuilt table. The partitions of a partitioned table are created
+    before the rows are copied so that the rows are only written once.
+    """
+    cursor.execute(
+        'SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary',
+        [table])
+    indexes = [index.replace(' ON ONLY ', ' ON ') for index, in cursor.fetchall()]
+    cursor.execute(
+        'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = %s',
+        [table, 'f'])
+    foreign_keys = cursor.fetchall()
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute('ALTER TABLE {0} RENAME TO {0}_rebuild'.format(table))
+    if partitioned:
+        cursor.execute('CREATE TABLE {0} (LIKE {0}_rebuild INCLUDING DEFAULTS) PARTITION BY RANGE (time)'.format(table))
+        cursor.execute('CREATE TABLE {0}_default PARTITION OF {0} DEFAULT'.format(table))
+        partitions = _create_partitions(cursor, table, ahead, '{0}_rebuild'.format(table))
+    else:
+        cursor.execute('CREATE TABLE {0} (LIKE {0}_rebuild INCLUDING DEFAULTS)'.format(table))
+        partitions = []
+
+    cursor.execute('INSERT INTO {0} SELECT * FROM {0}_rebuild'.format(table))
+    cursor.execute('ALTER SEQUENCE {0} OWNED BY {1}.id'.format(sequence, table))
+    cursor.execute('DROP TABLE {0}_rebuild'.format(table))
+
+    # The primary key of a partitioned table has to include the partition key
+    cursor.execute('ALTER TABLE {0} ADD PRIMARY KEY ({1})'.format(table, 'id, time' if partitioned else 'id'))
+    for index in indexes:
+        cursor.execute(index)
+    for name, foreign_key in foreign_keys:
+        cursor.execute('ALTER TABLE {0} ADD CONSTRAINT {1} {2}'.format(table, name, foreign_key))
+
+    return partitions
+
+
+@transaction.atomic
+def partition_event_tables(ahead=3):
+    """
+    Converts the event tables into partitioned tables if they are not partitioned yet and creates their partitions
+    up to a number of intervals past the current time. This should be run periodically so that partitions always
+    exist for new events.
+
+    :param ahead: The number of partitions to create past the current time
+    :returns: The names of the partitions that were created
+    """
+    partitions = []
+    with connection.cursor() as cursor:
+        _check_server_version(cursor)
+        for table in EVENT_TABLES:
+            if _is_partitioned(cursor, table):
+                partitions.extend(_create_partitions(cursor, table, ahead))
+            else:
+                partitions.extend(_rebuild_table(cursor, table, partitioned=True, ahead=ahead))
+
+    return partitions
+
+
+@transaction.atomic
+def unpartition_event_tables():
+    """
+    Converts partitioned event tables back into regular tables.
+    """
+    with connection.cursor() as cursor:
+        for table in EVENT_TABLES:
+            if _is_partitioned(cursor, table):
+                _rebuild_table(cursor, table, partitioned=False)
+
+
+@transaction.atomic
+def detach_event_partitions(before, drop=False):
+    """
+    Detaches the partitions of the event tables that only contain events before a time. Detaching a partition does
+    not touch any of its rows, which makes it a cheap way to remove old history. A history checkpoint at or after the
+    time has to exist so that the history after the checkpoint can still be resolved by the python and sql engines.
+
+    The detached partitions are recorded. The as_of, sub_entities_of_as_of and annotate_history queryset methods and
+    the matrices read every event instead of starting from a checkpoint, so they raise an error once partitions have
+    been detached.
+
+    :param before: The time before which partitions are detached
+    :param drop: True if the detached partitions should also be dropped
+    :returns: The names of the partitions that were detached
+    :raises ValueError: If there are partitions to detach and no history checkpoint exists at or after the time
+    """
+    with connection.cursor() as cursor:
+        partitions = [
+            (table, partition, end_time)
+            for table in EVENT_TABLES if _is_partitioned(cursor, table)
+            for partition, start_time, end_time in _get_partitions(cursor, table) if end_time <= before
+        ]
+
+        if partitions and not HistoryCheckpoint.objects.filter(time__gte=before).exists():
+            raise ValueError('A history checkpoint at or after {0} is required to detach event partitions'.format(
+                before))
+
+        for table, partition, end_time in partitions:
+            cursor.execute('ALTER TABLE {0} DETACH PARTITION {1}'.format(table, partition))
+            if drop:
+                cursor.execute('DROP TABLE {0}'.format(partition))
+            DetachedEventPartition.objects.create(name=partition, end_time=end_time)
+
+    return [partition for _, partition, _ in partitions]
@@ -0,0 +1,838 @@
+"""
+Queries that resolve historical entity states inside of postgres. Each query unnests the requested times along with
+their one-based positions and returns the position of the time with every entity that was active at that time, in
+ascending order of the positions. The states are either resolved from the latest event before each time or by probing
+the activation intervals. The event queries start from the members of the latest history checkpoint at or before each
+time, which are ordered before the events, and only read the events that happened after the checkpoint. The latest
+events are found with a separate DISTINCT ON over the events before every time, so the cost of the event queries grows
+with the number of times multiplied by the number of events since the checkpoints. They are meant for a small number of
+times, and the python engine or the interval queries are cheaper for many times. Queries over the events are also
+bounded by the latest requested time, which is a constant that lets the planner prune the partitions of partitioned
+event tables. The pair queries unnest (super entity id, time) pairs instead of every combination of super entity ids and
+times. The super entity queries look up the relationships of sub entities instead of super entities.
+
+The related entity queries walk the relationships of entities recursively to resolve their descendants or ancestors.
+Every step of the walk looks up the relationships of the entities that were reached by the previous step, and entities
+that are already on the path from the root are skipped so that cycles end the walk.
+
+The as of conditions are correlated subqueries on the entity table that are added to the where clauses of entity
+querysets. They keep the entities whose latest event before a time activated them. The history annotations are
+correlated subqueries that are selected along with the entities. Every event starts a period that lasts until the
+next event of the entity, and the active duration of an entity sums its active periods inside of a window.
+
+The count queries return the number of entities that were active at each time instead of the entities themselves.
+Every event is turned into a +1 / -1 change of the count when it changes the state of its entity, and the counts are
+running sums of the changes. The members of the latest checkpoint at or before the earliest time are turned into
+activations that happen before every event, and only the events after the checkpoint are read.
+"""
+import re
+
+from django.db.models.sql.datastructures import EmptyResultSet
+
+
+ENTITIES_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    last_event.entity_id
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+LEFT JOIN LATERAL (
+    SELECT
+        id,
+        time
+    FROM
+        entity_history_historycheckpoint
+    WHERE
+        time <= requested.time
+    ORDER BY
+        time DESC
+    LIMIT 1
+) checkpoint ON TRUE
+CROSS JOIN LATERAL (
+    SELECT DISTINCT ON (entity_id)
+        entity_id,
+        was_activated
+    FROM (
+        SELECT
+            entity_id,
+            NULL::timestamptz AS time,
+            NULL::integer AS id,
+            TRUE AS was_activated
+        FROM
+            entity_history_entityactivationcheckpoint
+        WHERE
+            checkpoint_id = checkpoint.id
+            {entity_filter}
+        UNION ALL
+        SELECT
+            entity_id,
+            time,
+            id,
+            was_activated
+        FROM
+            entity_history_entityactivationevent
+        WHERE
+            time >= COALESCE(checkpoint.time, '-infinity')
+        AND
+            time < requested.time
+        AND
+            time < %(max_time)s::timestamptz
+            {entity_filter}
+    ) member_event
+    ORDER BY
+        entity_id DESC,
+        time DESC NULLS LAST,
+        id DESC NULLS LAST
+) last_event
+WHERE
+    last_event.was_activated
+ORDER BY
+    requested.position
+'''
+
+SUB_ENTITIES_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    super_entity.id,
+    last_event.sub_entity_id
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+LEFT JOIN LATERAL (
+    SELECT
+        id,
+        time
+    FROM
+        entity_history_historycheckpoint
+    WHERE
+        time <= requested.time
+    ORDER BY
+        time DESC
+    LIMIT 1
+) checkpoint ON TRUE
+CROSS JOIN
+    UNNEST(%(super_entity_ids)s::integer[]) AS super_entity(id)
+CROSS JOIN LATERAL (
+    SELECT DISTINCT ON (sub_entity_id)
+        sub_entity_id,
+        was_activated
+    FROM (
+        SELECT
+            sub_entity_id,
+            NULL::timestamptz AS time,
+            NULL::integer AS id,
+            TRUE AS was_activated
+        FROM
+            entity_history_entityrelationshipactivationcheckpoint
+        WHERE
+            checkpoint_id = checkpoint.id
+        AND
+            super_entity_id = super_entity.id
+            {entity_filter}
+        UNION ALL
+        SELECT
+            sub_entity_id,
+            time,
+            id,
+            was_activated
+        FROM
+            entity_history_entityrelationshipactivationevent
+        WHERE
+            super_entity_id = super_entity.id
+        AND
+            time >= COALESCE(checkpoint.time, '-infinity')
+        AND
+            time < requested.time
+        AND
+            time < %(max_time)s::timestamptz
+            {entity_filter}
+    ) member_event
+    ORDER BY
+        sub_entity_id DESC,
+        time DESC NULLS LAST,
+        id DESC NULLS LAST
+) last_event
+WHERE
+    last_event.was_activated
+ORDER BY
+    requested.position
+'''
+
+ENTITIES_IN_INTERVALS_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    activation_interval.entity_id
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+JOIN
+    entity_history_entityactivationinterval activation_interval
+ON
+    TSTZRANGE(activation_interval.start_time, activation_interval.end_time, '(]') @> requested.time
+    {entity_filter}
+ORDER BY
+    requested.position
+'''
+
+SUB_ENTITIES_IN_INTERVALS_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    relationship_interval.super_entity_id,
+    relationship_interval.sub_entity_id
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+JOIN
+    entity_history_entityrelationshipinterval relationship_interval
+ON
+    TSTZRANGE(relationship_interval.start_time, relationship_interval.end_time, '(]') @> requested.time
+AND
+    relationship_interval.super_entity_id = ANY(%(super_entity_ids)s::integer[])
+    {entity_filter}
+ORDER BY
+    requested.position
+'''
+
+
+SUB_ENTITIES_AT_PAIRS_SQL = '''
+SELECT
+    requested.position,
+    last_event.sub_entity_id
+FROM
+    UNNEST(%(super_entity_ids)s::integer[], %(times)s::timestamptz[])
+        WITH ORDINALITY AS requested(super_entity_id, time, position)
+LEFT JOIN LATERAL (
+    SELECT
+        id,
+        time
+    FROM
+        entity_history_historycheckpoint
+    WHERE
+        time <= requested.time
+    ORDER BY
+        time DESC
+    LIMIT 1
+) checkpoint ON TRUE
+CROSS JOIN LATERAL (
+    SELECT DISTINCT ON (sub_entity_id)
+        sub_entity_id,
+        was_activated
+    FROM (
+        SELECT
+            sub_entity_id,
+            NULL::timestamptz AS time,
+            NULL::integer AS id,
+            TRUE AS was_activated
+        FROM
+            entity_history_entityrelationshipactivationcheckpoint
+        WHERE
+            checkpoint_id = checkpoint.id
+        AND
+            super_entity_id = requested.super_entity_id
+            {entity_filter}
+        UNION ALL
+        SELECT
+            sub_entity_id,
+            time,
+            id,
+            was_activated
+        FROM
+            entity_history_entityrelationshipactivationevent
+        WHERE
+            super_entity_id = requested.super_entity_id
+        AND
+            time >= COALESCE(checkpoint.time, '-infinity')
+        AND
+            time < requested.time
+        AND
+            time < %(max_time)s::timestamptz
+            {entity_filter}
+    ) member_event
+    ORDER BY
+        sub_entity_id DESC,
+        time DESC NULLS LAST,
+        id DESC NULLS LAST
+) last_event
+WHERE
+    last_event.was_activated
+ORDER BY
+    requested.position
+'''
+
+SUB_ENTITIES_IN_INTERVALS_AT_PAIRS_SQL = '''
+SELECT
+    requested.position,
+    relationship_interval.sub_entity_id
+FROM
+    UNNEST(%(super_entity_ids)s::integer[], %(times)s::timestamptz[])
+        WITH ORDINALITY AS requested(super_entity_id, time, position)
+JOIN
+    entity_history_entityrelationshipinterval relationship_interval
+ON
+    relationship_interval.super_entity_id = requested.super_entity_id
+AND
+    TSTZRANGE(relationship_interval.start_time, relationship_interval.end_time, '(]') @> requested.time
+    {entity_filter}
+ORDER BY
+    requested.position
+'''
+
+SUPER_ENTITIES_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    sub_entity.id,
+    last_event.super_entity_id
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+LEFT JOIN LATERAL (
+    SELECT
+        id,
+        time
+    FROM
+        entity_history_historycheckpoint
+    WHERE
+        time <= requested.time
+    ORDER BY
+        time DESC
+    LIMIT 1
+) checkpoint ON TRUE
+CROSS JOIN
+    UNNEST(%(sub_entity_ids)s::integer[]) AS sub_entity(id)
+CROSS JOIN LATERAL (
+    SELECT DISTINCT ON (super_entity_id)
+        super_entity_id,
+        was_activated
+    FROM (
+        SELECT
+            super_entity_id,
+            NULL::timestamptz AS time,
+            NULL::integer AS id,
+            TRUE AS was_activated
+        FROM
+            entity_history_entityrelationshipactivationcheckpoint
+        WHERE
+            checkpoint_id = checkpoint.id
+        AND
+            sub_entity_id = sub_entity.id
+            {entity_filter}
+        UNION ALL
+        SELECT
+            super_entity_id,
+            time,
+            id,
+            was_activated
+        FROM
+            entity_history_entityrelationshipactivationevent
+        WHERE
+            sub_entity_id = sub_entity.id
+        AND
+            time >= COALESCE(checkpoint.time, '-infinity')
+        AND
+            time < requested.time
+        AND
+            time < %(max_time)s::timestamptz
+            {entity_filter}
+    ) member_event
+    ORDER BY
+        super_entity_id DESC,
+        time DESC NULLS LAST,
+        id DESC NULLS LAST
+) last_event
+WHERE
+    last_event.was_activated
+ORDER BY
+    requested.position
+'''
+
+SUPER_ENTITIES_IN_INTERVALS_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    relationship_interval.sub_entity_id,
+    relationship_interval.super_entity_id
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+JOIN
+    entity_history_entityrelationshipinterval relationship_interval
+ON
+    TSTZRANGE(relationship_interval.start_time, relationship_interval.end_time, '(]') @> requested.time
+AND
+    relationship_interval.sub_entity_id = ANY(%(sub_entity_ids)s::integer[])
+    {entity_filter}
+ORDER BY
+    requested.position
+'''
+
+RELATED_ENTITIES_AT_TIMES_SQL = '''
+WITH RECURSIVE related(position, time, checkpoint_id, checkpoint_time, root_id, entity_id, depth, path) AS (
+    SELECT
+        requested.position,
+        requested.time,
+        checkpoint.id,
+        checkpoint.time,
+        root.id,
+        root.id,
+        0,
+        ARRAY[root.id]
+    FROM
+        UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+    LEFT JOIN LATERAL (
+        SELECT
+            id,
+            time
+        FROM
+            entity_history_historycheckpoint
+        WHERE
+            time <= requested.time
+        ORDER BY
+            time DESC
+        LIMIT 1
+    ) checkpoint ON TRUE
+    CROSS JOIN
+        UNNEST(%(entity_ids)s::integer[]) AS root(id)
+UNION ALL
+    SELECT
+        related.position,
+        related.time,
+        related.checkpoint_id,
+        related.checkpoint_time,
+        related.root_id,
+        last_event.{to_column},
+        related.depth + 1,
+        related.path || last_event.{to_column}
+    FROM
+        related
+    CROSS JOIN LATERAL (
+        SELECT DISTINCT ON ({to_column})
+            {to_column},
+            was_activated
+        FROM (
+            SELECT
+                {to_column},
+                NULL::timestamptz AS time,
+                NULL::integer AS id,
+                TRUE AS was_activated
+            FROM
+                entity_history_entityrelationshipactivationcheckpoint
+            WHERE
+                checkpoint_id = related.checkpoint_id
+            AND
+                {from_column} = related.entity_id
+            UNION ALL
+            SELECT
+                {to_column},
+                time,
+                id,
+                was_activated
+            FROM
+                entity_history_entityrelationshipactivationevent
+            WHERE
+                {from_column} = related.entity_id
+            AND
+                time >= COALESCE(related.checkpoint_time, '-infinity')
+            AND
+                time < related.time
+            AND
+                time < %(max_time)s::timestamptz
+        ) member_event
+        ORDER BY
+            {to_column} DESC,
+            time DESC NULLS LAST,
+            id DESC NULLS LAST
+    ) last_event
+    WHERE
+        last_event.was_activated
+    AND
+        NOT last_event.{to_column} = ANY(related.path)
+    AND
+        (%(max_depth)s::integer IS NULL OR related.depth < %(max_depth)s::integer)
+)
+SELECT DISTINCT
+    related.position,
+    related.root_id,
+    related.entity_id
+FROM
+    related
+WHERE
+    related.depth > 0
+    {entity_filter}
+ORDER BY
+    related.position
+'''
+
+RELATED_ENTITIES_IN_INTERVALS_AT_TIMES_SQL = '''
+WITH RECURSIVE related(position, time, root_id, entity_id, depth, path) AS (
+    SELECT
+        requested.position,
+        requested.time,
+        root.id,
+        root.id,
+        0,
+        ARRAY[root.id]
+    FROM
+        UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+    CROSS JOIN
+        UNNEST(%(entity_ids)s::integer[]) AS root(id)
+UNION ALL
+    SELECT
+        related.position,
+        related.time,
+        related.root_id,
+        relationship_interval.{to_column},
+        related.depth + 1,
+        related.path || relationship_interval.{to_column}
+    FROM
+        related
+    JOIN
+        entity_history_entityrelationshipinterval relationship_interval
+    ON
+        relationship_interval.{from_column} = related.entity_id
+    AND
+        TSTZRANGE(relationship_interval.start_time, relationship_interval.end_time, '(]') @> related.time
+    WHERE
+        NOT relationship_interval.{to_column} = ANY(related.path)
+    AND
+        (%(max_depth)s::integer IS NULL OR related.depth < %(max_depth)s::integer)
+)
+SELECT DISTINCT
+    related.position,
+    related.root_id,
+    related.entity_id
+FROM
+    related
+WHERE
+    related.depth > 0
+    {entity_filter}
+ORDER BY
+    related.position
+'''
+
+ENTITY_COUNTS_AT_TIMES_SQL = '''
+WITH checkpoint AS (
+    SELECT
+        id,
+        time
+    FROM
+        entity_history_historycheckpoint
+    WHERE
+        time <= %(min_time)s::timestamptz
+    ORDER BY
+        time DESC
+    LIMIT 1
+)
+SELECT
+    position,
+    active_count
+FROM (
+    SELECT
+        position,
+        SUM(delta) OVER (ORDER BY time, position IS NULL ROWS UNBOUNDED PRECEDING) AS active_count
+    FROM (
+        SELECT
+            requested.time,
+            requested.position,
+            0 AS delta
+        FROM
+            UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+        UNION ALL
+        SELECT
+            time,
+            NULL,
+            CASE
+                WHEN was_activated = COALESCE(LAG(was_activated) OVER (
+                    PARTITION BY entity_id ORDER BY time, id), FALSE) THEN 0
+                WHEN was_activated THEN 1
+                ELSE -1
+            END
+        FROM (
+            SELECT
+                entity_id,
+                '-infinity'::timestamptz AS time,
+                NULL::integer AS id,
+                TRUE AS was_activated
+            FROM
+                entity_history_entityactivationcheckpoint
+            WHERE
+                checkpoint_id = (SELECT id FROM checkpoint)
+                {entity_filter}
+            UNION ALL
+            SELECT
+                entity_id,
+                time,
+                id,
+                was_activated
+            FROM
+                entity_history_entityactivationevent
+            WHERE
+                time >= COALESCE((SELECT time FROM checkpoint), '-infinity')
+            AND
+                time < %(max_time)s::timestamptz
+                {entity_filter}
+        ) member_event
+    ) deltas
+) running_counts
+WHERE
+    position IS NOT NULL
+'''
+
+SUB_ENTITY_COUNTS_AT_TIMES_SQL = '''
+WITH checkpoint AS (
+    SELECT
+        id,
+        time
+    FROM
+        entity_history_historycheckpoint
+    WHERE
+        time <= %(min_time)s::timestamptz
+    ORDER BY
+        time DESC
+    LIMIT 1
+)
+SELECT
+    position,
+    super_entity_id,
+    active_count
+FROM (
+    SELECT
+        position,
+        super_entity_id,
+        SUM(delta) OVER (
+            PARTITION BY super_entity_id ORDER BY time, position IS NULL ROWS UNBOUNDED PRECEDING) AS active_count
+    FROM (
+        SELECT
+            requested.time,
+            requested.position,
+            super_entity.id AS super_entity_id,
+            0 AS delta
+        FROM
+            UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+        CROSS JOIN
+            UNNEST(%(super_entity_ids)s::integer[]) AS super_entity(id)
+        UNION ALL
+        SELECT
+            time,
+            NULL,
+            super_entity_id,
+            CASE
+                WHEN was_activated = COALESCE(LAG(was_activated) OVER (
+                    PARTITION BY super_entity_id, sub_entity_id ORDER BY time, id), FALSE) THEN 0
+                WHEN was_activated THEN 1
+                ELSE -1
+            END
+        FROM (
+            SELECT
+                super_entity_id,
+                sub_entity_id,
+                '-infinity'::timestamptz AS time,
+                NULL::integer AS id,
+                TRUE AS was_activated
+            FROM
+                entity_history_entityrelationshipactivationcheckpoint
+            WHERE
+                checkpoint_id = (SELECT id FROM checkpoint)
+            AND
+                super_entity_id = ANY(%(super_entity_ids)s::integer[])
+                {entity_filter}
+            UNION ALL
+            SELECT
+                super_entity_id,
+                sub_entity_id,
+                time,
+                id,
+                was_activated
+            FROM
+                entity_history_entityrelationshipactivationevent
+            WHERE
+                super_entity_id = ANY(%(super_entity_ids)s::integer[])
+            AND
+                time >= COALESCE((SELECT time FROM checkpoint), '-infinity')
+            AND
+                time < %(max_time)s::timestamptz
+                {entity_filter}
+        ) member_event
+    ) deltas
+) running_counts
+WHERE
+    position IS NOT NULL
+'''
+
+ENTITY_COUNTS_IN_INTERVALS_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    COUNT(*)
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+JOIN
+    entity_history_entityactivationinterval activation_interval
+ON
+    TSTZRANGE(activation_interval.start_time, activation_interval.end_time, '(]') @> requested.time
+    {entity_filter}
+GROUP BY
+    requested.position
+'''
+
+SUB_ENTITY_COUNTS_IN_INTERVALS_AT_TIMES_SQL = '''
+SELECT
+    requested.position,
+    relationship_interval.super_entity_id,
+    COUNT(*)
+FROM
+    UNNEST(%(times)s::timestamptz[]) WITH ORDINALITY AS requested(time, position)
+JOIN
+    entity_history_entityrelationshipinterval relationship_interval
+ON
+    TSTZRANGE(relationship_interval.start_time, relationship_interval.end_time, '(]') @> requested.time
+AND
+    relationship_interval.super_entity_id = ANY(%(super_entity_ids)s::integer[])
+    {entity_filter}
+GROUP BY
+    requested.position,
+    relationship_interval.super_entity_id
+'''
+
+
+ACTIVE_AS_OF_SQL = '''
+EXISTS (
+    SELECT
+        1
+    FROM (
+        SELECT
+            activation_event.was_activated
+        FROM
+            entity_history_entityactivationevent activation_event
+        WHERE
+            activation_event.entity_id = {entity_table}.id
+        AND
+            activation_event.time < %s::timestamptz
+        ORDER BY
+            activation_event.time DESC,
+            activation_event.id DESC
+        LIMIT 1
+    ) last_event
+    WHERE
+        last_event.was_activated
+)
+'''
+
+SUB_ENTITY_AS_OF_SQL = '''
+EXISTS (
+    SELECT
+        1
+    FROM (
+        SELECT DISTINCT ON (relationship_event.super_entity_id)
+            relationship_event.was_activated
+        FROM
+            entity_history_entityrelationshipactivationevent relationship_event
+        WHERE
+            relationship_event.sub_entity_id = {entity_table}.id
+        AND
+            relationship_event.super_entity_id = ANY(%s::integer[])
+        AND
+            relationship_event.time < %s::timestamptz
+        ORDER BY
+            relationship_event.super_entity_id DESC,
+            relationship_event.time DESC,
+            relationship_event.id DESC
+    ) last_event
+    WHERE
+        last_event.was_activated
+)
+'''
+
+
+WAS_ACTIVE_AT_SQL = '''
+COALESCE((
+    SELECT
+        activation_event.was_activated
+    FROM
+        entity_history_entityactivationevent activation_event
+    WHERE
+        activation_event.entity_id = {entity_table}.id
+    AND
+        activation_event.time < %s::timestamptz
+    ORDER BY
+        activation_event.time DESC,
+        activation_event.id DESC
+    LIMIT 1
+), FALSE)
+'''
+
+ACTIVE_DURATION_SQL = '''
+COALESCE((
+    SELECT
+        SUM(LEAST(period.end_time, %s::timestamptz) - GREATEST(period.start_time, %s::timestamptz))
+    FROM (
+        SELECT
+            activation_event.time AS start_time,
+            activation_event.was_activated,
+            COALESCE(LEAD(activation_event.time) OVER (
+                ORDER BY activation_event.time, activation_event.id), 'infinity') AS end_time
+        FROM
+            entity_history_entityactivationevent activation_event
+        WHERE
+            activation_event.entity_id = {entity_table}.id
+        AND
+            activation_event.time < %s::timestamptz
+    ) period
+    WHERE
+        period.was_activated
+    AND
+        period.end_time > %s::timestamptz
+), INTERVAL '0')
+'''
+
+FIRST_ACTIVATION_TIME_SQL = '''
+SELECT
+    MIN(activation_event.time)
+FROM
+    entity_history_entityactivationevent activation_event
+WHERE
+    activation_event.entity_id = {entity_table}.id
+AND
+    activation_event.was_activated
+'''
+
+LAST_DEACTIVATION_TIME_SQL = '''
+SELECT
+    MAX(activation_event.time)
+FROM (
+    SELECT
+        time,
+        was_activated,
+        LAG(was_activated) OVER (ORDER BY time, id) AS was_active
+    FROM
+        entity_history_entityactivationevent
+    WHERE
+        entity_id = {entity_table}.id
+) activation_event
+WHERE
+    NOT activation_event.was_activated
+AND
+    activation_event.was_active
+'''
+
+
+def get_entity_filter_sql(column, filter_by_entity_ids):
+    """
+    Returns the SQL and parameters that restrict a column of a history query to entity ids. No filtering happens if
+    the entity ids are not provided. A values list queryset of entity ids is compiled into a subquery so that the
+    entities are filtered with a semi-join instead of being fetched beforehand.
+    """
+    if filter_by_entity_ids is None:
+        return '', {}
+
+    if hasattr(filter_by_entity_ids, 'query'):
+        try:
+            sql, params = filter_by_entity_ids.query.sql_with_params()
+        except EmptyResultSet:
+            # The queryset can not match any entities
+            return 'AND FALSE', {}
+
+        names = ('entity_filter_{0}'.format(i) for i in range(len(params)))
+
+        # Name the positional parameters of the subquery so that they can be mixed with the parameters of the history
+        # query. Escaped percent signs are kept as they are
+        sql = re.sub('%[%s]', lambda m: '%%' if m.group() == '%%' else '%({0})s'.format(next(names)), sql)
+        return 'AND {0} IN ({1})'.format(column, sql), {
+            'entity_filter_{0}'.format(i): param for i, param in enumerate(params)
+        }
+
+    return 'AND {0} = ANY(%(filter_by_entity_ids)s::integer[])'.format(column), {
+        'filter_by_entity_ids': list(filter_by_entity_ids)
+    }
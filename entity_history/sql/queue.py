@@ -0,0 +1,98 @@
+"""
+Draining of the changes of entities and relationships that are queued by the queue triggers. The queue triggers only
+append the change of a row to a queue table, and the history of the changes is recorded in batches when the queue is
+drained, so the history lags behind the entities until the queue is drained.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+from entity_history.sql import get_sql
+
+
+QUEUE_TABLES = (
+    'entity_history_entityactivationqueueitem',
+    'entity_history_entityrelationshipactivationqueueitem',
+)
+
+# The number of queued changes of entities and of relationships that are drained in a single transaction
+QUEUE_BATCH_SIZE = 10000
+
+# The key of the advisory lock that keeps concurrent workers from draining the queue at the same time
+QUEUE_LOCK_KEY = 4613271
+
+QUEUE_LAG_SQL = '''
+    SELECT
+        CAST(CLOCK_TIMESTAMP() at time zone 'utc' AS timestamp) - LEAST(
+            (SELECT time FROM entity_history_entityactivationqueueitem ORDER BY id LIMIT 1),
+            (SELECT time FROM entity_history_entityrelationshipactivationqueueitem ORDER BY id LIMIT 1)
+        )
+'''
+
+OLDEST_QUEUED_TIME_SQL = '''
+    SELECT
+        LEAST(
+            (SELECT MIN(time) FROM entity_history_entityactivationqueueitem),
+            (SELECT MIN(time) FROM entity_history_entityrelationshipactivationqueueitem)
+        )
+'''
+
+
+def is_history_queue_installed():
+    """
+    Returns True if the migrations that create the queue tables have been applied.
+    """
+    return set(QUEUE_TABLES).issubset(connection.introspection.table_names())
+
+
+def _drain_batch(batch_size):
+    """
+    Records the history of a batch of the oldest queued changes of entities and of relationships in a single
+    transaction. Returns the number of drained entity changes and relationship changes.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [QUEUE_LOCK_KEY])
+        cursor.execute(get_sql('entity_activation_queue_drain.sql'), {'batch_size': batch_size})
+        num_entity_changes = cursor.fetchone()[0]
+        cursor.execute(get_sql('entity_relationship_activation_queue_drain.sql'), {'batch_size': batch_size})
+        num_relationship_changes = cursor.fetchone()[0]
+
+    return num_entity_changes, num_relationship_changes
+
+
+def drain_history_queue(batch_size=QUEUE_BATCH_SIZE):
+    """
+    Records the history of the queued changes of entities and relationships in batches. The events keep the times at
+    which the changes were queued. Draining stops once a batch is not full, so changes that are queued while the queue
+    is drained are left for the next drain.
+
+    :param batch_size: The number of changes of entities and of relationships that are drained in a single transaction
+    :returns: The number of drained changes
+    """
+    num_drained = 0
+    while True:
+        num_entity_changes, num_relationship_changes = _drain_batch(batch_size)
+        num_drained += num_entity_changes + num_relationship_changes
+        if num_entity_changes < batch_size and num_relationship_changes < batch_size:
+            return num_drained
+
+
+def get_history_queue_lag():
+    """
+    Returns a timedelta of how long the oldest queued change has been waiting to be drained, which is how far the
+    history lags behind the entities. The lag is zero when the queue is empty.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(QUEUE_LAG_SQL)
+        return cursor.fetchone()[0] or timedelta()
+
+
+def get_oldest_queued_time():
+    """
+    Returns the time of the oldest change that is waiting to be drained, or None when the queue is empty. The events
+    of the queued changes will be recorded with their original times, so the history before this time can still
+    change.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(OLDEST_QUEUED_TIME_SQL)
+        return cursor.fetchone()[0]
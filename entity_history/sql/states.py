@@ -0,0 +1,20 @@
+from django.db import connection
+
+from entity_history.sql import get_sql
+
+
+def rebuild_entity_activation_states():
+    """
+    Rebuilds the current state of every entity from the latest entity activation event of the entity.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(get_sql('entity_activation_state_rebuild.sql'))
+
+
+def rebuild_entity_relationship_activation_states():
+    """
+    Rebuilds the current state of every entity relationship from the latest entity relationship activation event of
+    the relationship.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(get_sql('entity_relationship_activation_state_rebuild.sql'))
@@ -1,6 +1,9 @@
 import sys
-from django.db import connection
-from os.path import dirname
+from django.conf import settings
+from django.db import connection, transaction
+
+from entity_history.sql import get_sql
+from entity_history.sql.queue import drain_history_queue, is_history_queue_installed
 
 
 class SqlTrigger(object):
@@ -8,13 +11,21 @@ class SqlTrigger(object):
     trigger_procedure_delete_name = None
     trigger_create_name = None
     trigger_delete_name = None
+    minimum_server_version = None
 
     def get_sql(self, name):
-        return open(
-            dirname(__file__) + '/' + name
-        ).read()
+        return get_sql(name)
+
+    def get_server_version(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW server_version_num')
+            return int(cursor.fetchone()[0])
 
     def enable(self):
+        if self.minimum_server_version and self.get_server_version() < self.minimum_server_version:
+            raise Exception('{0} requires postgres server version {1} or later'.format(
+                self.__class__.__name__, self.minimum_server_version))
+
         with connection.cursor() as cursor:
             cursor.execute(self.get_sql(self.trigger_procedure_create_name))
             cursor.execute(self.get_sql(self.trigger_create_name))
@@ -60,3 +71,127 @@ class EntityRelationshipActivationImmediateTrigger(SqlTrigger):
 
         # Call the parent
         super(EntityRelationshipActivationImmediateTrigger, self).enable()
+
+
+class EntityActivationStatementTrigger(SqlTrigger):
+    """
+    This is a statement level version of the entity activation trigger. The history of every entity changed by a
+    statement is computed at once from the transition table of the statement, which makes bulk updates of entities
+    much faster. Requires postgres 10 or later.
+    """
+    trigger_procedure_create_name = 'entity_activation_statement_procedure_create.sql'
+    trigger_procedure_delete_name = 'entity_activation_statement_procedure_delete.sql'
+    trigger_create_name = 'entity_activation_statement_trigger_create.sql'
+    trigger_delete_name = 'entity_activation_statement_trigger_delete.sql'
+    minimum_server_version = 100000
+
+
+class EntityRelationshipActivationStatementTrigger(SqlTrigger):
+    """
+    This is a statement level version of the relationship activation trigger. The history of every relationship
+    created or deleted by a statement is computed at once from the transition table of the statement, which makes
+    bulk creation and deletion of relationships much faster. Requires postgres 10 or later.
+
+    Statement level triggers cannot be deferred, so relationships that are deleted by a cascaded delete of an entity
+    are recorded before the entity is deleted. A statement level trigger on entities removes the history of the
+    relationships of deleted entities, like the cascaded delete does for the deferred row level trigger.
+    """
+    trigger_procedure_create_name = 'entity_relationship_activation_statement_procedure_create.sql'
+    trigger_procedure_delete_name = 'entity_relationship_activation_statement_procedure_delete.sql'
+    trigger_create_name = 'entity_relationship_activation_statement_trigger_create.sql'
+    trigger_delete_name = 'entity_relationship_activation_statement_trigger_delete.sql'
+    minimum_server_version = 100000
+
+
+class EntityActivationQueueTrigger(SqlTrigger):
+    """
+    This is a queue version of the entity activation trigger. It only appends the change of an entity to a queue
+    table, and the history of the change is recorded when the queue is drained by the drain_history_queue management
+    command.
+    """
+    trigger_procedure_create_name = 'entity_activation_queue_procedure_create.sql'
+    trigger_procedure_delete_name = 'entity_activation_queue_procedure_delete.sql'
+    trigger_create_name = 'entity_activation_queue_trigger_create.sql'
+    trigger_delete_name = 'entity_activation_queue_trigger_delete.sql'
+
+
+class EntityRelationshipActivationQueueTrigger(SqlTrigger):
+    """
+    This is a queue version of the relationship activation trigger. Queued changes of relationships whose entities
+    were deleted before the queue is drained are not recorded.
+    """
+    trigger_procedure_create_name = 'entity_relationship_activation_queue_procedure_create.sql'
+    trigger_procedure_delete_name = 'entity_relationship_activation_queue_procedure_delete.sql'
+    trigger_create_name = 'entity_relationship_activation_queue_trigger_create.sql'
+    trigger_delete_name = 'entity_relationship_activation_queue_trigger_delete.sql'
+
+
+class EntityActivationStateNotifyTrigger(SqlTrigger):
+    """
+    Notifies the new current state of an entity whenever it changes. The triggers of every trigger mode update the
+    current states, so the notifications are sent in every trigger mode.
+    """
+    trigger_procedure_create_name = 'entity_activation_state_notify_procedure_create.sql'
+    trigger_procedure_delete_name = 'entity_activation_state_notify_procedure_delete.sql'
+    trigger_create_name = 'entity_activation_state_notify_trigger_create.sql'
+    trigger_delete_name = 'entity_activation_state_notify_trigger_delete.sql'
+
+
+class EntityRelationshipActivationStateNotifyTrigger(SqlTrigger):
+    """
+    Notifies the new current state of an entity relationship whenever it changes.
+    """
+    trigger_procedure_create_name = 'entity_relationship_activation_state_notify_procedure_create.sql'
+    trigger_procedure_delete_name = 'entity_relationship_activation_state_notify_procedure_delete.sql'
+    trigger_create_name = 'entity_relationship_activation_state_notify_trigger_create.sql'
+    trigger_delete_name = 'entity_relationship_activation_state_notify_trigger_delete.sql'
+
+
+# The triggers that are enabled for each value of the ENTITY_HISTORY_TRIGGER_MODE setting
+TRIGGER_MODES = {
+    'row': (EntityActivationTrigger, EntityRelationshipActivationTrigger),
+    'statement': (EntityActivationStatementTrigger, EntityRelationshipActivationStatementTrigger),
+    'queue': (EntityActivationQueueTrigger, EntityRelationshipActivationQueueTrigger),
+}
+
+# The triggers that are enabled when the ENTITY_HISTORY_NOTIFY_CHANGES setting is True
+NOTIFY_TRIGGERS = (EntityActivationStateNotifyTrigger, EntityRelationshipActivationStateNotifyTrigger)
+
+
+def get_trigger_mode():
+    """
+    Returns the trigger mode configured by the ENTITY_HISTORY_TRIGGER_MODE setting. Row level triggers are used by
+    default.
+    """
+    mode = getattr(settings, 'ENTITY_HISTORY_TRIGGER_MODE', 'row')
+    if mode not in TRIGGER_MODES:
+        raise ValueError('Unsupported trigger mode {0}'.format(mode))
+    return mode
+
+
+def get_notify_changes():
+    """
+    Returns True if changes of the current states of entities and relationships are notified, which is configured by
+    the ENTITY_HISTORY_NOTIFY_CHANGES setting. Changes are not notified by default.
+    """
+    return getattr(settings, 'ENTITY_HISTORY_NOTIFY_CHANGES', False)
+
+
+@transaction.atomic
+def refresh_triggers():
+    """
+    Disables the triggers of every trigger mode and enables the triggers of the configured trigger mode. Changes that
+    are still queued are drained when the configured trigger mode does not queue changes, so that they are recorded
+    before the triggers of the mode record new changes. The notify triggers are enabled if changes are notified.
+    """
+    mode = get_trigger_mode()
+    for triggers in list(TRIGGER_MODES.values()) + [NOTIFY_TRIGGERS]:
+        for trigger in triggers:
+            trigger().disable()
+    if get_notify_changes():
+        for trigger in NOTIFY_TRIGGERS:
+            trigger().enable()
+    if mode != 'queue' and is_history_queue_installed():
+        drain_history_queue()
+    for trigger in TRIGGER_MODES[mode]:
+        trigger().enable()
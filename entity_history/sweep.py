@@ -0,0 +1,36 @@
+from collections import defaultdict
+
+
+def sweep_states(events, times, state=None):
+    """
+    Sweeps a time-ordered stream of activation events a single time, yielding the activation state at each of the
+    provided times. An event is considered to have happened before a time t if the time of the event is strictly
+    less than t.
+
+    :param events: An iterable of (group_id, member_id, time, was_activated) tuples in ascending time order
+    :param times: An iterable of datetime objects. The times do not have to be sorted or unique
+    :param state: An optional dictionary keyed on group ids with sets of the member ids that were active before any
+       of the events happened
+    :returns: A generator of (time, state) tuples in ascending order of time. The state is a dictionary keyed on
+       group ids. Each key has a set of all member ids that were active in the group at the time. The state is
+       updated in place as the sweep progresses, so it must be copied if it is used after the next iteration.
+    """
+    state = defaultdict(set, state or {})
+    events = iter(events)
+    event = None
+
+    for t in sorted(set(times)):
+        if event is None:
+            event = next(events, None)
+
+        # Apply every event that happened before time t. The last event that is read is held until the next time
+        # is swept since it happened at or after time t
+        while event is not None and event[2] < t:
+            group_id, member_id, _, was_activated = event
+            if was_activated:
+                state[group_id].add(member_id)
+            else:
+                state[group_id].discard(member_id)
+            event = next(events, None)
+
+        yield t, state
@@ -0,0 +1,112 @@
+from datetime import datetime
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django_dynamic_fixture import G
+from entity.models import Entity, EntityRelationship
+
+from entity_history.cache import (
+    CurrentMembershipCache, disable_current_membership_cache, enable_current_membership_cache,
+    get_current_membership_cache
+)
+from entity_history.models import get_entities_at_times, get_sub_entities_at_times
+from entity_history.sql.triggers import refresh_triggers
+
+
+class CurrentMembershipCacheTest(TransactionTestCase):
+    """
+    Tests keeping the current membership cache up to date with notifications and answering queries from it.
+    """
+    def setUp(self):
+        self.super_e = G(Entity, is_active=True)
+        self.sub_e1 = G(Entity, is_active=True)
+        self.sub_e2 = G(Entity, is_active=False)
+        G(EntityRelationship, super_entity=self.super_e, sub_entity=self.sub_e1)
+
+        with override_settings(ENTITY_HISTORY_NOTIFY_CHANGES=True):
+            refresh_triggers()
+            self.cache = enable_current_membership_cache()
+
+    def tearDown(self):
+        disable_current_membership_cache()
+        refresh_triggers()
+
+    def poll_until(self, condition):
+        for i in range(50):
+            self.cache.poll(timeout=0.1)
+            if condition():
+                return
+
+    def test_warm(self):
+        self.assertEquals(self.cache.get_entities(), set([self.super_e.id, self.sub_e1.id]))
+        self.assertEquals(self.cache.get_sub_entities([self.super_e.id]), {self.super_e.id: set([self.sub_e1.id])})
+
+    def test_notified_changes(self):
+        Entity.all_objects.filter(id=self.sub_e2.id).update(is_active=True)
+        G(EntityRelationship, super_entity=self.super_e, sub_entity=self.sub_e2)
+        EntityRelationship.objects.filter(sub_entity=self.sub_e1).delete()
+
+        self.poll_until(lambda: self.sub_e1.id not in self.cache.get_sub_entities([self.super_e.id])[self.super_e.id])
+        self.assertEquals(self.cache.get_entities(), set([self.super_e.id, self.sub_e1.id, self.sub_e2.id]))
+        self.assertEquals(self.cache.get_sub_entities([self.super_e.id]), {self.super_e.id: set([self.sub_e2.id])})
+
+    def test_deleted_entity(self):
+        e = G(Entity, is_active=True)
+        self.poll_until(lambda: e.id in self.cache.get_entities())
+        Entity.all_objects.filter(id=e.id).delete()
+
+        self.poll_until(lambda: e.id not in self.cache.get_entities())
+        self.assertEquals(self.cache.get_entities(), set([self.super_e.id, self.sub_e1.id]))
+
+    def test_get_entities_from_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEquals(
+                get_entities_at_times([datetime(2100, 1, 1)], filter_by_entity_ids=[self.sub_e1.id, self.sub_e2.id]),
+                {datetime(2100, 1, 1): set([self.sub_e1.id])})
+
+    def test_get_sub_entities_from_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEquals(get_sub_entities_at_times([self.super_e.id], [datetime(2100, 1, 1)]), {
+                (self.super_e.id, datetime(2100, 1, 1)): set([self.sub_e1.id]),
+            })
+            self.assertEquals(
+                get_sub_entities_at_times([self.super_e.id], [datetime(2100, 1, 1)], deltas=True)[
+                    self.super_e.id].get_entities_at_time(datetime(2100, 1, 1)),
+                set([self.sub_e1.id]))
+
+    def test_times_before_latest_change_are_not_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEquals(get_entities_at_times([datetime(2013, 1, 1)]), {datetime(2013, 1, 1): set()})
+
+    def test_engine_is_not_cached(self):
+        with self.assertNumQueries(1):
+            get_entities_at_times([datetime(2100, 1, 1)], engine='sql')
+
+    def test_queryset_filter_is_not_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEquals(
+                get_entities_at_times(
+                    [datetime(2100, 1, 1)],
+                    filter_by_entity_ids=Entity.all_objects.filter(id=self.sub_e1.id).values_list('id', flat=True)),
+                {datetime(2100, 1, 1): set([self.sub_e1.id])})
+
+    def test_disconnected_cache(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [self.cache.connection.connection.get_backend_pid()])
+
+        self.poll_until(lambda: not self.cache.is_connected)
+        self.assertFalse(self.cache.is_connected)
+        with self.assertNumQueries(1):
+            self.assertEquals(get_entities_at_times([datetime(2100, 1, 1)]), {
+                datetime(2100, 1, 1): set([self.super_e.id, self.sub_e1.id]),
+            })
+
+    def test_disable(self):
+        disable_current_membership_cache()
+
+        self.assertIsNone(get_current_membership_cache())
+
+    def test_warm_without_notify_setting(self):
+        with self.assertRaises(Exception):
+            CurrentMembershipCache().warm()
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from django_dynamic_fixture import G
+from entity.models import Entity
+
+from entity_history.models import (
+    EntityActivationCheckpoint, EntityActivationEvent, EntityRelationshipActivationCheckpoint,
+    EntityRelationshipActivationEvent, HistoryCheckpoint, create_history_checkpoint, create_history_checkpoints,
+    get_descendants_at_times, get_entities_at_times, get_sub_entities_at_pairs, get_sub_entities_at_times,
+    get_super_entities_at_times
+)
+
+
+class HistoryCheckpointTest(TestCase):
+    """
+    Tests creating history checkpoints and replaying events from them.
+    """
+    def setUp(self):
+        self.super_e = G(Entity)
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        EntityActivationEvent.objects.all().delete()
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 5))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 5))
+
+    def test_create_history_checkpoint(self):
+        checkpoint = create_history_checkpoint(datetime(2013, 2, 3))
+
+        self.assertEquals(checkpoint.time, datetime(2013, 2, 3))
+        self.assertEquals(
+            set(EntityActivationCheckpoint.objects.filter(checkpoint=checkpoint).values_list('entity_id', flat=True)),
+            set([self.e1.id, self.e2.id]))
+        self.assertEquals(
+            set(EntityRelationshipActivationCheckpoint.objects.filter(checkpoint=checkpoint).values_list(
+                'super_entity_id', 'sub_entity_id')),
+            set([(self.super_e.id, self.e1.id), (self.super_e.id, self.e2.id)]))
+
+    def test_create_history_checkpoint_from_previous_checkpoint(self):
+        create_history_checkpoint(datetime(2013, 2, 3))
+        EntityActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+        checkpoint = create_history_checkpoint(datetime(2013, 2, 6))
+
+        self.assertEquals(
+            set(EntityActivationCheckpoint.objects.filter(checkpoint=checkpoint).values_list('entity_id', flat=True)),
+            set([self.e2.id]))
+
+    def test_replay_from_checkpoint(self):
+        create_history_checkpoint(datetime(2013, 2, 3))
+
+        # Remove the events before the checkpoint. The results after the checkpoint should not change since they are
+        # replayed from the checkpoint
+        EntityActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+        EntityRelationshipActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+
+        times = [datetime(2013, 2, 1, 12), datetime(2013, 2, 3), datetime(2013, 2, 4), datetime(2013, 2, 6)]
+        self.assertEquals(get_entities_at_times(times, engine='python'), {
+            datetime(2013, 2, 1, 12): set(),
+            datetime(2013, 2, 3): set([self.e1.id, self.e2.id]),
+            datetime(2013, 2, 4): set([self.e1.id, self.e2.id]),
+            datetime(2013, 2, 6): set([self.e2.id]),
+        })
+        self.assertEquals(get_sub_entities_at_times([self.super_e.id], times, engine='python'), {
+            (self.super_e.id, datetime(2013, 2, 1, 12)): set(),
+            (self.super_e.id, datetime(2013, 2, 3)): set([self.e1.id, self.e2.id]),
+            (self.super_e.id, datetime(2013, 2, 4)): set([self.e1.id, self.e2.id]),
+            (self.super_e.id, datetime(2013, 2, 6)): set([self.e2.id]),
+        })
+
+    def test_query_from_checkpoint(self):
+        create_history_checkpoint(datetime(2013, 2, 3))
+        EntityActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+        EntityRelationshipActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+
+        times = [datetime(2013, 2, 3), datetime(2013, 2, 4), datetime(2013, 2, 6)]
+        self.assertEquals(get_entities_at_times(times, engine='sql'), {
+            datetime(2013, 2, 3): set([self.e1.id, self.e2.id]),
+            datetime(2013, 2, 4): set([self.e1.id, self.e2.id]),
+            datetime(2013, 2, 6): set([self.e2.id]),
+        })
+        self.assertEquals(get_sub_entities_at_times([self.super_e.id], times, engine='sql'), {
+            (self.super_e.id, datetime(2013, 2, 3)): set([self.e1.id, self.e2.id]),
+            (self.super_e.id, datetime(2013, 2, 4)): set([self.e1.id, self.e2.id]),
+            (self.super_e.id, datetime(2013, 2, 6)): set([self.e2.id]),
+        })
+        self.assertEquals(
+            get_sub_entities_at_pairs([(self.super_e.id, datetime(2013, 2, 4))], engine='sql'), {
+                (self.super_e.id, datetime(2013, 2, 4)): set([self.e1.id, self.e2.id]),
+            })
+        self.assertEquals(get_super_entities_at_times([self.e1.id], times[1:], engine='sql'), {
+            (self.e1.id, datetime(2013, 2, 4)): set([self.super_e.id]),
+            (self.e1.id, datetime(2013, 2, 6)): set(),
+        })
+        self.assertEquals(get_descendants_at_times([self.super_e.id], times[1:], engine='sql'), {
+            (self.super_e.id, datetime(2013, 2, 4)): set([self.e1.id, self.e2.id]),
+            (self.super_e.id, datetime(2013, 2, 6)): set([self.e2.id]),
+        })
+
+    def test_replay_from_checkpoint_w_filter(self):
+        create_history_checkpoint(datetime(2013, 2, 3))
+
+        times = [datetime(2013, 2, 4)]
+        self.assertEquals(get_entities_at_times(times, filter_by_entity_ids=[self.e1.id], engine='python'), {
+            datetime(2013, 2, 4): set([self.e1.id]),
+        })
+        self.assertEquals(
+            get_sub_entities_at_times([self.super_e.id], times, filter_by_entity_ids=[self.e2.id], engine='python'), {
+                (self.super_e.id, datetime(2013, 2, 4)): set([self.e2.id]),
+            })
+
+    def test_replay_from_checkpoint_w_generator_filter(self):
+        create_history_checkpoint(datetime(2013, 2, 3))
+        EntityActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+        EntityRelationshipActivationEvent.objects.filter(time__lt=datetime(2013, 2, 3)).delete()
+
+        # The members of the checkpoint and the events after it are filtered on the same generator of ids
+        times = [datetime(2013, 2, 4), datetime(2013, 2, 6)]
+        self.assertEquals(
+            get_entities_at_times(
+                times, filter_by_entity_ids=(e.id for e in [self.e1, self.e2]), engine='python'), {
+                datetime(2013, 2, 4): set([self.e1.id, self.e2.id]),
+                datetime(2013, 2, 6): set([self.e2.id]),
+            })
+        self.assertEquals(
+            get_sub_entities_at_times(
+                [self.super_e.id], times, filter_by_entity_ids=(e.id for e in [self.e1, self.e2]),
+                engine='python'), {
+                (self.super_e.id, datetime(2013, 2, 4)): set([self.e1.id, self.e2.id]),
+                (self.super_e.id, datetime(2013, 2, 6)): set([self.e2.id]),
+            })
+        self.assertEquals(
+            get_super_entities_at_times(
+                [self.e1.id], times, filter_by_super_entity_ids=(se_id for se_id in [self.super_e.id]),
+                engine='python'), {
+                (self.e1.id, datetime(2013, 2, 4)): set([self.super_e.id]),
+                (self.e1.id, datetime(2013, 2, 6)): set(),
+            })
+
+    def test_create_history_checkpoints(self):
+        checkpoints = create_history_checkpoints(timedelta(days=2), end_time=datetime(2013, 2, 6))
+
+        self.assertEquals(
+            [checkpoint.time for checkpoint in checkpoints], [datetime(2013, 2, 3), datetime(2013, 2, 5)])
+
+    def test_create_history_checkpoints_after_latest(self):
+        create_history_checkpoints(timedelta(days=2), end_time=datetime(2013, 2, 4))
+        checkpoints = create_history_checkpoints(timedelta(days=2), end_time=datetime(2013, 2, 8))
+
+        self.assertEquals(
+            [checkpoint.time for checkpoint in checkpoints], [datetime(2013, 2, 5), datetime(2013, 2, 7)])
+
+    def test_create_history_checkpoints_no_events(self):
+        EntityActivationEvent.objects.all().delete()
+        EntityRelationshipActivationEvent.objects.all().delete()
+
+        self.assertEquals(create_history_checkpoints(timedelta(days=1)), [])
+
+    def test_build_history_checkpoints_command(self):
+        stdout = StringIO()
+        call_command('build_history_checkpoints', days=3650, stdout=stdout)
+
+        self.assertEquals(HistoryCheckpoint.objects.count(), 1)
+        self.assertEquals(stdout.getvalue().strip(), 'Created 1 history checkpoints')
@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django_dynamic_fixture import G
+from entity.models import Entity
+
+from entity_history.models import (
+    EntityActivationEvent, EntityHistory, EntityRelationshipActivationEvent, get_entity_counts_at_times,
+    get_entity_counts_in_range, get_sub_entity_counts_at_times, get_sub_entity_counts_in_range
+)
+from entity_history.sql.intervals import (
+    rebuild_entity_activation_intervals, rebuild_entity_relationship_intervals
+)
+
+
+class GetSubEntityCountsTest(TestCase):
+    """
+    Tests the get_sub_entity_counts_at_times and get_sub_entity_counts_in_range functions.
+    """
+    engine = None
+
+    def setUp(self):
+        self.super_e1 = G(Entity)
+        self.super_e2 = G(Entity)
+        self.sub_e1 = G(Entity)
+        self.sub_e2 = G(Entity)
+
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e2,
+            time=datetime(2013, 2, 2, 12))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 3))
+        rebuild_entity_relationship_intervals()
+
+    def test_no_input(self):
+        self.assertEquals(get_sub_entity_counts_at_times([], [], engine=self.engine), {})
+
+    def test_counts_at_times(self):
+        res = get_sub_entity_counts_at_times(
+            [self.super_e1.id, self.super_e2.id],
+            [datetime(2013, 2, 1), datetime(2013, 2, 2, 6), datetime(2013, 2, 4)], engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.super_e1.id, datetime(2013, 2, 1)): 0,
+            (self.super_e1.id, datetime(2013, 2, 2, 6)): 2,
+            (self.super_e1.id, datetime(2013, 2, 4)): 1,
+            (self.super_e2.id, datetime(2013, 2, 1)): 0,
+            (self.super_e2.id, datetime(2013, 2, 2, 6)): 0,
+            (self.super_e2.id, datetime(2013, 2, 4)): 1,
+        })
+
+    def test_counts_at_times_w_filter(self):
+        res = get_sub_entity_counts_at_times(
+            [self.super_e1.id], [datetime(2013, 2, 2, 6)], filter_by_entity_ids=[self.sub_e2.id], engine=self.engine)
+
+        self.assertEquals(res, {(self.super_e1.id, datetime(2013, 2, 2, 6)): 1})
+
+    def test_counts_in_range(self):
+        res = get_sub_entity_counts_in_range(
+            [self.super_e1.id], datetime(2013, 2, 1, 12), datetime(2013, 2, 4), timedelta(days=1), engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.super_e1.id, datetime(2013, 2, 1, 12)): 1,
+            (self.super_e1.id, datetime(2013, 2, 2, 12)): 2,
+            (self.super_e1.id, datetime(2013, 2, 3, 12)): 1,
+        })
+
+    def test_counts_w_manager(self):
+        res = EntityHistory.objects.filter(id=self.sub_e1.id).get_sub_entity_counts_at_times(
+            [self.super_e1.id], [datetime(2013, 2, 2, 6)])
+
+        self.assertEquals(res, {(self.super_e1.id, datetime(2013, 2, 2, 6)): 1})
+
+
+class GetSubEntityCountsPythonEngineTest(GetSubEntityCountsTest):
+    """
+    Tests counting sub entities when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetSubEntityCountsIntervalEngineTest(GetSubEntityCountsTest):
+    """
+    Tests counting sub entities when relationship intervals are probed.
+    """
+    engine = 'interval'
+
+
+class GetEntityCountsTest(TestCase):
+    """
+    Tests the get_entity_counts_at_times and get_entity_counts_in_range functions.
+    """
+    engine = None
+
+    def setUp(self):
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=False, entity=self.e2, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 2, 12))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 3))
+        rebuild_entity_activation_intervals()
+
+    def test_no_input(self):
+        self.assertEquals(get_entity_counts_at_times([], engine=self.engine), {})
+
+    def test_counts_at_times(self):
+        res = get_entity_counts_at_times(
+            [datetime(2013, 2, 1), datetime(2013, 2, 2, 6), datetime(2013, 2, 4), datetime(2013, 2, 4)],
+            engine=self.engine)
+
+        self.assertEquals(res, {
+            datetime(2013, 2, 1): 0,
+            datetime(2013, 2, 2, 6): 2,
+            datetime(2013, 2, 4): 1,
+        })
+
+    def test_counts_at_times_w_filter(self):
+        res = get_entity_counts_at_times(
+            [datetime(2013, 2, 2, 6)], filter_by_entity_ids=[self.e1.id], engine=self.engine)
+
+        self.assertEquals(res, {datetime(2013, 2, 2, 6): 1})
+
+    def test_counts_in_range(self):
+        res = get_entity_counts_in_range(
+            datetime(2013, 2, 1, 12), datetime(2013, 2, 3, 12), timedelta(days=1), engine=self.engine)
+
+        self.assertEquals(res, {
+            datetime(2013, 2, 1, 12): 1,
+            datetime(2013, 2, 2, 12): 2,
+            datetime(2013, 2, 3, 12): 1,
+        })
+
+    def test_counts_in_range_uneven_end(self):
+        # The counts are keyed on the times of the steps and not on the end time
+        res = get_entity_counts_in_range(
+            datetime(2013, 2, 1, 12), datetime(2013, 2, 3, 18), timedelta(hours=30), engine=self.engine)
+
+        self.assertEquals(res, {
+            datetime(2013, 2, 1, 12): 1,
+            datetime(2013, 2, 2, 18): 2,
+        })
+
+    def test_counts_in_range_invalid_step(self):
+        with self.assertRaises(ValueError):
+            get_entity_counts_in_range(datetime(2013, 2, 1), datetime(2013, 2, 3), timedelta(0), engine=self.engine)
+
+    def test_counts_w_manager(self):
+        res = EntityHistory.all_objects.filter(id=self.e2.id).get_entity_counts_in_range(
+            datetime(2013, 2, 1, 12), datetime(2013, 2, 2, 12), timedelta(days=1))
+
+        self.assertEquals(res, {
+            datetime(2013, 2, 1, 12): 0,
+            datetime(2013, 2, 2, 12): 1,
+        })
+
+
+class GetEntityCountsPythonEngineTest(GetEntityCountsTest):
+    """
+    Tests counting entities when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetEntityCountsIntervalEngineTest(GetEntityCountsTest):
+    """
+    Tests counting entities when entity intervals are probed.
+    """
+    engine = 'interval'
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django_dynamic_fixture import G
+from entity.models import Entity
+
+from entity_history.cursor import HistoryCursor
+from entity_history.models import EntityActivationEvent, EntityRelationshipActivationEvent
+
+
+class HistoryCursorTest(TestCase):
+    """
+    Tests advancing history cursors over the events and resuming them.
+    """
+    def setUp(self):
+        self.super_e = G(Entity)
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        EntityActivationEvent.objects.all().delete()
+        EntityRelationshipActivationEvent.objects.all().delete()
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 3))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 5))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e2,
+            time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 5))
+
+    def test_advance_entities(self):
+        cursor = HistoryCursor()
+
+        cursor.advance_to(datetime(2013, 2, 2))
+        self.assertEquals(cursor.get_entities(), set([self.e1.id]))
+        cursor.advance_to(datetime(2013, 2, 4))
+        self.assertEquals(cursor.get_entities(), set([self.e1.id, self.e2.id]))
+        cursor.advance_to(datetime(2013, 2, 6))
+        self.assertEquals(cursor.get_entities(), set([self.e2.id]))
+        self.assertEquals(cursor.time, datetime(2013, 2, 6))
+
+    def test_advance_sub_entities(self):
+        cursor = HistoryCursor([self.super_e.id])
+
+        cursor.advance_to(datetime(2013, 2, 4))
+        self.assertEquals(cursor.get_sub_entities(), {self.super_e.id: set([self.e1.id, self.e2.id])})
+        cursor.advance_to(datetime(2013, 2, 6))
+        self.assertEquals(cursor.get_sub_entities(), {self.super_e.id: set([self.e2.id])})
+
+    def test_advance_only_replays_new_events(self):
+        cursor = HistoryCursor()
+        cursor.advance_to(datetime(2013, 2, 2))
+
+        # The events before the time of the cursor are not read again
+        EntityActivationEvent.objects.filter(time__lt=datetime(2013, 2, 2)).delete()
+        cursor.advance_to(datetime(2013, 2, 4))
+
+        self.assertEquals(cursor.get_entities(), set([self.e1.id, self.e2.id]))
+
+    def test_advance_late_events(self):
+        cursor = HistoryCursor()
+        cursor.advance_to(datetime(2013, 2, 4))
+
+        # Events that are written after the cursor was advanced past their times are resolved again when they
+        # happened within the settle time
+        e3 = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e3, time=datetime(2013, 2, 3, 23, 30))
+        G(EntityActivationEvent, was_activated=False, entity=self.e2, time=datetime(2013, 2, 3, 23, 45))
+        cursor.advance_to(datetime(2013, 2, 4, 12))
+
+        self.assertEquals(cursor.get_entities(), set([self.e1.id, e3.id]))
+
+    def test_serialize(self):
+        cursor = HistoryCursor([self.super_e.id], settle_time=timedelta(days=2))
+        cursor.advance_to(datetime(2013, 2, 4))
+
+        cursor = HistoryCursor.deserialize(cursor.serialize())
+        self.assertEquals(cursor.time, datetime(2013, 2, 4))
+        self.assertEquals(cursor.settle_time, timedelta(days=2))
+        self.assertEquals(cursor.get_sub_entities(), {self.super_e.id: set([self.e1.id, self.e2.id])})
+
+        cursor.advance_to(datetime(2013, 2, 6))
+        self.assertEquals(cursor.get_sub_entities(), {self.super_e.id: set([self.e2.id])})
+
+    def test_serialize_entities(self):
+        cursor = HistoryCursor()
+        cursor.advance_to(datetime(2013, 2, 2))
+
+        self.assertEquals(HistoryCursor.deserialize(cursor.serialize()).get_entities(), set([self.e1.id]))
+
+    def test_advance_back_in_time(self):
+        cursor = HistoryCursor()
+        cursor.advance_to(datetime(2013, 2, 4))
+
+        with self.assertRaises(ValueError):
+            cursor.advance_to(datetime(2013, 2, 2))
+
+    def test_get_wrong_members(self):
+        with self.assertRaises(ValueError):
+            HistoryCursor().get_sub_entities()
+        with self.assertRaises(ValueError):
+            HistoryCursor([self.super_e.id]).get_entities()
@@ -4,7 +4,8 @@ from django.test import TestCase
 from django_dynamic_fixture import G, N
 from entity.models import Entity
 
-from entity_history.models import EntityActivationEvent
+from entity_history.models import EntityActivationEvent, EntityActivationInterval, EntityActivationState
+from entity_history.sql.states import rebuild_entity_activation_states
 
 
 class EntityActivationTriggerTests(TestCase):
@@ -138,3 +139,49 @@ class EntityActivationTriggerTests(TestCase):
         self.assertFalse(events[2].was_activated)
         self.assertEquals(events[2].entity, e)
         self.assertTrue(t3 <= events[2].time <= t4)
+
+    def test_intervals_opened_and_closed(self):
+        e = G(Entity, is_active=False)
+        e.is_active = True
+        e.save()
+        e.is_active = True
+        e.save()
+        e.is_active = False
+        e.save()
+        e.is_active = True
+        e.save()
+
+        events = list(EntityActivationEvent.objects.order_by('time', 'id'))
+        intervals = list(EntityActivationInterval.objects.order_by('start_time'))
+
+        self.assertEquals(len(intervals), 2)
+        self.assertEquals(intervals[0].entity, e)
+        self.assertEquals(intervals[0].start_time, events[1].time)
+        self.assertEquals(intervals[0].end_time, events[2].time)
+        self.assertEquals(intervals[1].entity, e)
+        self.assertEquals(intervals[1].start_time, events[3].time)
+        self.assertIsNone(intervals[1].end_time)
+
+    def test_state_tracks_latest_event(self):
+        e = G(Entity, is_active=True)
+        e.is_active = False
+        e.save()
+
+        event = EntityActivationEvent.objects.order_by('time', 'id').last()
+        state = EntityActivationState.objects.get()
+        self.assertEquals(state.entity, e)
+        self.assertEquals(state.time, event.time)
+        self.assertFalse(state.was_activated)
+
+    def test_rebuild_states(self):
+        e1 = G(Entity, is_active=True)
+        e2 = G(Entity, is_active=True)
+        e2.is_active = False
+        e2.save()
+        EntityActivationState.objects.all().delete()
+
+        rebuild_entity_activation_states()
+
+        self.assertEquals(
+            set(EntityActivationState.objects.values_list('entity_id', 'was_activated')),
+            set([(e1.id, True), (e2.id, False)]))
@@ -1,12 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from django.db import connection
 from django.test import TestCase
 from django_dynamic_fixture import G
 from entity.models import Entity
+from mock import MagicMock, patch
 
 from entity_history.models import (
     get_sub_entities_at_times, EntityRelationshipActivationEvent, get_entities_at_times, EntityActivationEvent,
-    EntityHistory
+    EntityHistory, _get_engine, _stream_rows, get_sub_entities_at_pairs, _filter_by_ids, get_super_entities_at_times,
+    get_descendants_at_times, get_ancestors_at_times, SQL_ENGINE_MAX_TIMES
+)
+from entity_history.sql.intervals import (
+    rebuild_entity_activation_intervals, rebuild_entity_relationship_intervals
 )
 
 
@@ -26,12 +32,17 @@ class GetSubEntitiesAtTimesTest(TestCase):
     """
     Test the get_sub_entities_at_times function.
     """
+    engine = None
+
+    def get_sub_entities_at_times(self, *args, **kwargs):
+        return get_sub_entities_at_times(*args, engine=self.engine, **kwargs)
+
     def test_no_events_no_input(self):
-        res = get_sub_entities_at_times([], [])
+        res = self.get_sub_entities_at_times([], [])
         self.assertEquals(res, {})
 
     def test_no_events_w_input(self):
-        res = get_sub_entities_at_times([1, 2], [datetime(2013, 4, 5), datetime(2013, 5, 6)])
+        res = self.get_sub_entities_at_times([1, 2], [datetime(2013, 4, 5), datetime(2013, 5, 6)])
         self.assertEquals(res, {
             (1, datetime(2013, 4, 5)): set(),
             (1, datetime(2013, 5, 6)): set(),
@@ -44,7 +55,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
         G(EntityRelationshipActivationEvent, was_activated=True, super_entity=se, time=datetime(2013, 2, 1))
         G(EntityRelationshipActivationEvent, was_activated=False, super_entity=se, time=datetime(2013, 2, 2))
 
-        res = get_sub_entities_at_times([se.id], [datetime(2012, 4, 5), datetime(2012, 5, 6)])
+        res = self.get_sub_entities_at_times([se.id], [datetime(2012, 4, 5), datetime(2012, 5, 6)])
         self.assertEquals(res, {
             (se.id, datetime(2012, 4, 5)): set(),
             (se.id, datetime(2012, 5, 6)): set(),
@@ -60,7 +71,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
             EntityRelationshipActivationEvent, was_activated=False, super_entity=super_e, sub_entity=sub_e,
             time=datetime(2013, 2, 3))
 
-        res = get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 2), datetime(2012, 5, 6)])
+        res = self.get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 2), datetime(2012, 5, 6)])
         self.assertEquals(res, {
             (super_e.id, datetime(2013, 2, 2)): set([sub_e.id]),
             (super_e.id, datetime(2012, 5, 6)): set(),
@@ -76,7 +87,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
             EntityRelationshipActivationEvent, was_activated=False, super_entity=super_e, sub_entity=sub_e,
             time=datetime(2013, 2, 3))
 
-        res = get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 4)])
+        res = self.get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 4)])
         self.assertEquals(res, {
             (super_e.id, datetime(2013, 2, 4)): set(),
         })
@@ -100,7 +111,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
             EntityRelationshipActivationEvent, was_activated=False, super_entity=super_e, sub_entity=sub_e,
             time=datetime(2013, 3, 4, 12))
 
-        res = get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 6), datetime(2012, 5, 6)])
+        res = self.get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 6), datetime(2012, 5, 6)])
         self.assertEquals(res, {
             (super_e.id, datetime(2013, 2, 6)): set([sub_e.id]),
             (super_e.id, datetime(2012, 5, 6)): set(),
@@ -142,7 +153,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
             EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e2,
             time=datetime(2013, 3, 4, 13))
 
-        res = get_sub_entities_at_times(
+        res = self.get_sub_entities_at_times(
             [super_e.id], [datetime(2013, 2, 2), datetime(2013, 2, 4, 13), datetime(2013, 3, 5)])
 
         self.assertEquals(res, {
@@ -187,7 +198,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
             EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e2,
             time=datetime(2013, 3, 4, 13))
 
-        res = get_sub_entities_at_times(
+        res = self.get_sub_entities_at_times(
             [super_e.id], [datetime(2013, 2, 2), datetime(2013, 2, 4, 13), datetime(2013, 3, 5)],
             filter_by_entity_ids=[sub_e2.id])
 
@@ -242,6 +253,22 @@ class GetSubEntitiesAtTimesTest(TestCase):
             (super_e.id, datetime(2013, 3, 5)): set([sub_e2.id]),
         })
 
+    def test_w_manager_in_single_query(self):
+        super_e = G(Entity)
+        sub_e1 = G(Entity)
+        sub_e2 = G(Entity, is_active=False)
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e2,
+            time=datetime(2013, 2, 1))
+
+        with self.assertNumQueries(1):
+            res = EntityHistory.objects.get_sub_entities_at_times([super_e.id], [datetime(2013, 2, 2)])
+
+        self.assertEquals(res, {(super_e.id, datetime(2013, 2, 2)): set([sub_e1.id])})
+
     def test_w_mulitple_activation_events_mulitple_sub_e_returned_w_manager(self):
         super_e = G(Entity)
         sub_e1 = G(Entity)
@@ -336,7 +363,7 @@ class GetSubEntitiesAtTimesTest(TestCase):
             EntityRelationshipActivationEvent, was_activated=False, super_entity=super_e2, sub_entity=sub_e2,
             time=datetime(2013, 12, 1))
 
-        res = get_sub_entities_at_times(
+        res = self.get_sub_entities_at_times(
             [super_e1.id, super_e2.id], [datetime(2013, 2, 2), datetime(2013, 2, 4, 13), datetime(2013, 3, 5)])
 
         self.assertEquals(res, {
@@ -348,17 +375,339 @@ class GetSubEntitiesAtTimesTest(TestCase):
             (super_e2.id, datetime(2013, 3, 5)): set([sub_e1.id, sub_e2.id]),
         })
 
+    def test_deltas(self):
+        super_e = G(Entity)
+        sub_e1 = G(Entity)
+        sub_e2 = G(Entity)
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=super_e, sub_entity=sub_e1,
+            time=datetime(2013, 2, 3))
+        times = [datetime(2013, 2, 4), datetime(2013, 1, 1), datetime(2013, 2, 2, 12), datetime(2013, 2, 1, 12)]
+
+        res = self.get_sub_entities_at_times([super_e.id, 0], times, deltas=True)
+        self.assertEquals(set(res), set([super_e.id, 0]))
+        self.assertEquals(res[super_e.id].initial, set())
+        self.assertEquals(res[super_e.id].added, {
+            datetime(2013, 2, 1, 12): set([sub_e1.id]),
+            datetime(2013, 2, 2, 12): set([sub_e2.id]),
+        })
+        self.assertEquals(res[super_e.id].removed, {datetime(2013, 2, 4): set([sub_e1.id])})
+        self.assertEquals(dict(res[super_e.id].iter_entities()), {
+            key[1]: sub_entity_ids
+            for key, sub_entity_ids in self.get_sub_entities_at_times([super_e.id], times).items()
+        })
+        self.assertEquals(res[0].get_entities_at_time(datetime(2013, 2, 4)), set())
+
+    def test_deltas_no_times(self):
+        self.assertEquals(self.get_sub_entities_at_times([1], [], deltas=True)[1].times, [])
+
+    def test_sparse(self):
+        super_e = G(Entity)
+        sub_e = G(Entity)
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=super_e, sub_entity=sub_e,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=super_e, sub_entity=sub_e,
+            time=datetime(2013, 2, 3))
+
+        res = self.get_sub_entities_at_times(
+            [super_e.id, 0], [datetime(2013, 1, 1), datetime(2013, 2, 2), datetime(2013, 2, 4)], sparse=True)
+        self.assertEquals(dict(res), {(super_e.id, datetime(2013, 2, 2)): set([sub_e.id])})
+        self.assertEquals(res.get((super_e.id, datetime(2013, 2, 4))), frozenset())
+
+    def test_sparse_and_deltas(self):
+        with self.assertRaises(ValueError):
+            self.get_sub_entities_at_times([1], [datetime(2013, 1, 1)], deltas=True, sparse=True)
+
+
+class GetSubEntitiesAtTimesPythonEngineTest(GetSubEntitiesAtTimesTest):
+    """
+    Test the get_sub_entities_at_times function when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetSubEntitiesAtTimesIntervalEngineTest(GetSubEntitiesAtTimesTest):
+    """
+    Test the get_sub_entities_at_times function when relationship intervals are probed. The intervals are rebuilt
+    from the events that are created in the tests.
+    """
+    engine = 'interval'
+
+    def get_sub_entities_at_times(self, *args, **kwargs):
+        rebuild_entity_relationship_intervals()
+        return super(GetSubEntitiesAtTimesIntervalEngineTest, self).get_sub_entities_at_times(*args, **kwargs)
+
+
+class GetSubEntitiesAtPairsTest(TestCase):
+    """
+    Test the get_sub_entities_at_pairs function.
+    """
+    engine = None
+
+    def setUp(self):
+        self.super_e1 = G(Entity)
+        self.super_e2 = G(Entity)
+        self.sub_e1 = G(Entity)
+        self.sub_e2 = G(Entity)
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.sub_e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 4))
+        rebuild_entity_relationship_intervals()
+
+    def test_no_input(self):
+        self.assertEquals(get_sub_entities_at_pairs([], engine=self.engine), {})
+
+    def test_pairs(self):
+        res = get_sub_entities_at_pairs([
+            (self.super_e1.id, datetime(2013, 2, 2)),
+            (self.super_e1.id, datetime(2013, 2, 5)),
+            (self.super_e2.id, datetime(2013, 2, 3, 12)),
+            (self.super_e2.id, datetime(2013, 2, 3, 12)),
+        ], engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.super_e1.id, datetime(2013, 2, 2)): set([self.sub_e1.id]),
+            (self.super_e1.id, datetime(2013, 2, 5)): set(),
+            (self.super_e2.id, datetime(2013, 2, 3, 12)): set([self.sub_e1.id, self.sub_e2.id]),
+        })
+
+    def test_pairs_w_filter(self):
+        res = get_sub_entities_at_pairs(
+            [(self.super_e2.id, datetime(2013, 2, 3, 12))], filter_by_entity_ids=[self.sub_e2.id], engine=self.engine)
+
+        self.assertEquals(res, {(self.super_e2.id, datetime(2013, 2, 3, 12)): set([self.sub_e2.id])})
+
+    def test_pairs_w_manager(self):
+        res = EntityHistory.objects.filter(id=self.sub_e1.id).get_sub_entities_at_pairs(
+            [(self.super_e2.id, datetime(2013, 2, 3, 12))])
+
+        self.assertEquals(res, {(self.super_e2.id, datetime(2013, 2, 3, 12)): set([self.sub_e1.id])})
+
+    def test_sparse_pairs(self):
+        res = get_sub_entities_at_pairs([
+            (self.super_e1.id, datetime(2013, 2, 2)),
+            (self.super_e1.id, datetime(2013, 2, 5)),
+        ], engine=self.engine, sparse=True)
+
+        self.assertEquals(dict(res), {(self.super_e1.id, datetime(2013, 2, 2)): set([self.sub_e1.id])})
+
+
+class GetSubEntitiesAtPairsPythonEngineTest(GetSubEntitiesAtPairsTest):
+    """
+    Test the get_sub_entities_at_pairs function when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetSubEntitiesAtPairsIntervalEngineTest(GetSubEntitiesAtPairsTest):
+    """
+    Test the get_sub_entities_at_pairs function when relationship intervals are probed.
+    """
+    engine = 'interval'
+
+
+class GetSuperEntitiesAtTimesTest(TestCase):
+    """
+    Test the get_super_entities_at_times function.
+    """
+    engine = None
+
+    def setUp(self):
+        self.super_e1 = G(Entity)
+        self.super_e2 = G(Entity)
+        self.sub_e1 = G(Entity)
+        self.sub_e2 = G(Entity)
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.sub_e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 4))
+        rebuild_entity_relationship_intervals()
+
+    def test_no_input(self):
+        self.assertEquals(get_super_entities_at_times([], [datetime(2013, 2, 2)], engine=self.engine), {})
+        self.assertEquals(get_super_entities_at_times([self.sub_e1.id], [], engine=self.engine), {})
+
+    def test_super_entities(self):
+        times = [datetime(2013, 2, 1, 12), datetime(2013, 2, 3, 12), datetime(2013, 2, 5)]
+        res = get_super_entities_at_times([self.sub_e1.id, self.sub_e2.id], times, engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.sub_e1.id, datetime(2013, 2, 1, 12)): set([self.super_e1.id]),
+            (self.sub_e1.id, datetime(2013, 2, 3, 12)): set([self.super_e1.id, self.super_e2.id]),
+            (self.sub_e1.id, datetime(2013, 2, 5)): set([self.super_e2.id]),
+            (self.sub_e2.id, datetime(2013, 2, 1, 12)): set(),
+            (self.sub_e2.id, datetime(2013, 2, 3, 12)): set([self.super_e2.id]),
+            (self.sub_e2.id, datetime(2013, 2, 5)): set([self.super_e2.id]),
+        })
+
+    def test_super_entities_w_filter(self):
+        res = get_super_entities_at_times(
+            [self.sub_e1.id], [datetime(2013, 2, 3, 12)], filter_by_super_entity_ids=[self.super_e2.id],
+            engine=self.engine)
+
+        self.assertEquals(res, {(self.sub_e1.id, datetime(2013, 2, 3, 12)): set([self.super_e2.id])})
+
+    def test_super_entities_w_manager(self):
+        res = EntityHistory.objects.filter(id=self.super_e1.id).get_super_entities_at_times(
+            [self.sub_e1.id], [datetime(2013, 2, 3, 12)])
+
+        self.assertEquals(res, {(self.sub_e1.id, datetime(2013, 2, 3, 12)): set([self.super_e1.id])})
+
+    def test_sparse_super_entities(self):
+        res = get_super_entities_at_times(
+            [self.sub_e1.id, self.sub_e2.id], [datetime(2013, 2, 1, 12)], engine=self.engine, sparse=True)
+
+        self.assertEquals(dict(res), {(self.sub_e1.id, datetime(2013, 2, 1, 12)): set([self.super_e1.id])})
+
+
+class GetSuperEntitiesAtTimesPythonEngineTest(GetSuperEntitiesAtTimesTest):
+    """
+    Test the get_super_entities_at_times function when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetSuperEntitiesAtTimesIntervalEngineTest(GetSuperEntitiesAtTimesTest):
+    """
+    Test the get_super_entities_at_times function when relationship intervals are probed.
+    """
+    engine = 'interval'
+
+
+class GetRelatedEntitiesAtTimesTest(TestCase):
+    """
+    Test the get_descendants_at_times and get_ancestors_at_times functions.
+    """
+    engine = None
+
+    def setUp(self):
+        self.company = G(Entity)
+        self.region = G(Entity)
+        self.team = G(Entity)
+        self.user = G(Entity)
+        self.relate(self.company, self.region, datetime(2013, 2, 1))
+        self.relate(self.region, self.team, datetime(2013, 2, 1))
+        self.relate(self.team, self.user, datetime(2013, 2, 1))
+        # The user moves directly under the company and the relationships become cyclic
+        self.relate(self.team, self.user, datetime(2013, 2, 3), was_activated=False)
+        self.relate(self.company, self.user, datetime(2013, 2, 3))
+        self.relate(self.team, self.company, datetime(2013, 2, 3))
+        rebuild_entity_relationship_intervals()
+        self.times = [datetime(2013, 2, 2), datetime(2013, 2, 4)]
+
+    def relate(self, super_entity, sub_entity, time, was_activated=True):
+        G(
+            EntityRelationshipActivationEvent, was_activated=was_activated, super_entity=super_entity,
+            sub_entity=sub_entity, time=time)
+
+    def test_no_input(self):
+        self.assertEquals(get_descendants_at_times([], self.times, engine=self.engine), {})
+        self.assertEquals(get_ancestors_at_times([self.user.id], [], engine=self.engine), {})
+
+    def test_descendants(self):
+        res = get_descendants_at_times([self.company.id, self.team.id], self.times, engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.company.id, datetime(2013, 2, 2)): set([self.region.id, self.team.id, self.user.id]),
+            (self.company.id, datetime(2013, 2, 4)): set([self.region.id, self.team.id, self.user.id]),
+            (self.team.id, datetime(2013, 2, 2)): set([self.user.id]),
+            (self.team.id, datetime(2013, 2, 4)): set([self.company.id, self.region.id, self.user.id]),
+        })
+
+    def test_descendants_w_max_depth(self):
+        res = get_descendants_at_times([self.company.id], self.times, max_depth=2, engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.company.id, datetime(2013, 2, 2)): set([self.region.id, self.team.id]),
+            (self.company.id, datetime(2013, 2, 4)): set([self.region.id, self.team.id, self.user.id]),
+        })
+
+    def test_descendants_w_filter(self):
+        res = get_descendants_at_times(
+            [self.company.id], [datetime(2013, 2, 2)], filter_by_entity_ids=[self.user.id], engine=self.engine)
+
+        self.assertEquals(res, {(self.company.id, datetime(2013, 2, 2)): set([self.user.id])})
+
+    def test_ancestors(self):
+        res = get_ancestors_at_times([self.user.id], self.times, engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.user.id, datetime(2013, 2, 2)): set([self.company.id, self.region.id, self.team.id]),
+            (self.user.id, datetime(2013, 2, 4)): set([self.company.id, self.region.id, self.team.id]),
+        })
+
+    def test_ancestors_w_max_depth(self):
+        res = get_ancestors_at_times([self.user.id], self.times, max_depth=1, engine=self.engine)
+
+        self.assertEquals(res, {
+            (self.user.id, datetime(2013, 2, 2)): set([self.team.id]),
+            (self.user.id, datetime(2013, 2, 4)): set([self.company.id]),
+        })
+
+    def test_w_manager(self):
+        res = EntityHistory.objects.filter(id=self.team.id).get_descendants_at_times(
+            [self.company.id], [datetime(2013, 2, 2)])
+        self.assertEquals(res, {(self.company.id, datetime(2013, 2, 2)): set([self.team.id])})
+
+        res = EntityHistory.objects.filter(id=self.region.id).get_ancestors_at_times(
+            [self.user.id], [datetime(2013, 2, 2)], max_depth=1)
+        self.assertEquals(res, {(self.user.id, datetime(2013, 2, 2)): set()})
+
+
+class GetRelatedEntitiesAtTimesPythonEngineTest(GetRelatedEntitiesAtTimesTest):
+    """
+    Test the get_descendants_at_times and get_ancestors_at_times functions when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetRelatedEntitiesAtTimesIntervalEngineTest(GetRelatedEntitiesAtTimesTest):
+    """
+    Test the get_descendants_at_times and get_ancestors_at_times functions when relationship intervals are probed.
+    """
+    engine = 'interval'
+
 
 class GetEntitiesAtTimeTest(TestCase):
     """
     Test the get_entities_at_times function.
     """
+    engine = None
+
+    def get_entities_at_times(self, *args, **kwargs):
+        return get_entities_at_times(*args, engine=self.engine, **kwargs)
+
     def test_no_events_no_input(self):
-        res = get_entities_at_times([])
+        res = self.get_entities_at_times([])
         self.assertEquals(res, {})
 
     def test_no_events_w_input(self):
-        res = get_entities_at_times([datetime(2013, 4, 5), datetime(2013, 5, 6)])
+        res = self.get_entities_at_times([datetime(2013, 4, 5), datetime(2013, 5, 6)])
         self.assertEquals(res, {
             datetime(2013, 4, 5): set(),
             datetime(2013, 5, 6): set(),
@@ -371,7 +720,7 @@ class GetEntitiesAtTimeTest(TestCase):
         G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
         G(EntityActivationEvent, was_activated=False, entity=e, time=datetime(2013, 2, 2))
 
-        res = get_entities_at_times([datetime(2012, 4, 5), datetime(2012, 5, 6)])
+        res = self.get_entities_at_times([datetime(2012, 4, 5), datetime(2012, 5, 6)])
         self.assertEquals(res, {
             datetime(2012, 4, 5): set(),
             datetime(2012, 5, 6): set(),
@@ -382,7 +731,7 @@ class GetEntitiesAtTimeTest(TestCase):
         G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
         G(EntityActivationEvent, was_activated=False, entity=e, time=datetime(2013, 2, 3))
 
-        res = get_entities_at_times([datetime(2013, 2, 2), datetime(2012, 5, 6)])
+        res = self.get_entities_at_times([datetime(2013, 2, 2), datetime(2012, 5, 6)])
         self.assertEquals(res, {
             datetime(2013, 2, 2): set([e.id]),
             datetime(2012, 5, 6): set(),
@@ -393,7 +742,7 @@ class GetEntitiesAtTimeTest(TestCase):
         G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
         G(EntityActivationEvent, was_activated=False, entity=e, time=datetime(2013, 2, 3))
 
-        res = get_entities_at_times([datetime(2013, 2, 4)])
+        res = self.get_entities_at_times([datetime(2013, 2, 4)])
         self.assertEquals(res, {
             datetime(2013, 2, 4): set(),
         })
@@ -406,7 +755,7 @@ class GetEntitiesAtTimeTest(TestCase):
         G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 4, 12))
         G(EntityActivationEvent, was_activated=False, entity=e, time=datetime(2013, 3, 4, 12))
 
-        res = get_entities_at_times([datetime(2013, 2, 6), datetime(2012, 5, 6)])
+        res = self.get_entities_at_times([datetime(2013, 2, 6), datetime(2012, 5, 6)])
         self.assertEquals(res, {
             datetime(2013, 2, 6): set([e.id]),
             datetime(2012, 5, 6): set(),
@@ -427,7 +776,7 @@ class GetEntitiesAtTimeTest(TestCase):
         G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 3, 4, 12))
         G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 3, 4, 13))
 
-        res = get_entities_at_times([datetime(2013, 2, 2), datetime(2013, 2, 4, 13), datetime(2013, 3, 5)])
+        res = self.get_entities_at_times([datetime(2013, 2, 2), datetime(2013, 2, 4, 13), datetime(2013, 3, 5)])
 
         self.assertEquals(res, {
             datetime(2013, 2, 2): set([e1.id]),
@@ -450,7 +799,7 @@ class GetEntitiesAtTimeTest(TestCase):
         G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 3, 4, 12))
         G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 3, 4, 13))
 
-        res = get_entities_at_times(
+        res = self.get_entities_at_times(
             [datetime(2013, 2, 2), datetime(2013, 2, 4, 13), datetime(2013, 3, 5)],
             filter_by_entity_ids=[e1.id])
 
@@ -507,3 +856,327 @@ class GetEntitiesAtTimeTest(TestCase):
             datetime(2013, 2, 4, 13): set([e1.id, e2.id]),
             datetime(2013, 3, 5): set([e2.id]),
         })
+
+    def test_w_manager_in_single_query(self):
+        e1 = G(Entity)
+        e2 = G(Entity, is_active=False)
+        G(EntityActivationEvent, was_activated=True, entity=e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 2, 1))
+
+        # The entity filter is compiled into the history query instead of being evaluated beforehand
+        with self.assertNumQueries(1):
+            res = EntityHistory.objects.get_entities_at_times([datetime(2013, 2, 2)])
+
+        self.assertEquals(res, {datetime(2013, 2, 2): set([e1.id])})
+
+    def test_w_empty_queryset(self):
+        e = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
+
+        res = EntityHistory.objects.filter(id__in=[]).get_entities_at_times([datetime(2013, 2, 2)])
+        self.assertEquals(res, {datetime(2013, 2, 2): set()})
+
+    def test_filter_by_queryset(self):
+        e1 = G(Entity)
+        e2 = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 2, 1))
+
+        res = self.get_entities_at_times(
+            [datetime(2013, 2, 2)], filter_by_entity_ids=Entity.objects.filter(id=e2.id).values_list('id', flat=True))
+        self.assertEquals(res, {datetime(2013, 2, 2): set([e2.id])})
+
+    def test_filter_by_many_entity_ids(self):
+        e1 = G(Entity)
+        e2 = G(Entity)
+        e3 = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=e3, time=datetime(2013, 2, 1))
+
+        with patch('entity_history.models.ARRAY_FILTER_SIZE', 1):
+            res = self.get_entities_at_times([datetime(2013, 2, 2)], filter_by_entity_ids=[e1.id, e3.id])
+        self.assertEquals(res, {datetime(2013, 2, 2): set([e1.id, e3.id])})
+
+    def test_filter_by_no_entity_ids(self):
+        e = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
+
+        self.assertEquals(
+            self.get_entities_at_times([datetime(2013, 2, 2)], filter_by_entity_ids=[]), {datetime(2013, 2, 2): set()})
+
+    def test_duplicate_times(self):
+        e = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
+
+        res = self.get_entities_at_times([datetime(2013, 2, 2), datetime(2013, 2, 2)])
+        self.assertEquals(res, {
+            datetime(2013, 2, 2): set([e.id]),
+        })
+
+    def test_deltas(self):
+        e1 = G(Entity)
+        e2 = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=e2, time=datetime(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=False, entity=e1, time=datetime(2013, 2, 3))
+        times = [datetime(2013, 2, 4), datetime(2013, 2, 1, 12), datetime(2013, 2, 2, 12), datetime(2013, 2, 3, 12)]
+
+        res = self.get_entities_at_times(times, deltas=True)
+        self.assertEquals(res.times, sorted(times))
+        self.assertEquals(res.initial, set([e1.id]))
+        self.assertEquals(res.added, {datetime(2013, 2, 2, 12): set([e2.id])})
+        self.assertEquals(res.removed, {datetime(2013, 2, 3, 12): set([e1.id])})
+        self.assertEquals(dict(res.iter_entities()), self.get_entities_at_times(times))
+
+    def test_deltas_w_manager(self):
+        e = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
+
+        res = EntityHistory.objects.get_entities_at_times([datetime(2013, 2, 2)], deltas=True)
+        self.assertEquals(res.get_entities_at_time(datetime(2013, 2, 2)), set([e.id]))
+
+    def test_deltas_no_times(self):
+        self.assertEquals(self.get_entities_at_times([], deltas=True).times, [])
+
+    def test_sparse(self):
+        e = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=False, entity=e, time=datetime(2013, 2, 3))
+
+        res = self.get_entities_at_times(
+            [datetime(2013, 1, 1), datetime(2013, 2, 2), datetime(2013, 2, 4)], sparse=True)
+        self.assertEquals(dict(res), {datetime(2013, 2, 2): set([e.id])})
+
+    def test_sparse_w_manager(self):
+        e = G(Entity)
+        G(EntityActivationEvent, was_activated=True, entity=e, time=datetime(2013, 2, 1))
+
+        res = EntityHistory.objects.get_entities_at_times([datetime(2013, 1, 1), datetime(2013, 2, 2)], sparse=True)
+        self.assertEquals(dict(res), {datetime(2013, 2, 2): set([e.id])})
+
+
+class GetEntitiesAtTimePythonEngineTest(GetEntitiesAtTimeTest):
+    """
+    Test the get_entities_at_times function when events are replayed in python.
+    """
+    engine = 'python'
+
+
+class GetEntitiesAtTimeIntervalEngineTest(GetEntitiesAtTimeTest):
+    """
+    Test the get_entities_at_times function when entity intervals are probed. The intervals are rebuilt from the
+    events that are created in the tests.
+    """
+    engine = 'interval'
+
+    def get_entities_at_times(self, *args, **kwargs):
+        rebuild_entity_activation_intervals()
+        return super(GetEntitiesAtTimeIntervalEngineTest, self).get_entities_at_times(*args, **kwargs)
+
+
+class AsOfTest(TestCase):
+    """
+    Tests filtering EntityHistory querysets on the history of entities.
+    """
+    def setUp(self):
+        self.super_e1 = G(Entity)
+        self.super_e2 = G(Entity)
+        self.e1 = G(Entity)
+        self.e2 = G(Entity, is_active=False)
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e1, sub_entity=self.e1,
+            time=datetime(2013, 2, 3))
+
+    def test_as_of(self):
+        self.assertEquals(set(EntityHistory.all_objects.as_of(datetime(2013, 2, 1))), set())
+        self.assertEquals(set(EntityHistory.all_objects.as_of(datetime(2013, 2, 2, 12))), set([self.e1, self.e2]))
+        self.assertEquals(set(EntityHistory.all_objects.as_of(datetime(2013, 2, 4))), set([self.e2]))
+
+    def test_as_of_chained(self):
+        qset = EntityHistory.all_objects.as_of(datetime(2013, 2, 2, 12))
+
+        self.assertEquals(qset.filter(id=self.e1.id).count(), 1)
+        self.assertEquals(list(qset.order_by('-id').values_list('id', flat=True)[:1]), [self.e2.id])
+        self.assertEquals(set(qset.as_of(datetime(2013, 2, 4))), set([self.e2]))
+
+    def test_as_of_active_manager(self):
+        self.assertEquals(set(EntityHistory.objects.as_of(datetime(2013, 2, 2, 12))), set([self.e1]))
+
+    def test_sub_entities_of_as_of(self):
+        self.assertEquals(
+            set(EntityHistory.all_objects.sub_entities_of_as_of([self.super_e1.id], datetime(2013, 2, 2))),
+            set([self.e1]))
+        self.assertEquals(
+            set(EntityHistory.all_objects.sub_entities_of_as_of(
+                [self.super_e1.id, self.super_e2.id], datetime(2013, 2, 2, 12))),
+            set([self.e1, self.e2]))
+        self.assertEquals(
+            set(EntityHistory.all_objects.sub_entities_of_as_of([self.super_e1.id], datetime(2013, 2, 4))), set())
+
+    def test_sub_entities_of_as_of_and_as_of(self):
+        qset = EntityHistory.all_objects.sub_entities_of_as_of(
+            [self.super_e1.id, self.super_e2.id], datetime(2013, 2, 2, 12)).as_of(datetime(2013, 2, 4))
+
+        self.assertEquals(set(qset), set([self.e2]))
+
+
+class AnnotateHistoryTest(TestCase):
+    """
+    Tests annotating EntityHistory querysets with the history of entities.
+    """
+    def setUp(self):
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        self.e3 = G(Entity)
+        EntityActivationEvent.objects.all().delete()
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 5))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 6))
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 8))
+        G(EntityActivationEvent, was_activated=False, entity=self.e2, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 3))
+
+    def test_no_annotations(self):
+        self.assertEquals(EntityHistory.all_objects.annotate_history().count(), 3)
+
+    def test_was_active_at(self):
+        res = EntityHistory.all_objects.annotate_history(was_active_at=datetime(2013, 2, 4)).order_by('id')
+
+        self.assertEquals([e.was_active_at for e in res], [True, True, False])
+
+    def test_active_duration(self):
+        res = EntityHistory.all_objects.annotate_history(
+            active_between=(datetime(2013, 2, 2), datetime(2013, 2, 9))).order_by('id')
+
+        self.assertEquals([e.active_duration for e in res], [timedelta(days=4), timedelta(days=6), timedelta(0)])
+
+    def test_activation_times(self):
+        res = EntityHistory.all_objects.annotate_history(activation_times=True).order_by('id')
+
+        self.assertEquals(
+            [(e.first_activation_time, e.last_deactivation_time) for e in res], [
+                (datetime(2013, 2, 1), datetime(2013, 2, 5)),
+                (datetime(2013, 2, 3), None),
+                (None, None),
+            ])
+
+    def test_all_annotations_chained(self):
+        res = EntityHistory.all_objects.annotate_history(
+            was_active_at=datetime(2013, 2, 4), active_between=(datetime(2013, 2, 2), datetime(2013, 2, 9)),
+            activation_times=True
+        ).filter(id=self.e2.id).values_list('was_active_at', 'active_duration', 'first_activation_time')
+
+        self.assertEquals(list(res), [(True, timedelta(days=6), datetime(2013, 2, 3))])
+
+
+class GetEngineTest(TestCase):
+    """
+    Tests the _get_engine function.
+    """
+    def test_default_postgres(self):
+        with patch('entity_history.models.connection') as mock_connection:
+            mock_connection.vendor = 'postgresql'
+            self.assertEquals(_get_engine(None), 'sql')
+
+    def test_default_postgres_many_times(self):
+        with patch('entity_history.models.connection') as mock_connection:
+            mock_connection.vendor = 'postgresql'
+            self.assertEquals(_get_engine(None, SQL_ENGINE_MAX_TIMES), 'sql')
+            self.assertEquals(_get_engine(None, SQL_ENGINE_MAX_TIMES + 1), 'python')
+
+    def test_default_engine_of_many_times(self):
+        times = [datetime(2013, 1, 1) + timedelta(days=i) for i in range(365)]
+        with patch.dict('entity_history.models.ENTITY_ENGINES', {'python': MagicMock(return_value=[])}) as engines:
+            get_entities_at_times(times)
+
+            self.assertEquals(engines['python'].call_count, 1)
+
+    def test_default_other_backend(self):
+        with patch('entity_history.models.connection') as mock_connection:
+            mock_connection.vendor = 'sqlite'
+            self.assertEquals(_get_engine(None), 'python')
+
+    def test_provided_engine(self):
+        self.assertEquals(_get_engine('python'), 'python')
+
+    def test_unsupported_engine(self):
+        with self.assertRaises(ValueError):
+            get_entities_at_times([datetime(2013, 2, 2)], engine='invalid')
+
+
+class FilterByIdsTest(TestCase):
+    """
+    Tests the _filter_by_ids function.
+    """
+    def setUp(self):
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        self.e3 = G(Entity)
+        self.events = EntityActivationEvent.objects.values_list('entity_id', flat=True)
+
+    def test_few_ids(self):
+        events = _filter_by_ids(self.events, 'entity_id', [self.e1.id, self.e2.id])
+
+        self.assertIn(' IN (', str(events.query))
+        self.assertEquals(set(events), set([self.e1.id, self.e2.id]))
+
+    @patch('entity_history.models.ARRAY_FILTER_SIZE', 1)
+    def test_many_ids(self):
+        events = _filter_by_ids(self.events, 'entity_id', iter([self.e1.id, self.e2.id]))
+
+        self.assertIn('= ANY(', str(events.query))
+        self.assertEquals(set(events), set([self.e1.id, self.e2.id]))
+
+    @patch('entity_history.models.ARRAY_FILTER_SIZE', 1)
+    def test_many_ids_other_backend(self):
+        with patch.object(connection, 'vendor', 'sqlite'):
+            events = _filter_by_ids(self.events, 'entity_id', [self.e1.id, self.e2.id])
+
+        self.assertIn(' IN (', str(events.query))
+
+    @patch('entity_history.models.ARRAY_FILTER_SIZE', 1)
+    def test_queryset(self):
+        events = _filter_by_ids(self.events, 'entity_id', Entity.objects.filter(id=self.e3.id).values_list('id'))
+
+        self.assertEquals(set(events), set([self.e3.id]))
+
+
+class StreamRowsTest(TestCase):
+    """
+    Tests the _stream_rows function.
+    """
+    def setUp(self):
+        e = G(Entity)
+        for day in range(1, 6):
+            G(EntityActivationEvent, was_activated=day % 2 == 1, entity=e, time=datetime(2013, 2, day))
+        self.events = EntityActivationEvent.objects.order_by('time').values_list('entity_id', 'time', 'was_activated')
+
+    def test_stream_in_chunks(self):
+        self.assertEquals(list(_stream_rows(self.events, chunk_size=2)), list(self.events))
+
+    def test_stream_other_backend(self):
+        with patch.object(connection, 'vendor', 'sqlite'):
+            self.assertEquals(list(_stream_rows(self.events, chunk_size=2)), list(self.events))
+
+    def test_stream_empty_result_set(self):
+        self.assertEquals(list(_stream_rows(self.events.filter(entity_id__in=[]))), [])
+
+    def test_stream_closed_early(self):
+        rows = _stream_rows(self.events, chunk_size=2)
+        self.assertEquals(next(rows), self.events[0])
+        rows.close()
+
+        # The connection can still be used after the stream is closed
+        self.assertEquals(EntityActivationEvent.objects.count(), 5)
@@ -4,7 +4,10 @@ from django.test import TransactionTestCase
 from django_dynamic_fixture import G, N
 from entity.models import EntityRelationship, Entity
 
-from entity_history.models import EntityRelationshipActivationEvent
+from entity_history.models import (
+    EntityRelationshipActivationEvent, EntityRelationshipActivationState, EntityRelationshipInterval
+)
+from entity_history.sql.states import rebuild_entity_relationship_activation_states
 
 
 class EntityRelationshipActivationTriggerTests(TransactionTestCase):
@@ -177,3 +180,48 @@ class EntityRelationshipActivationTriggerTests(TransactionTestCase):
         self.assertFalse(events[1].was_activated)
         self.assertTrue(events[2].was_activated)
         self.assertFalse(events[3].was_activated)
+
+    def test_entity_relationship_intervals(self):
+        """
+        Test that an interval is opened when a relationship is created and closed when it is deleted
+        """
+        entity_relation = G(EntityRelationship)
+        sub_entity = entity_relation.sub_entity
+        super_entity = entity_relation.super_entity
+        entity_relation.delete()
+        G(EntityRelationship, sub_entity=sub_entity, super_entity=super_entity)
+
+        events = list(EntityRelationshipActivationEvent.objects.order_by('time'))
+        intervals = list(EntityRelationshipInterval.objects.order_by('start_time'))
+        self.assertEqual(len(intervals), 2)
+        self.assertEqual(intervals[0].sub_entity, sub_entity)
+        self.assertEqual(intervals[0].super_entity, super_entity)
+        self.assertEqual(intervals[0].start_time, events[0].time)
+        self.assertEqual(intervals[0].end_time, events[1].time)
+        self.assertEqual(intervals[1].start_time, events[2].time)
+        self.assertIsNone(intervals[1].end_time)
+
+    def test_entity_relationship_state(self):
+        """
+        Test that the current state of a relationship follows its latest event
+        """
+        entity_relation = G(EntityRelationship)
+        state = EntityRelationshipActivationState.objects.get()
+        self.assertEqual(state.sub_entity, entity_relation.sub_entity)
+        self.assertEqual(state.super_entity, entity_relation.super_entity)
+        self.assertTrue(state.was_activated)
+
+        entity_relation.delete()
+        state = EntityRelationshipActivationState.objects.get()
+        self.assertFalse(state.was_activated)
+        self.assertEqual(state.time, EntityRelationshipActivationEvent.objects.order_by('time').last().time)
+
+    def test_rebuild_entity_relationship_states(self):
+        entity_relation = G(EntityRelationship)
+        EntityRelationshipActivationState.objects.all().delete()
+
+        rebuild_entity_relationship_activation_states()
+
+        self.assertEqual(
+            list(EntityRelationshipActivationState.objects.values_list('super_entity_id', 'sub_entity_id')),
+            [(entity_relation.super_entity_id, entity_relation.sub_entity_id)])
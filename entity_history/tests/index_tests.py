@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django_dynamic_fixture import G
+from entity.models import Entity
+
+from entity_history.models import EntityActivationEvent, EntityHistory, EntityRelationshipActivationEvent
+from entity_history.sql.queries import (
+    ENTITIES_AT_TIMES_SQL, SUB_ENTITIES_AT_PAIRS_SQL, SUB_ENTITIES_AT_TIMES_SQL, SUPER_ENTITIES_AT_TIMES_SQL
+)
+
+
+class HistoryIndexTest(TestCase):
+    """
+    Tests that the history queries read the latest events of entities and relationships with index only scans.
+    Sequential scans and sorts are disabled since the planner prefers them over indexes for the small tables of the
+    tests.
+    """
+    def setUp(self):
+        self.super_e = G(Entity)
+        self.sub_e = G(Entity)
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.sub_e,
+            time=datetime(2013, 2, 1))
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE entity_history_entityactivationevent')
+            cursor.execute('ANALYZE entity_history_entityrelationshipactivationevent')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+
+        self.params = {
+            'times': [datetime(2013, 2, 2)],
+            'max_time': datetime(2013, 2, 2),
+            'super_entity_ids': [self.super_e.id],
+            'sub_entity_ids': [self.sub_e.id],
+        }
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN {0}'.format(sql), params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertIndexOnlyScan(self, plan, model):
+        self.assertRegexpMatches(plan, r'Index Only Scan (Backward )?using \S+ on {0}'.format(model._meta.db_table))
+        self.assertNotIn('Sort', plan)
+
+    def test_entities_at_times(self):
+        plan = self.explain(ENTITIES_AT_TIMES_SQL.format(entity_filter=''), self.params)
+        self.assertIndexOnlyScan(plan, EntityActivationEvent)
+
+    def test_sub_entities_at_times(self):
+        plan = self.explain(SUB_ENTITIES_AT_TIMES_SQL.format(entity_filter=''), self.params)
+        self.assertIndexOnlyScan(plan, EntityRelationshipActivationEvent)
+
+    def test_sub_entities_at_pairs(self):
+        plan = self.explain(SUB_ENTITIES_AT_PAIRS_SQL.format(entity_filter=''), self.params)
+        self.assertIndexOnlyScan(plan, EntityRelationshipActivationEvent)
+
+    def test_super_entities_at_times(self):
+        plan = self.explain(SUPER_ENTITIES_AT_TIMES_SQL.format(entity_filter=''), self.params)
+        self.assertIndexOnlyScan(plan, EntityRelationshipActivationEvent)
+
+    def test_active_as_of(self):
+        qset = EntityHistory.all_objects.as_of(datetime(2013, 2, 2))
+        sql, params = qset.values_list('id', flat=True).query.sql_with_params()
+
+        self.assertIndexOnlyScan(self.explain(sql, params), EntityActivationEvent)
+
+    def test_sub_entities_of_as_of(self):
+        qset = EntityHistory.all_objects.sub_entities_of_as_of([self.super_e.id], datetime(2013, 2, 2))
+        sql, params = qset.values_list('id', flat=True).query.sql_with_params()
+
+        self.assertIndexOnlyScan(self.explain(sql, params), EntityRelationshipActivationEvent)
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from django.test import TestCase
+from django_dynamic_fixture import G
+from entity.models import Entity
+
+from entity_history.matrix import get_entity_matrix_at_times, get_sub_entity_matrix_at_times
+from entity_history.models import (
+    EntityActivationEvent, EntityRelationshipActivationEvent, get_entities_at_times, get_sub_entities_at_times
+)
+
+
+class GetSubEntityMatrixAtTimesTest(TestCase):
+    """
+    Tests the get_sub_entity_matrix_at_times function.
+    """
+    def setUp(self):
+        self.super_e1 = G(Entity)
+        self.super_e2 = G(Entity)
+        self.sub_e1 = G(Entity)
+        self.sub_e2 = G(Entity)
+
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e1, sub_entity=self.sub_e2,
+            time=datetime(2013, 2, 2))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e1, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e2, sub_entity=self.sub_e1,
+            time=datetime(2013, 2, 3))
+        self.times = [datetime(2013, 2, 4), datetime(2013, 2, 1), datetime(2013, 2, 2, 12), datetime(2013, 2, 3)]
+
+    def test_no_input(self):
+        res = get_sub_entity_matrix_at_times([], [])
+
+        self.assertEquals(res.times, [])
+        self.assertEquals(res.active.shape, (0, 0))
+
+    def test_matrix(self):
+        res = get_sub_entity_matrix_at_times([self.super_e1.id, self.super_e2.id], self.times)
+
+        self.assertEquals(res.times, sorted(self.times))
+        self.assertEquals(
+            list(zip(res.super_entity_ids.tolist(), res.entity_ids.tolist(), res.active.tolist())), [
+                (self.super_e1.id, self.sub_e1.id, [False, True, True, False]),
+                (self.super_e1.id, self.sub_e2.id, [False, True, True, True]),
+                (self.super_e2.id, self.sub_e1.id, [False, False, False, True]),
+            ])
+
+    def test_matches_get_sub_entities_at_times(self):
+        res = get_sub_entity_matrix_at_times(
+            [self.super_e1.id, self.super_e2.id], self.times, filter_by_entity_ids=[self.sub_e1.id])
+
+        self.assertEquals({
+            (se_id, t): res.get_entities_at_time(t, super_entity_id=se_id)
+            for se_id in [self.super_e1.id, self.super_e2.id]
+            for t in self.times
+        }, get_sub_entities_at_times(
+            [self.super_e1.id, self.super_e2.id], self.times, filter_by_entity_ids=[self.sub_e1.id]))
+
+
+class GetEntityMatrixAtTimesTest(TestCase):
+    """
+    Tests the get_entity_matrix_at_times function.
+    """
+    def setUp(self):
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=False, entity=self.e2, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 3))
+        self.times = [datetime(2013, 2, 1, 12), datetime(2013, 2, 2, 12), datetime(2013, 2, 3, 12)]
+
+    def test_no_input(self):
+        self.assertEquals(get_entity_matrix_at_times([]).active.shape, (0, 0))
+
+    def test_no_events(self):
+        res = get_entity_matrix_at_times([datetime(2012, 1, 1)])
+
+        self.assertEquals(res.entity_ids.tolist(), [])
+        self.assertEquals(res.active.shape, (0, 1))
+
+    def test_matrix(self):
+        res = get_entity_matrix_at_times(self.times)
+
+        self.assertEquals(res.entity_ids.tolist(), [self.e1.id, self.e2.id])
+        self.assertEquals(res.active.tolist(), [[True, True, False], [False, True, True]])
+
+    def test_matches_get_entities_at_times(self):
+        res = get_entity_matrix_at_times(self.times, filter_by_entity_ids=[self.e2.id])
+
+        self.assertEquals(
+            {t: res.get_entities_at_time(t) for t in self.times},
+            get_entities_at_times(self.times, filter_by_entity_ids=[self.e2.id]))
+
+    def test_get_entities_at_missing_time(self):
+        with self.assertRaises(KeyError):
+            get_entity_matrix_at_times(self.times).get_entities_at_time(datetime(2013, 2, 4))
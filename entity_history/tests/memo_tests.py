@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django_dynamic_fixture import G
+from entity.models import Entity
+from mock import patch
+
+from entity_history.memo import LocalMemoCache, clear_history_cache
+from entity_history.models import (
+    EntityActivationEvent, EntityRelationshipActivationEvent, get_entities_at_times, get_sub_entities_at_times
+)
+
+
+@override_settings(ENTITY_HISTORY_CACHE='default')
+class MemoizeTest(TestCase):
+    """
+    Tests memoizing the results of historical queries.
+    """
+    def setUp(self):
+        caches['default'].clear()
+        clear_history_cache()
+
+        self.super_e = G(Entity)
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        EntityActivationEvent.objects.all().delete()
+        EntityRelationshipActivationEvent.objects.all().delete()
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 3))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 1))
+
+    def test_memoized(self):
+        self.assertEquals(get_entities_at_times([datetime(2013, 2, 2)]), {datetime(2013, 2, 2): set([self.e1.id])})
+
+        # Only the events after the watermark are read
+        with self.assertNumQueries(1):
+            self.assertEquals(
+                get_entities_at_times([datetime(2013, 2, 2)]), {datetime(2013, 2, 2): set([self.e1.id])})
+
+    def test_memoized_sub_entities(self):
+        get_sub_entities_at_times([self.super_e.id], [datetime(2013, 2, 2)])
+
+        with self.assertNumQueries(1):
+            self.assertEquals(get_sub_entities_at_times([self.super_e.id], [datetime(2013, 2, 2)]), {
+                (self.super_e.id, datetime(2013, 2, 2)): set([self.e1.id]),
+            })
+
+    def test_arguments_are_normalized(self):
+        get_entities_at_times([datetime(2013, 2, 2), datetime(2013, 2, 4)], filter_by_entity_ids=[self.e1.id])
+
+        with self.assertNumQueries(1):
+            get_entities_at_times([datetime(2013, 2, 4), datetime(2013, 2, 2)], filter_by_entity_ids=set([self.e1.id]))
+
+    def test_new_event_before_time(self):
+        get_entities_at_times([datetime(2013, 2, 2)])
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 1, 15))
+
+        self.assertEquals(
+            get_entities_at_times([datetime(2013, 2, 2)]), {datetime(2013, 2, 2): set([self.e1.id, self.e2.id])})
+
+    def test_new_event_after_time(self):
+        get_entities_at_times([datetime(2013, 2, 2)])
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 3, 1))
+
+        with self.assertNumQueries(1):
+            self.assertEquals(
+                get_entities_at_times([datetime(2013, 2, 2)]), {datetime(2013, 2, 2): set([self.e1.id])})
+
+    def test_result_is_copied(self):
+        get_entities_at_times([datetime(2013, 2, 2)])[datetime(2013, 2, 2)].add(self.e2.id)
+
+        self.assertEquals(get_entities_at_times([datetime(2013, 2, 2)]), {datetime(2013, 2, 2): set([self.e1.id])})
+
+    def test_clear_history_cache(self):
+        get_entities_at_times([datetime(2013, 2, 2)])
+        EntityActivationEvent.objects.filter(entity=self.e1).delete()
+        clear_history_cache()
+
+        self.assertEquals(get_entities_at_times([datetime(2013, 2, 2)]), {datetime(2013, 2, 2): set()})
+
+    @patch('entity_history.models.memoize')
+    def test_recent_times_are_not_memoized(self, mock_memoize):
+        get_entities_at_times([timezone.now()])
+
+        self.assertFalse(mock_memoize.called)
+
+    @patch('entity_history.models.memoize')
+    def test_queryset_filter_is_not_memoized(self, mock_memoize):
+        get_entities_at_times([datetime(2013, 2, 2)], filter_by_entity_ids=Entity.objects.values_list('id', flat=True))
+
+        self.assertFalse(mock_memoize.called)
+
+    @override_settings(ENTITY_HISTORY_CACHE=None)
+    @patch('entity_history.models.memoize')
+    def test_disabled(self, mock_memoize):
+        get_entities_at_times([datetime(2013, 2, 2)])
+
+        self.assertFalse(mock_memoize.called)
+
+
+class LocalMemoCacheTest(SimpleTestCase):
+    """
+    Tests the least recently used cache of memoized results.
+    """
+    def test_evict_least_recently_used(self):
+        cache = LocalMemoCache(max_size=6)
+        cache.set('a', set([1, 2]))
+        cache.set('b', set([3, 4]))
+        cache.get('a')
+        cache.set('c', set([5, 6, 7]))
+
+        self.assertEquals(cache.get('a'), set([1, 2]))
+        self.assertIsNone(cache.get('b'))
+        self.assertEquals(cache.size, 5)
+
+    def test_result_larger_than_cache(self):
+        cache = LocalMemoCache(max_size=2)
+        cache.set('a', set([1, 2, 3]))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(cache.size, 0)
@@ -0,0 +1,145 @@
+from datetime import datetime
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from django_dynamic_fixture import G
+from entity.models import Entity
+from mock import patch
+
+from entity_history.models import (
+    DetachedEventPartition, EntityActivationEvent, EntityHistory, create_history_checkpoint, get_entities_at_times,
+    get_entity_counts_at_times
+)
+from entity_history.sql.partitions import (
+    MINIMUM_SERVER_VERSION, detach_event_partitions, get_partition_interval, partition_event_tables,
+    unpartition_event_tables
+)
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [table])
+        return cursor.fetchone()[0] == 'p'
+
+
+@override_settings(ENTITY_HISTORY_PARTITION_INTERVAL='year')
+class PartitionEventTablesTest(TransactionTestCase):
+    """
+    Tests partitioning the event tables on the time of the events.
+    """
+    def setUp(self):
+        if connection.pg_version < MINIMUM_SERVER_VERSION:
+            self.skipTest('Partitioning the event tables requires postgres server version {0} or later'.format(
+                MINIMUM_SERVER_VERSION))
+
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        EntityActivationEvent.objects.all().delete()
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2014, 2, 1))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2015, 2, 1))
+
+    def tearDown(self):
+        unpartition_event_tables()
+
+    def test_partition_event_tables(self):
+        times = [datetime(2013, 6, 1), datetime(2014, 6, 1), datetime(2015, 6, 1)]
+        expected = get_entities_at_times(times)
+
+        partitions = partition_event_tables(ahead=1)
+
+        self.assertTrue(is_partitioned('entity_history_entityactivationevent'))
+        self.assertTrue(is_partitioned('entity_history_entityrelationshipactivationevent'))
+        self.assertIn('entity_history_entityactivationevent_p20130101', partitions)
+        self.assertEquals(EntityActivationEvent.objects.count(), 3)
+        self.assertEquals(get_entities_at_times(times), expected)
+        self.assertEquals(get_entities_at_times(times, engine='python'), expected)
+
+    def test_partition_event_tables_again(self):
+        partition_event_tables(ahead=1)
+
+        self.assertEquals(partition_event_tables(ahead=1), [])
+
+    def test_triggers_write_to_partitions(self):
+        partition_event_tables(ahead=1)
+        e = G(Entity)
+
+        self.assertTrue(EntityActivationEvent.objects.filter(entity=e).exists())
+
+    def test_detach_event_partitions(self):
+        partition_event_tables(ahead=1)
+        create_history_checkpoint(datetime(2014, 6, 1))
+
+        detached = detach_event_partitions(datetime(2014, 6, 1), drop=True)
+
+        self.assertEquals(detached, ['entity_history_entityactivationevent_p20130101'])
+        self.assertEquals(EntityActivationEvent.objects.count(), 2)
+
+        # The history after the checkpoint is resolved from the checkpoint by the default engine
+        times = [datetime(2014, 6, 1), datetime(2014, 12, 1), datetime(2015, 6, 1)]
+        self.assertEquals(get_entities_at_times(times), {
+            datetime(2014, 6, 1): set([self.e1.id, self.e2.id]),
+            datetime(2014, 12, 1): set([self.e1.id, self.e2.id]),
+            datetime(2015, 6, 1): set([self.e2.id]),
+        })
+        self.assertEquals(get_entity_counts_at_times(times), {
+            datetime(2014, 6, 1): 2,
+            datetime(2014, 12, 1): 2,
+            datetime(2015, 6, 1): 1,
+        })
+
+        # Queries that read every event of an entity can no longer be answered
+        self.assertEquals(
+            list(DetachedEventPartition.objects.values_list('name', flat=True)),
+            ['entity_history_entityactivationevent_p20130101'])
+        with self.assertRaises(ValueError):
+            EntityHistory.objects.as_of(datetime(2015, 6, 1))
+        with self.assertRaises(ValueError):
+            EntityHistory.objects.annotate_history(was_active_at=datetime(2015, 6, 1))
+
+    def test_detach_event_partitions_without_checkpoint(self):
+        partition_event_tables(ahead=1)
+        create_history_checkpoint(datetime(2014, 1, 1))
+
+        with self.assertRaises(ValueError):
+            detach_event_partitions(datetime(2014, 6, 1))
+        self.assertEquals(EntityActivationEvent.objects.count(), 3)
+
+    def test_detach_unpartitioned_event_tables(self):
+        self.assertEquals(detach_event_partitions(datetime(2014, 6, 1)), [])
+
+    def test_unpartition_event_tables(self):
+        partition_event_tables(ahead=1)
+        unpartition_event_tables()
+
+        self.assertFalse(is_partitioned('entity_history_entityactivationevent'))
+        self.assertEquals(EntityActivationEvent.objects.count(), 3)
+
+    @patch('entity_history.sql.partitions.MINIMUM_SERVER_VERSION', 10 ** 7)
+    def test_partition_event_tables_old_server_version(self):
+        with self.assertRaises(Exception):
+            partition_event_tables()
+
+    @override_settings(ENTITY_HISTORY_PARTITION_INTERVAL='invalid')
+    def test_invalid_partition_interval(self):
+        with self.assertRaises(ValueError):
+            get_partition_interval()
+
+    def test_partition_history_events_command(self):
+        stdout = StringIO()
+        call_command('partition_history_events', ahead=0, stdout=stdout)
+        call_command('partition_history_events', unpartition=True, stdout=stdout)
+
+        self.assertEquals(stdout.getvalue().split('\n')[1], 'Unpartitioned the event tables')
+        self.assertFalse(is_partitioned('entity_history_entityactivationevent'))
+
+    def test_detach_history_partitions_command(self):
+        partition_event_tables(ahead=0)
+        stdout = StringIO()
+        call_command('detach_history_partitions', days=365 * 100, stdout=stdout)
+
+        self.assertEquals(stdout.getvalue().strip(), 'Detached 0 event partitions')
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from django_dynamic_fixture import G
+from entity.models import Entity, EntityRelationship
+
+from entity_history.cursor import HistoryCursor
+from entity_history.models import (
+    EntityActivationEvent, EntityActivationInterval, EntityActivationQueueItem, EntityActivationState,
+    EntityRelationshipActivationEvent, EntityRelationshipActivationQueueItem, EntityRelationshipInterval,
+    HistoryCheckpoint, create_history_checkpoints, get_entities_at_times
+)
+from entity_history.sql.queue import drain_history_queue, get_history_queue_lag, get_oldest_queued_time
+from entity_history.sql.triggers import refresh_triggers
+
+
+class HistoryQueueTest(TransactionTestCase):
+    """
+    Tests queuing changes with the queue triggers and draining the queue.
+    """
+    def setUp(self):
+        with override_settings(ENTITY_HISTORY_TRIGGER_MODE='queue'):
+            refresh_triggers()
+
+    def tearDown(self):
+        refresh_triggers()
+
+    def test_changes_are_queued(self):
+        e = G(Entity, is_active=True)
+        Entity.all_objects.filter(id=e.id).update(is_active=False)
+        Entity.all_objects.filter(id=e.id).update(is_active=False)
+
+        self.assertFalse(EntityActivationEvent.objects.exists())
+        self.assertEquals(
+            list(EntityActivationQueueItem.objects.order_by('id').values_list('entity_id', 'is_active', 'was_created')),
+            [(e.id, True, True), (e.id, False, False)])
+
+    def test_drain_entities(self):
+        e1 = G(Entity, is_active=True)
+        e2 = G(Entity, is_active=False)
+        Entity.all_objects.filter(id=e1.id).update(is_active=False)
+        Entity.all_objects.filter(id=e1.id).update(is_active=True)
+
+        self.assertEquals(drain_history_queue(), 4)
+        self.assertFalse(EntityActivationQueueItem.objects.exists())
+        self.assertEquals(
+            list(EntityActivationEvent.objects.order_by('id').values_list('entity_id', 'was_activated')),
+            [(e1.id, True), (e2.id, False), (e1.id, False), (e1.id, True)])
+        self.assertEquals(
+            set(EntityActivationState.objects.values_list('entity_id', 'was_activated')),
+            set([(e1.id, True), (e2.id, False)]))
+        self.assertEquals(
+            list(EntityActivationInterval.objects.order_by('id').values_list('entity_id', 'end_time')),
+            [(e1.id, EntityActivationEvent.objects.get(entity=e1, was_activated=False).time), (e1.id, None)])
+
+    def test_drain_relationships(self):
+        super_e = G(Entity)
+        sub_e = G(Entity)
+        G(EntityRelationship, super_entity=super_e, sub_entity=sub_e)
+        EntityRelationship.objects.filter(super_entity=super_e).delete()
+        G(EntityRelationship, super_entity=super_e, sub_entity=sub_e)
+
+        drain_history_queue()
+
+        self.assertFalse(EntityRelationshipActivationQueueItem.objects.exists())
+        self.assertEquals(
+            list(EntityRelationshipActivationEvent.objects.order_by('id').values_list(
+                'sub_entity_id', 'was_activated')),
+            [(sub_e.id, True), (sub_e.id, False), (sub_e.id, True)])
+        self.assertEquals(EntityRelationshipInterval.objects.filter(end_time__isnull=True).count(), 1)
+
+    def test_drain_in_batches(self):
+        e = G(Entity, is_active=True)
+        for is_active in [False, True, False]:
+            Entity.all_objects.filter(id=e.id).update(is_active=is_active)
+
+        self.assertEquals(drain_history_queue(batch_size=1), 4)
+        self.assertEquals(
+            list(EntityActivationEvent.objects.order_by('id').values_list('was_activated', flat=True)),
+            [True, False, True, False])
+        self.assertEquals(EntityActivationInterval.objects.filter(end_time__isnull=True).count(), 0)
+        self.assertEquals(EntityActivationInterval.objects.count(), 2)
+
+    def test_drain_deleted_entity(self):
+        e = G(Entity, is_active=True)
+        Entity.all_objects.filter(id=e.id).delete()
+
+        self.assertEquals(drain_history_queue(), 1)
+        self.assertFalse(EntityActivationEvent.objects.exists())
+
+    def test_drained_history_is_queryable(self):
+        e = G(Entity, is_active=True)
+        drain_history_queue()
+
+        self.assertEquals(get_entities_at_times([datetime(2100, 1, 1)]), {datetime(2100, 1, 1): set([e.id])})
+
+    def test_checkpoints_wait_for_queued_changes(self):
+        e = G(Entity, is_active=True)
+        drain_history_queue()
+        Entity.all_objects.filter(id=e.id).update(is_active=False)
+
+        # No checkpoints are created past the deactivation while it is still queued
+        self.assertEquals(create_history_checkpoints(timedelta(days=3650), end_time=datetime(2100, 1, 1)), [])
+        self.assertIsNotNone(get_oldest_queued_time())
+
+        drain_history_queue()
+        self.assertIsNone(get_oldest_queued_time())
+        create_history_checkpoints(timedelta(days=3650), end_time=datetime(2100, 1, 1))
+        self.assertTrue(HistoryCheckpoint.objects.exists())
+        self.assertEquals(get_entities_at_times([datetime(2100, 1, 1)]), {datetime(2100, 1, 1): set()})
+        self.assertEquals(
+            get_entities_at_times([datetime(2100, 1, 1)], engine='python'), {datetime(2100, 1, 1): set()})
+
+    def test_cursor_replays_drained_changes(self):
+        e = G(Entity, is_active=True)
+        drain_history_queue()
+        Entity.all_objects.filter(id=e.id).update(is_active=False)
+
+        cursor = HistoryCursor()
+        cursor.advance_to(datetime(2100, 1, 1))
+        self.assertEquals(cursor.get_entities(), set([e.id]))
+
+        # The deactivation happened long before the settle time of the cursor but is replayed since it was queued
+        drain_history_queue()
+        cursor.advance_to(datetime(2100, 1, 2))
+        self.assertEquals(cursor.get_entities(), set())
+
+    def test_history_queue_lag(self):
+        self.assertEquals(get_history_queue_lag(), timedelta())
+
+        G(EntityActivationQueueItem, time=datetime(2013, 2, 1))
+        self.assertTrue(get_history_queue_lag() > timedelta(days=1))
+
+    def test_refresh_triggers_drains_queue(self):
+        G(Entity, is_active=True)
+        refresh_triggers()
+
+        self.assertFalse(EntityActivationQueueItem.objects.exists())
+        self.assertEquals(EntityActivationEvent.objects.count(), 1)
+
+    def test_drain_history_queue_command(self):
+        G(Entity, is_active=True)
+        stdout = StringIO()
+        call_command('drain_history_queue', stdout=stdout)
+
+        self.assertEquals(stdout.getvalue().strip(), 'Drained 1 queued history changes')
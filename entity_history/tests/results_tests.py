@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from entity_history.results import EntityDeltas, SparseEntityResults
+
+
+class EntityDeltasTest(SimpleTestCase):
+    """
+    Tests the EntityDeltas class.
+    """
+    def setUp(self):
+        self.deltas = EntityDeltas()
+        self.deltas.append(datetime(2013, 1, 1), set([1, 2]))
+        self.deltas.append(datetime(2013, 1, 2), set([1, 2]))
+        self.deltas.append(datetime(2013, 1, 3), set([2, 3]))
+
+    def test_append(self):
+        self.assertEquals(self.deltas.times, [datetime(2013, 1, 1), datetime(2013, 1, 2), datetime(2013, 1, 3)])
+        self.assertEquals(self.deltas.initial, set([1, 2]))
+        self.assertEquals(self.deltas.added, {datetime(2013, 1, 3): set([3])})
+        self.assertEquals(self.deltas.removed, {datetime(2013, 1, 3): set([1])})
+
+    def test_iter_entities(self):
+        self.assertEquals(list(self.deltas.iter_entities()), [
+            (datetime(2013, 1, 1), set([1, 2])),
+            (datetime(2013, 1, 2), set([1, 2])),
+            (datetime(2013, 1, 3), set([2, 3])),
+        ])
+
+    def test_get_entities_at_time(self):
+        self.assertEquals(self.deltas.get_entities_at_time(datetime(2013, 1, 2)), set([1, 2]))
+        self.assertEquals(self.deltas.get_entities_at_time(datetime(2013, 1, 3)), set([2, 3]))
+
+    def test_get_entities_at_missing_time(self):
+        with self.assertRaises(KeyError):
+            self.deltas.get_entities_at_time(datetime(2013, 1, 4))
+
+    def test_empty(self):
+        deltas = EntityDeltas()
+
+        self.assertEquals(list(deltas.iter_entities()), [])
+        with self.assertRaises(KeyError):
+            deltas.get_entities_at_time(datetime(2013, 1, 1))
+
+
+class SparseEntityResultsTest(SimpleTestCase):
+    """
+    Tests the SparseEntityResults class.
+    """
+    def setUp(self):
+        self.results = SparseEntityResults()
+        self.results.add(datetime(2013, 1, 1), [1, 2])
+        self.results.add(datetime(2013, 1, 1), [3])
+        self.results.add(datetime(2013, 1, 2), set())
+
+    def test_mapping(self):
+        self.assertEquals(dict(self.results), {datetime(2013, 1, 1): set([1, 2, 3])})
+        self.assertEquals(len(self.results), 1)
+        self.assertNotIn(datetime(2013, 1, 2), self.results)
+
+    def test_get(self):
+        self.assertEquals(self.results.get(datetime(2013, 1, 1)), set([1, 2, 3]))
+        self.assertEquals(self.results.get(datetime(2013, 1, 2)), frozenset())
+        self.assertIsNone(self.results.get(datetime(2013, 1, 2), None))
+
+    def test_get_missing_item(self):
+        with self.assertRaises(KeyError):
+            self.results[datetime(2013, 1, 2)]
@@ -0,0 +1,149 @@
+from datetime import date, datetime, timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+from django_dynamic_fixture import G
+from entity.models import Entity
+
+from entity_history.models import (
+    CHECKPOINT_SETTLE_TIME, EntityActivationEvent, EntityHistory, EntityRelationshipActivationEvent, HistoryRollup,
+    create_history_rollup, get_entities_on_dates, get_sub_entities_on_dates
+)
+from entity_history.sql.intervals import (
+    rebuild_entity_activation_intervals, rebuild_entity_relationship_intervals
+)
+
+
+class HistoryRollupTest(TestCase):
+    """
+    Tests rolling up the days on which entities and relationships were active and looking up the days.
+    """
+    def setUp(self):
+        self.super_e = G(Entity)
+        self.e1 = G(Entity)
+        self.e2 = G(Entity)
+        EntityActivationEvent.objects.all().delete()
+        EntityRelationshipActivationEvent.objects.all().delete()
+
+        G(EntityActivationEvent, was_activated=True, entity=self.e1, time=datetime(2013, 2, 1, 10))
+        G(EntityActivationEvent, was_activated=False, entity=self.e1, time=datetime(2013, 2, 3))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 2, 12))
+        G(EntityActivationEvent, was_activated=False, entity=self.e2, time=datetime(2013, 2, 2, 18))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 1))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e, sub_entity=self.e1,
+            time=datetime(2013, 2, 2, 12))
+        G(
+            EntityRelationshipActivationEvent, was_activated=True, super_entity=self.super_e, sub_entity=self.e2,
+            time=datetime(2013, 2, 3, 12))
+        self.rebuild_intervals()
+
+        self.dates = [date(2013, 2, 1), date(2013, 2, 2), date(2013, 2, 3), date(2013, 2, 4)]
+
+    def rebuild_intervals(self):
+        rebuild_entity_activation_intervals()
+        rebuild_entity_relationship_intervals()
+
+    def test_get_entities_on_dates(self):
+        rollup = create_history_rollup(end_day=date(2013, 2, 4))
+
+        self.assertEquals(rollup.day, date(2013, 2, 4))
+        self.assertEquals(get_entities_on_dates(self.dates), {
+            date(2013, 2, 1): set([self.e1.id]),
+            date(2013, 2, 2): set([self.e1.id, self.e2.id]),
+            date(2013, 2, 3): set([self.e1.id]),
+            date(2013, 2, 4): set(),
+        })
+
+    def test_get_sub_entities_on_dates(self):
+        create_history_rollup(end_day=date(2013, 2, 4))
+
+        self.assertEquals(get_sub_entities_on_dates([self.super_e.id], self.dates), {
+            (self.super_e.id, date(2013, 2, 1)): set([self.e1.id]),
+            (self.super_e.id, date(2013, 2, 2)): set([self.e1.id]),
+            (self.super_e.id, date(2013, 2, 3)): set([self.e2.id]),
+            (self.super_e.id, date(2013, 2, 4)): set([self.e2.id]),
+        })
+
+    def test_get_entities_on_dates_w_filter(self):
+        create_history_rollup(end_day=date(2013, 2, 4))
+
+        self.assertEquals(get_entities_on_dates([date(2013, 2, 2)], filter_by_entity_ids=[self.e2.id]), {
+            date(2013, 2, 2): set([self.e2.id]),
+        })
+        self.assertEquals(
+            get_sub_entities_on_dates([self.super_e.id], [date(2013, 2, 4)], filter_by_entity_ids=[self.e1.id]), {
+                (self.super_e.id, date(2013, 2, 4)): set(),
+            })
+
+    def test_queryset_on_dates(self):
+        create_history_rollup(end_day=date(2013, 2, 4))
+
+        self.assertEquals(EntityHistory.all_objects.filter(id=self.e2.id).get_entities_on_dates([date(2013, 2, 2)]), {
+            date(2013, 2, 2): set([self.e2.id]),
+        })
+
+    def test_rollup_after_latest(self):
+        create_history_rollup(end_day=date(2013, 2, 2))
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 5))
+        self.rebuild_intervals()
+        rollup = create_history_rollup(end_day=date(2013, 2, 5))
+
+        self.assertEquals(rollup.day, date(2013, 2, 5))
+        self.assertEquals(get_entities_on_dates(self.dates + [date(2013, 2, 5)]), {
+            date(2013, 2, 1): set([self.e1.id]),
+            date(2013, 2, 2): set([self.e1.id, self.e2.id]),
+            date(2013, 2, 3): set([self.e1.id]),
+            date(2013, 2, 4): set(),
+            date(2013, 2, 5): set([self.e2.id]),
+        })
+
+    def test_rollup_late_events(self):
+        create_history_rollup(end_day=date(2013, 2, 4))
+
+        # Events that are written after the rollup but happened on days that were rolled up are rolled up again
+        G(EntityActivationEvent, was_activated=True, entity=self.e2, time=datetime(2013, 2, 3, 6))
+        G(
+            EntityRelationshipActivationEvent, was_activated=False, super_entity=self.super_e, sub_entity=self.e2,
+            time=datetime(2013, 2, 4))
+        self.rebuild_intervals()
+        create_history_rollup(end_day=date(2013, 2, 5))
+
+        self.assertEquals(get_entities_on_dates(self.dates), {
+            date(2013, 2, 1): set([self.e1.id]),
+            date(2013, 2, 2): set([self.e1.id, self.e2.id]),
+            date(2013, 2, 3): set([self.e1.id, self.e2.id]),
+            date(2013, 2, 4): set([self.e2.id]),
+        })
+        self.assertEquals(get_sub_entities_on_dates([self.super_e.id], [date(2013, 2, 4), date(2013, 2, 5)]), {
+            (self.super_e.id, date(2013, 2, 4)): set([self.e2.id]),
+            (self.super_e.id, date(2013, 2, 5)): set(),
+        })
+
+    def test_date_not_rolled_up(self):
+        with self.assertRaises(ValueError):
+            get_entities_on_dates([date(2013, 2, 1)])
+
+        create_history_rollup(end_day=date(2013, 2, 4))
+        with self.assertRaises(ValueError):
+            get_sub_entities_on_dates([self.super_e.id], [date(2013, 2, 5)])
+
+    def test_rollup_no_events(self):
+        EntityActivationEvent.objects.all().delete()
+        EntityRelationshipActivationEvent.objects.all().delete()
+        self.rebuild_intervals()
+        create_history_rollup(end_day=date(2013, 2, 4))
+
+        self.assertEquals(get_entities_on_dates([date(2013, 2, 4)]), {date(2013, 2, 4): set()})
+
+    def test_build_history_rollups_command(self):
+        stdout = StringIO()
+        call_command('build_history_rollups', stdout=stdout)
+
+        end_day = (timezone.now() - CHECKPOINT_SETTLE_TIME).date() - timedelta(days=1)
+        self.assertEquals(HistoryRollup.objects.get().day, end_day)
+        self.assertEquals(stdout.getvalue().strip(), 'Rolled up history through {0}'.format(end_day))
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from entity_history.sweep import sweep_states
+
+
+class SweepStatesTest(SimpleTestCase):
+    """
+    Tests the sweep_states function.
+    """
+    def test_no_times(self):
+        self.assertEquals(list(sweep_states([(1, 2, datetime(2013, 1, 1), True)], [])), [])
+
+    def test_no_events(self):
+        res = [(t, dict(state)) for t, state in sweep_states([], [datetime(2013, 1, 1)])]
+        self.assertEquals(res, [(datetime(2013, 1, 1), {})])
+
+    def test_times_are_sorted_and_unique(self):
+        events = [
+            (1, 10, datetime(2013, 1, 1), True),
+            (1, 11, datetime(2013, 1, 2), True),
+            (1, 10, datetime(2013, 1, 3), False),
+        ]
+        res = [
+            (t, {group_id: set(member_ids) for group_id, member_ids in state.items()})
+            for t, state in sweep_states(events, [datetime(2013, 1, 4), datetime(2013, 1, 2), datetime(2013, 1, 2)])
+        ]
+        self.assertEquals(res, [
+            (datetime(2013, 1, 2), {1: set([10])}),
+            (datetime(2013, 1, 4), {1: set([11])}),
+        ])
+
+    def test_events_at_time_are_excluded(self):
+        events = [
+            (1, 10, datetime(2013, 1, 1), True),
+            (2, 10, datetime(2013, 1, 2), True),
+        ]
+        res = [(t, set(state[2])) for t, state in sweep_states(events, [datetime(2013, 1, 2), datetime(2013, 1, 3)])]
+        self.assertEquals(res, [
+            (datetime(2013, 1, 2), set()),
+            (datetime(2013, 1, 3), set([10])),
+        ])
+
+    def test_initial_state(self):
+        events = [
+            (1, 10, datetime(2013, 1, 2), False),
+            (1, 12, datetime(2013, 1, 2), True),
+        ]
+        res = [(t, set(state[1])) for t, state in sweep_states(events, [datetime(2013, 1, 3)], {1: set([10, 11])})]
+        self.assertEquals(res, [(datetime(2013, 1, 3), set([11, 12]))])
+
+    def test_events_are_consumed_lazily(self):
+        events = iter([
+            (1, 10, datetime(2013, 1, 1), True),
+            (1, 11, datetime(2013, 1, 5), True),
+            (1, 12, datetime(2013, 1, 6), True),
+        ])
+        sweep = sweep_states(events, [datetime(2013, 1, 2)])
+        t, state = next(sweep)
+
+        # Only the first event and the event after the time should have been read
+        self.assertEquals(state[1], set([10]))
+        self.assertEquals(list(events), [(1, 12, datetime(2013, 1, 6), True)])
@@ -1,4 +1,7 @@
+from django.core.management import call_command
 from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
 from django_dynamic_fixture import G
 from entity.models import Entity, EntityRelationship
 from mock import patch
@@ -8,7 +11,10 @@ from entity_history.models import EntityActivationEvent, EntityRelationshipActiv
 from entity_history.sql.triggers import (
     EntityActivationTrigger,
     EntityRelationshipActivationTrigger,
-    EntityRelationshipActivationImmediateTrigger
+    EntityActivationStatementTrigger,
+    EntityRelationshipActivationImmediateTrigger,
+    get_trigger_mode,
+    refresh_triggers
 )
 
 
@@ -70,3 +76,82 @@ class EntityRelationshipActivationImmediateTriggerTest(TransactionTestCase):
     def test_disable(self):
         # Enable the trigger
         EntityRelationshipActivationImmediateTrigger().disable()
+
+
+class StatementTriggerTest(TransactionTestCase):
+    """
+    Tests the statement level history triggers.
+    """
+    def setUp(self):
+        with override_settings(ENTITY_HISTORY_TRIGGER_MODE='statement'):
+            refresh_triggers()
+
+    def tearDown(self):
+        refresh_triggers()
+
+    def test_bulk_update_entities(self):
+        e1 = G(Entity, is_active=True)
+        e2 = G(Entity, is_active=True)
+        e3 = G(Entity, is_active=False)
+
+        Entity.all_objects.filter(id__in=[e1.id, e2.id, e3.id]).update(is_active=False)
+
+        self.assertEquals(
+            set(EntityActivationEvent.objects.values_list('entity_id', 'was_activated')),
+            set([(e1.id, True), (e2.id, True), (e3.id, False), (e1.id, False), (e2.id, False)]))
+        self.assertEquals(EntityActivationEvent.objects.filter(entity=e3).count(), 1)
+
+    def test_bulk_create_and_delete_relationships(self):
+        super_e = G(Entity)
+        sub_e1 = G(Entity)
+        sub_e2 = G(Entity)
+
+        EntityRelationship.objects.bulk_create([
+            EntityRelationship(super_entity=super_e, sub_entity=sub_e1),
+            EntityRelationship(super_entity=super_e, sub_entity=sub_e2),
+        ])
+        EntityRelationship.objects.filter(super_entity=super_e).delete()
+
+        self.assertEquals(
+            sorted(EntityRelationshipActivationEvent.objects.values_list('sub_entity_id', 'was_activated')),
+            sorted([(sub_e1.id, True), (sub_e2.id, True), (sub_e1.id, False), (sub_e2.id, False)]))
+
+    def test_relationship_cascade_delete(self):
+        super_e = G(Entity)
+        sub_e1 = G(Entity)
+        sub_e2 = G(Entity)
+        G(EntityRelationship, super_entity=super_e, sub_entity=sub_e1)
+        G(EntityRelationship, super_entity=super_e, sub_entity=sub_e2)
+        G(EntityRelationship, super_entity=sub_e1, sub_entity=sub_e2)
+
+        super_e.delete(force=True)
+
+        self.assertFalse(Entity.all_objects.filter(id=super_e.id).exists())
+        self.assertEquals(
+            list(EntityRelationshipActivationEvent.objects.values_list(
+                'super_entity_id', 'sub_entity_id', 'was_activated')),
+            [(sub_e1.id, sub_e2.id, True)])
+
+    @patch.object(EntityActivationStatementTrigger, 'get_server_version', return_value=90600)
+    def test_enable_old_server_version(self, mock_get_server_version):
+        with self.assertRaises(Exception):
+            EntityActivationStatementTrigger().enable()
+
+
+class TriggerModeTest(TransactionTestCase):
+    """
+    Tests selecting the history triggers with the ENTITY_HISTORY_TRIGGER_MODE setting.
+    """
+    def test_default_trigger_mode(self):
+        self.assertEquals(get_trigger_mode(), 'row')
+
+    @override_settings(ENTITY_HISTORY_TRIGGER_MODE='invalid')
+    def test_invalid_trigger_mode(self):
+        with self.assertRaises(ValueError):
+            get_trigger_mode()
+
+    def test_refresh_history_triggers_command(self):
+        stdout = StringIO()
+        call_command('refresh_history_triggers', stdout=stdout)
+
+        self.assertEquals(stdout.getvalue().strip(), 'Enabled row history triggers')
@@ -44,12 +44,16 @@ setup(
         'django>=1.7',
         'django-entity>=1.12.0',
     ],
+    extras_require={
+        'numpy': ['numpy>=1.8'],
+    },
     tests_require=[
         'psycopg2',
         'django-nose>=1.4',
         'mock>=1.0.1',
         'coverage>=3.7.1',
         'django-dynamic-fixture',
+        'numpy>=1.8',
     ],
     test_suite='run_tests.run_tests',
     include_package_data=True,